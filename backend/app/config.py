@@ -1,4 +1,5 @@
 import os
+from typing import Dict, Optional
 from pydantic_settings import BaseSettings
 from functools import lru_cache
 
@@ -8,9 +9,126 @@ class Settings(BaseSettings):
     GROQ_API_KEY: str
     MODEL_NAME: str = "deepseek-r1-distill-llama-70b"
     MODEL_CHAT_NAME: str =  "llama3-8b-8192"
+    LLM_MAX_CONNECTIONS: int = 100
+    LLM_REQUEST_TIMEOUT: float = 60.0
+
+    # Outbound LLM scheduler: per-model requests/tokens per minute (0 = no limit),
+    # e.g. LLM_MODEL_LIMITS='{"llama3-8b-8192": {"rpm": 30, "tpm": 30000}}'
+    LLM_SCHEDULER_ENABLED: bool = True
+    LLM_RPM_LIMIT: int = 0
+    LLM_TPM_LIMIT: int = 0
+    LLM_MODEL_LIMITS: Dict[str, Dict[str, int]] = {}
+    LLM_RATE_LIMIT_RETRIES: int = 3
+
+    # Per-stage model routing: "small" (MODEL_CHAT_NAME), "large" (MODEL_NAME) or a
+    # model name; stages on a smaller model escalate to MODEL_NAME on invalid output
+    MODEL_ROUTE_DATASET_SELECTION: str = "small"
+    MODEL_ROUTE_RESOURCE_SELECTION: str = "small"
+    MODEL_ROUTE_CLASSIFICATION: str = "small"
+    MODEL_ROUTE_SQL_GENERATION: str = "large"
+    MODEL_ROUTE_RESPONSE: str = "small"
+    MODEL_ESCALATION_ENABLED: bool = True
+
+    # Local QUERY/CHAT classifier in front of the LLM classifier
+    CLASSIFIER_ENABLED: bool = True
+    CLASSIFIER_THRESHOLD: float = 0.85
+    CLASSIFIER_SAMPLES_PATH: Optional[str] = None
+
+    # Conversation history: "memory" (per process) or "sqlite" (shared by workers)
+    CONVERSATION_STORE: str = "memory"
+    CONVERSATION_STORE_PATH: str = "cache/conversations.sqlite3"
+    CONVERSATION_MAX: int = 10_000
+    CONVERSATION_TTL: float = 24 * 3600
+    CONVERSATION_MAX_TURNS: int = 50
+    CONVERSATION_TOKEN_BUDGET: int = 1500
+    CONVERSATION_SUMMARIZE_AFTER: int = 4
+
+    # Compact table encoding of sample and result rows in prompts
+    PROMPT_MAX_CELL_CHARS: int = 80
+    PROMPT_RESPONSE_ROWS: int = 20
+
+    # Results longer than PROMPT_RESPONSE_ROWS are summarised (aggregates, group-bys,
+    # top values over every row) with a small sample instead of being truncated
+    RESULT_SUMMARY_ENABLED: bool = True
+    RESULT_SUMMARY_SAMPLE_ROWS: int = 10
+    # When a result fills its LIMIT, page through the full result (bounded) for the summary
+    RESULT_SUMMARY_FULL_RESULT: bool = True
+    RESULT_SUMMARY_MAX_ROWS: int = 50_000
+
+    # Share of requests whose INFO lines are logged (warnings and errors always are).
+    # LOG_FORMAT=json and ENABLE_FILE_LOGGING are read from the environment at import
+    LOG_SAMPLE_RATE: float = 1.0
+
+    # DataHub (CKAN) HTTP client
+    CKAN_TIMEOUT: float = 10.0
+    CKAN_SQL_TIMEOUT: float = 30.0
+    CKAN_MAX_RETRIES: int = 2
+    CKAN_RETRY_BACKOFF: float = 0.5
+    CKAN_MAX_CONNECTIONS: int = 50
+    CKAN_MAX_KEEPALIVE: int = 20
+    CKAN_SQL_POST_THRESHOLD: int = 1500
+    # Per-action circuit breaker and hedged reads (second request after the p95 latency)
+    CKAN_BREAKER_FAILURES: int = 5
+    CKAN_BREAKER_RESET: float = 30.0
+    CKAN_HEDGE_ENABLED: bool = False
+    CKAN_HEDGE_QUANTILE: float = 0.95
+    CKAN_HEDGE_MAX_RATIO: float = 0.1
+
+    # Startup warm-up behind /ready: model chains, catalog and the schemas of the
+    # WARMUP_HOT_RESOURCES most queried resources; failed steps are retried until WARMUP_TIMEOUT
+    WARMUP_ENABLED: bool = True
+    WARMUP_HOT_RESOURCES: int = 20
+    WARMUP_TIMEOUT: float = 60.0
+    WARMUP_RETRY_INTERVAL: float = 5.0
+
+    # Catalog (package_list) cache
+    CATALOG_TTL: float = 900
+    CATALOG_REFRESH_INTERVAL: float = 600
+
+    # Local dataset retrieval (BM25 shortlist before LLM arbitration)
+    DATASET_SHORTLIST_SIZE: int = 8
+    DATASET_DECISIVE_MIN_SCORE: float = 4.0
+    DATASET_DECISIVE_RATIO: float = 2.0
+
+    # Speculative prefetch of package_show and schemas for the top candidates
+    SPECULATION_ENABLED: bool = True
+    SPECULATIVE_DATASETS: int = 2
+    SPECULATIVE_RESOURCES: int = 3
+
+    # Persistent resource schema/sample cache
+    SCHEMA_CACHE_PATH: str = "cache/schema_cache.sqlite3"
+    SCHEMA_CACHE_MAX_AGE: float = 7 * 24 * 3600
+
+    # Local validation of generated SQL before datastore_search_sql
+    # Rows asked for in generated SQL; explicit LIMITs are capped at SQL_MAX_LIMIT
+    SQL_DEFAULT_LIMIT: int = 100
+    SQL_MAX_LIMIT: int = 1000
+    SQL_REPAIR_ENABLED: bool = True
+
+    # Final answer cache for repeated questions
+    ANSWER_CACHE_SIZE: int = 1024
+    ANSWER_CACHE_TTL: float = 3600
+    # Also match questions that differ only in articles or a trailing "no Recife"
+    ANSWER_CACHE_NEAR_DUPLICATES: bool = False
+
+    # SQL result cache in QueryService
+    SQL_CACHE_MAX_BYTES: int = 64 * 1024 * 1024
+    SQL_CACHE_TTL: float = 1800
+    # Page size of the paginated (streaming) fetch for large results
+    SQL_PAGE_SIZE: int = 5000
+
+    # Local columnar mirror: "remote" always calls datastore_search_sql,
+    # "local" runs SQL on the mirror first and falls back to the remote API
+    QUERY_EXECUTION_MODE: str = "remote"
+    MIRROR_PATH: str = "mirror"
+    MIRROR_MAX_ROWS: int = 500_000
+    MIRROR_PAGE_SIZE: int = 10_000
+    # Sync changed resources into the mirror after every catalog refresh
+    MIRROR_SYNC_ON_REFRESH: bool = True
     
     class Config:
         env_file = ".env"
+        extra = "ignore"
 
 @lru_cache()
 def get_settings():
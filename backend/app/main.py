@@ -1,26 +1,61 @@
+import asyncio
 import os
 import time
 import uuid
 from fastapi import FastAPI, HTTPException, Depends, Request
+from fastapi.responses import JSONResponse, Response, StreamingResponse
 from dotenv import load_dotenv
 from pydantic import BaseModel, Field
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Callable
+from app.config import get_settings
+from app.services.answer_cache import AnswerCache, normalize_question
+from app.services.catalog import CatalogCache
+from app.services.ckan import CKANClient
+from app.services.classifier import MessageClassifier
 from app.services.database import DatabaseService
 from app.services.query import QueryService
 from app.services.llm import LLMService
 from app.services.conversation import ConversationService
+from app.services.conversation_store import ConversationMemory, MemoryConversationStore, SQLiteConversationStore
+from app.services.mirror import ResourceMirror
+from app.services.registry import ModelRegistry
+from app.services.routing import ModelRouter
+from app.services.scheduler import LLMScheduler
+from app.services.sql_validation import SQLValidator
+from app.services.result_cache import SQLResultCache
+from app.services.retrieval import is_decisive
+from app.services.schema_cache import SchemaCache
+from app.services.speculation import StagePrefetcher
 from app.services.agents import AgentFactory
-from app.utils.logger import get_logger, log_time
-import re
+from app.services.warmup import WarmUp
+from app.utils.logger import get_logger, log_time, start_request
+from app.utils.metrics import record_stage, render_metrics
+from app.utils.result_summary import aframe_from_batches, summarize_frame
+from app.utils.singleflight import SingleFlight
+from app.utils.stream import sse_event, strip_think
+from contextlib import asynccontextmanager
 
 logger = get_logger("main")
 
 load_dotenv()
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    catalog_cache.start()
+    warm_up.start()
+    yield
+    await warm_up.stop()
+    await catalog_cache.stop()
+    await ckan_client.aclose()
+    schema_cache.close()
+    conversation_store.close()
+    await model_registry.aclose()
+
 app = FastAPI(
     title="Recife Data API",
     description="API for querying Recife city data using natural language",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
 from fastapi.middleware.cors import CORSMiddleware
@@ -33,12 +68,130 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-database_service = DatabaseService(os.getenv('API_URL'))
-llm_service = LLMService(os.getenv('GROQ_API_KEY'))
-query_service = QueryService(os.getenv('API_URL'))
-conversation_service = ConversationService(os.getenv('GROQ_API_KEY'))
+settings = get_settings()
 
-conversation_history = {}
+ckan_client = CKANClient(
+    os.getenv('API_URL'),
+    timeout=settings.CKAN_TIMEOUT,
+    sql_timeout=settings.CKAN_SQL_TIMEOUT,
+    max_retries=settings.CKAN_MAX_RETRIES,
+    retry_backoff=settings.CKAN_RETRY_BACKOFF,
+    max_connections=settings.CKAN_MAX_CONNECTIONS,
+    max_keepalive=settings.CKAN_MAX_KEEPALIVE,
+    sql_post_threshold=settings.CKAN_SQL_POST_THRESHOLD,
+    breaker_failures=settings.CKAN_BREAKER_FAILURES,
+    breaker_reset=settings.CKAN_BREAKER_RESET,
+    hedge_enabled=settings.CKAN_HEDGE_ENABLED,
+    hedge_quantile=settings.CKAN_HEDGE_QUANTILE,
+    hedge_max_ratio=settings.CKAN_HEDGE_MAX_RATIO
+)
+schema_cache = SchemaCache(settings.SCHEMA_CACHE_PATH, max_age=settings.SCHEMA_CACHE_MAX_AGE)
+database_service = DatabaseService(ckan_client, schema_cache)
+resource_mirror = ResourceMirror(
+    ckan_client,
+    settings.MIRROR_PATH,
+    max_rows=settings.MIRROR_MAX_ROWS,
+    page_size=settings.MIRROR_PAGE_SIZE
+) if settings.QUERY_EXECUTION_MODE == "local" else None
+catalog_cache = CatalogCache(
+    database_service,
+    ttl=settings.CATALOG_TTL,
+    refresh_interval=settings.CATALOG_REFRESH_INTERVAL,
+    mirror=resource_mirror if settings.MIRROR_SYNC_ON_REFRESH else None
+)
+model_registry = ModelRegistry(
+    os.getenv('GROQ_API_KEY'),
+    max_connections=settings.LLM_MAX_CONNECTIONS,
+    request_timeout=settings.LLM_REQUEST_TIMEOUT,
+    scheduler=LLMScheduler(
+        default_rpm=settings.LLM_RPM_LIMIT,
+        default_tpm=settings.LLM_TPM_LIMIT,
+        limits=settings.LLM_MODEL_LIMITS,
+        max_retries=settings.LLM_RATE_LIMIT_RETRIES
+    ) if settings.LLM_SCHEDULER_ENABLED else None
+)
+model_router = ModelRouter(
+    settings.MODEL_CHAT_NAME,
+    settings.MODEL_NAME,
+    routes={
+        "dataset_selection": settings.MODEL_ROUTE_DATASET_SELECTION,
+        "resource_selection": settings.MODEL_ROUTE_RESOURCE_SELECTION,
+        "classification": settings.MODEL_ROUTE_CLASSIFICATION,
+        "sql_generation": settings.MODEL_ROUTE_SQL_GENERATION,
+        "response": settings.MODEL_ROUTE_RESPONSE,
+    },
+    escalation=settings.MODEL_ESCALATION_ENABLED
+)
+llm_service = LLMService(
+    model_registry,
+    schema_cache,
+    max_cell_chars=settings.PROMPT_MAX_CELL_CHARS,
+    response_rows=settings.PROMPT_RESPONSE_ROWS,
+    router=model_router,
+    sql_validator=SQLValidator(max_limit=settings.SQL_MAX_LIMIT, default_limit=settings.SQL_DEFAULT_LIMIT),
+    sql_repair=settings.SQL_REPAIR_ENABLED,
+    summarize_results=settings.RESULT_SUMMARY_ENABLED,
+    summary_sample_rows=settings.RESULT_SUMMARY_SAMPLE_ROWS
+)
+query_service = QueryService(
+    ckan_client,
+    SQLResultCache(max_bytes=settings.SQL_CACHE_MAX_BYTES, ttl=settings.SQL_CACHE_TTL),
+    mirror=resource_mirror,
+    execution_mode=settings.QUERY_EXECUTION_MODE,
+    page_size=settings.SQL_PAGE_SIZE,
+    default_limit=llm_service.sql_validator.default_limit
+)
+conversation_service = ConversationService(
+    model_registry,
+    fast_classifier=MessageClassifier.load(
+        settings.CLASSIFIER_SAMPLES_PATH,
+        threshold=settings.CLASSIFIER_THRESHOLD
+    ) if settings.CLASSIFIER_ENABLED else None,
+    router=model_router
+)
+answer_cache = AnswerCache(
+    maxsize=settings.ANSWER_CACHE_SIZE,
+    ttl=settings.ANSWER_CACHE_TTL,
+    near_duplicates=settings.ANSWER_CACHE_NEAR_DUPLICATES,
+    version_lookup=catalog_cache.resource_version
+)
+
+warm_up = WarmUp(
+    catalog_cache,
+    database_service,
+    schema_cache,
+    warmers=[
+        llm_service.warm_up,
+        conversation_service.warm_up,
+        lambda: AgentFactory.warm_up(model_registry, settings.MODEL_CHAT_NAME)
+    ],
+    hot_resources=settings.WARMUP_HOT_RESOURCES,
+    timeout=settings.WARMUP_TIMEOUT,
+    enabled=settings.WARMUP_ENABLED,
+    retry_interval=settings.WARMUP_RETRY_INTERVAL
+)
+
+# Identical questions arriving together (e.g. a viral question) share one pipeline run
+question_flights = SingleFlight("question")
+
+if settings.CONVERSATION_STORE == "sqlite":
+    conversation_store = SQLiteConversationStore(
+        settings.CONVERSATION_STORE_PATH,
+        ttl=settings.CONVERSATION_TTL,
+        max_turns=settings.CONVERSATION_MAX_TURNS
+    )
+else:
+    conversation_store = MemoryConversationStore(
+        maxsize=settings.CONVERSATION_MAX,
+        ttl=settings.CONVERSATION_TTL,
+        max_turns=settings.CONVERSATION_MAX_TURNS
+    )
+conversation_memory = ConversationMemory(
+    conversation_store,
+    token_budget=settings.CONVERSATION_TOKEN_BUDGET,
+    summarize_after=settings.CONVERSATION_SUMMARIZE_AFTER,
+    summarizer=conversation_service.asummarize
+)
 
 class QueryRequest(BaseModel):
     query: str
@@ -65,143 +218,293 @@ class ChatResponse(BaseModel):
 def read_root():
     return {"status": "active", "message": "Recife Data API is running"}
 
+@app.get("/ready")
+def ready():
+    # Liveness stays on "/"; load balancers should only route here once warm
+    return JSONResponse(warm_up.status(), status_code=200 if warm_up.ready else 503)
+
+@app.get("/metrics")
+def metrics():
+    payload, content_type = render_metrics()
+    return Response(payload, media_type=content_type)
+
 @app.get("/datasets")
-def get_datasets():
-    datasets = database_service.get_database_list()
+async def get_datasets():
+    datasets = await catalog_cache.aget_database_list()
     if not datasets:
         raise HTTPException(status_code=404, detail="No datasets found")
     return {"datasets": datasets}
 
+def prefetch_dataset(prefetch: StagePrefetcher, dataset_name: str):
+    """Start package_show for a candidate dataset and, as soon as it lands,
+    the schema and samples of its first datastore resources."""
+    async def fetch_resources():
+        resource_info = await database_service.aget_resource_list(dataset_name)
+        resources = [r for r in (resource_info or {}).get('resources', []) if r.get('datastore_active')]
+        for resource in resources[:settings.SPECULATIVE_RESOURCES]:
+            prefetch.start(
+                f"metadata:{resource['id']}",
+                database_service.aget_metadata_from_resource_id,
+                resource['id'],
+                resource.get('last_modified') or resource.get('metadata_modified'),
+                group=dataset_name
+            )
+        return resource_info
+
+    prefetch.start(f"resources:{dataset_name}", fetch_resources, group=dataset_name)
+
+async def prefetch_candidates(prefetch: StagePrefetcher, query: str) -> List[Dict[str, Any]]:
+    candidates = await catalog_cache.asearch(query, settings.DATASET_SHORTLIST_SIZE)
+    for candidate in candidates[:settings.SPECULATIVE_DATASETS]:
+        prefetch_dataset(prefetch, candidate["name"])
+    return candidates
+
+async def select_dataset(request_id: str, query: str, prefetch: StagePrefetcher) -> Dict[str, Any]:
+    # Prefetching the top candidates overlaps package_show and schema calls with LLM arbitration
+    candidates = await prefetch.get("shortlist", prefetch_candidates, prefetch, query)
+    if not candidates:
+        logger.info("[ID: %s] No local dataset candidates, asking LLM over the full catalog", request_id)
+        return await llm_service.afind_relevant_dataset(query, await catalog_cache.aget_database_list())
+
+    if is_decisive(candidates, settings.DATASET_DECISIVE_MIN_SCORE, settings.DATASET_DECISIVE_RATIO):
+        logger.info("[ID: %s] Local index is decisive for %s (score %s)", request_id, candidates[0]['name'], candidates[0]['score'])
+        return {"selected_dataset": candidates[0]["name"]}
+
+    logger.info("[ID: %s] Asking LLM to arbitrate among %s local candidates", request_id, len(candidates))
+    shortlist = [{k: c[k] for k in ("name", "title", "description")} for c in candidates]
+    return await llm_service.afind_relevant_dataset(query, shortlist)
+
+async def run_query_pipeline(request_id: str, query: str,
+                             on_stage: Optional[Callable[[str, Dict[str, Any]], None]] = None,
+                             prefetch: Optional[StagePrefetcher] = None) -> Dict[str, Any]:
+    """Steps 1-5 of a data query: dataset, resource, metadata, SQL and rows.
+
+    ``on_stage`` is called as each step completes so streaming callers can
+    report progress before the answer is generated. ``prefetch`` carries
+    speculative work started before the pipeline (e.g. during classification);
+    whatever is still pending when the pipeline ends is cancelled.
+    """
+    def emit(stage: str, **payload):
+        if on_stage is not None:
+            on_stage(stage, payload)
+
+    async with prefetch or StagePrefetcher(request_id, settings.SPECULATION_ENABLED) as prefetch:
+        logger.info("[ID: %s] Step 1: Finding relevant dataset", request_id)
+        start_time = time.perf_counter()
+        dataset_result = await select_dataset(request_id, query, prefetch)
+        elapsed = record_stage("dataset_selection", start_time)
+        logger.info("[ID: %s] Dataset selection completed in %.2fs", request_id, elapsed)
+    
+        if "error" in dataset_result:
+            logger.error("[ID: %s] Dataset selection error: %s", request_id, dataset_result['error'])
+            raise HTTPException(status_code=400, detail=dataset_result["error"])
+    
+        selected_dataset = dataset_result.get("selected_dataset")
+        logger.info("[ID: %s] Selected dataset: %s", request_id, selected_dataset)
+        emit("dataset", dataset=selected_dataset)
+        prefetch.cancel(keep_group=selected_dataset)
+    
+        logger.info("[ID: %s] Step 2: Finding relevant resource", request_id)
+        start_time = time.perf_counter()
+        resource_result = await llm_service.afind_relevant_resource_id(
+            query, 
+            dataset_result, 
+            lambda name: prefetch.get(f"resources:{name}", database_service.aget_resource_list, name)
+        )
+        elapsed = record_stage("resource_selection", start_time)
+        logger.info("[ID: %s] Resource selection completed in %.2fs", request_id, elapsed)
+    
+        if "error" in resource_result:
+            logger.error("[ID: %s] Resource selection error: %s", request_id, resource_result['error'])
+            raise HTTPException(status_code=400, detail=resource_result["error"])
+    
+        resource_id = resource_result["resource_id"]
+        resource_name = resource_result.get("resource_name", "Desconhecido")
+        resource_version = resource_result.get("resource_version")
+        logger.info("[ID: %s] Selected resource: %s (ID: %s)", request_id, resource_name, resource_id)
+        emit("resource", resource=resource_name, resource_id=resource_id)
+    
+        logger.info("[ID: %s] Step 3: Fetching resource metadata", request_id)
+        schema_cache.record_use(resource_id)
+        start_time = time.perf_counter()
+        metadata = await prefetch.get(
+            f"metadata:{resource_id}",
+            database_service.aget_metadata_from_resource_id,
+            resource_id,
+            resource_version
+        )
+        elapsed = record_stage("metadata_fetch", start_time)
+        field_count = len(metadata.get("resultados_campos", []))
+        sample_count = len(metadata.get("resultados_exemplos", []))
+        logger.info("[ID: %s] Metadata fetched in %.2fs with %s fields and %s samples", request_id, elapsed, field_count, sample_count)
+    
+        logger.info("[ID: %s] Step 4: Generating SQL query", request_id)
+        start_time = time.perf_counter()
+        sql_query = await llm_service.agenerate_sql_query(query, resource_id, metadata)
+        elapsed = record_stage("sql_generation", start_time)
+        logger.info("[ID: %s] SQL generation completed in %.2fs", request_id, elapsed)
+        logger.debug("[ID: %s] Generated SQL: %s", request_id, sql_query)
+        emit("sql", sql_query=sql_query)
+    
+        logger.info("[ID: %s] Step 5: Executing SQL query", request_id)
+        start_time = time.perf_counter()
+        data = await query_service.aexecute_sql_on_resource_id(sql_query, resource_version)
+        elapsed = record_stage("sql_execution", start_time)
+        logger.info("[ID: %s] Query execution completed in %.2fs with %s results", request_id, elapsed, len(data))
+        emit("rows", row_count=len(data))
+
+        summary = None
+        if settings.RESULT_SUMMARY_FULL_RESULT and llm_service.needs_summary(data) \
+                and query_service.has_more_rows(sql_query, data):
+            summary = await summarize_full_result(request_id, sql_query, resource_version)
+    
+        return {
+            "dataset": selected_dataset,
+            "resource": resource_name,
+            "resource_id": resource_id,
+            "resource_version": resource_version,
+            "sql_query": sql_query,
+            "data": data,
+            "summary": summary
+        }
+
+async def summarize_full_result(request_id: str, sql_query: str, resource_version: Optional[str]) -> Optional[str]:
+    """Page through every row of the query (up to RESULT_SUMMARY_MAX_ROWS) into a columnar frame and summarise it."""
+    logger.info("[ID: %s] Result filled the default LIMIT, summarising the full result", request_id)
+    start_time = time.perf_counter()
+    try:
+        frame = await aframe_from_batches(query_service.aiter_sql_batches(
+            sql_query, max_rows=settings.RESULT_SUMMARY_MAX_ROWS, resource_version=resource_version, full_result=True
+        ))
+        summary = await asyncio.to_thread(summarize_frame, frame)
+    except Exception as e:
+        # The answer falls back to the summary of the rows already fetched
+        logger.warning("[ID: %s] Full result summary failed: %s", request_id, e)
+        return None
+    elapsed = record_stage("result_summary", start_time)
+    logger.info("[ID: %s] Summarised %s rows in %.2fs", request_id, len(frame), elapsed)
+    if len(frame) >= settings.RESULT_SUMMARY_MAX_ROWS:
+        summary += f"\n(resumo limitado às primeiras {len(frame)} linhas)"
+    return summary
+
+def build_query_response(query: str, answer: str, result: Dict[str, Any]) -> QueryResponse:
+    query_response = QueryResponse(
+        answer=answer,
+        dataset=result["dataset"],
+        resource=result["resource"],
+        sql_query=result["sql_query"],
+        data=result["data"][:10]
+    )
+    if result["data"]:
+        answer_cache.put(query, query_response, result["resource_id"], result["resource_version"])
+    return query_response
+
 @app.post("/query", response_model=QueryResponse)
 @log_time(logger)
-def process_query(request: QueryRequest):
+async def process_query(request: QueryRequest):
     query = request.query
     request_id = str(uuid.uuid4())[:8]
+    start_request(request_id, settings.LOG_SAMPLE_RATE)
     
-    logger.info(f"[ID: {request_id}] Processing query request: '{query[:50]}...'")
+    logger.info("[ID: %s] Processing query request: '%s...'", request_id, query[:50])
     
-    def clean_output(text):
-        return re.sub(r'<think>.*?</think>', '', text, flags=re.DOTALL).strip()
+    return await answer_query(request_id, query)
+
+async def answer_query(request_id: str, query: str, prefetch: Optional[StagePrefetcher] = None,
+                       on_stage: Optional[Callable[[str, Dict[str, Any]], None]] = None,
+                       on_token: Optional[Callable[[str], None]] = None) -> QueryResponse:
+    """Answer from the cache or the in-flight computation of the same question, else compute it.
+
+    ``on_stage`` and ``on_token`` only fire when this request leads the
+    computation; a request joining another one gets the finished response.
+    """
+    cached_response = answer_cache.get(query)
+    if cached_response is not None:
+        logger.info("[ID: %s] Answer cache hit", request_id)
+        if prefetch is not None:
+            prefetch.cancel()
+        if on_stage is not None:
+            on_stage("cache", {"dataset": cached_response.dataset, "resource": cached_response.resource})
+        return cached_response
     
-    logger.info(f"[ID: {request_id}] Step 1: Finding relevant dataset")
-    start_time = time.time()
-    dataset_result = llm_service.find_relevant_dataset(
-        query, 
-        database_service.get_database_list()
-    )
-    elapsed = time.time() - start_time
-    logger.info(f"[ID: {request_id}] Dataset selection completed in {elapsed:.2f}s")
-    
-    if "error" in dataset_result:
-        logger.error(f"[ID: {request_id}] Dataset selection error: {dataset_result['error']}")
-        raise HTTPException(status_code=400, detail=dataset_result["error"])
-    
-    selected_dataset = dataset_result.get("selected_dataset")
-    logger.info(f"[ID: {request_id}] Selected dataset: {selected_dataset}")
-    
-    logger.info(f"[ID: {request_id}] Step 2: Finding relevant resource")
-    start_time = time.time()
-    resource_result = llm_service.find_relevant_resource_id(
-        query, 
-        dataset_result, 
-        lambda name: database_service.get_resource_list(name)
-    )
-    elapsed = time.time() - start_time
-    logger.info(f"[ID: {request_id}] Resource selection completed in {elapsed:.2f}s")
-    
-    if "error" in resource_result:
-        logger.error(f"[ID: {request_id}] Resource selection error: {resource_result['error']}")
-        raise HTTPException(status_code=400, detail=resource_result["error"])
-    
-    resource_id = resource_result["resource_id"]
-    resource_name = resource_result.get("resource_name", "Desconhecido")
-    logger.info(f"[ID: {request_id}] Selected resource: {resource_name} (ID: {resource_id})")
-    
-    logger.info(f"[ID: {request_id}] Step 3: Fetching resource metadata")
-    start_time = time.time()
-    metadata = database_service.get_metadata_from_resource_id(resource_id)
-    elapsed = time.time() - start_time
-    field_count = len(metadata.get("resultados_campos", []))
-    sample_count = len(metadata.get("resultados_exemplos", []))
-    logger.info(f"[ID: {request_id}] Metadata fetched in {elapsed:.2f}s with {field_count} fields and {sample_count} samples")
-    
-    logger.info(f"[ID: {request_id}] Step 4: Generating SQL query")
-    start_time = time.time()
-    sql_query = llm_service.generate_sql_query(query, resource_id, metadata)
-    elapsed = time.time() - start_time
-    logger.info(f"[ID: {request_id}] SQL generation completed in {elapsed:.2f}s")
-    logger.debug(f"[ID: {request_id}] Generated SQL: {sql_query}")
-    
-    logger.info(f"[ID: {request_id}] Step 5: Executing SQL query")
-    start_time = time.time()
-    data = query_service.execute_sql_on_resource_id(sql_query)
-    elapsed = time.time() - start_time
-    logger.info(f"[ID: {request_id}] Query execution completed in {elapsed:.2f}s with {len(data)} results")
-    
-    logger.info(f"[ID: {request_id}] Step 6: Generating natural language response")
-    start_time = time.time()
-    response = llm_service.generate_response(query, data)
-    elapsed = time.time() - start_time
-    logger.info(f"[ID: {request_id}] Response generation completed in {elapsed:.2f}s")
-    
-    response = clean_output(response)
-    logger.info(f"[ID: {request_id}] Query processing completed successfully")
-    
-    return QueryResponse(
-        answer=response,
-        dataset=selected_dataset,
-        resource=resource_name,
-        sql_query=sql_query,
-        data=data[:10]
-    )
+    try:
+        return await question_flights.do(
+            normalize_question(query), compute_query_response, request_id, query, prefetch, on_stage, on_token
+        )
+    finally:
+        # Only used if this request led the flight; release it either way
+        if prefetch is not None:
+            prefetch.cancel()
+
+async def compute_query_response(request_id: str, query: str, prefetch: Optional[StagePrefetcher],
+                                 on_stage: Optional[Callable[[str, Dict[str, Any]], None]] = None,
+                                 on_token: Optional[Callable[[str], None]] = None) -> QueryResponse:
+    result = await run_query_pipeline(request_id, query, on_stage, prefetch)
+    
+    logger.info("[ID: %s] Step 6: Generating natural language response", request_id)
+    start_time = time.perf_counter()
+    if on_token is None:
+        response = await llm_service.agenerate_response(query, result["data"], result.get("summary"))
+    else:
+        chunks = []
+        async for text in llm_service.astream_response(query, result["data"], result.get("summary")):
+            chunks.append(text)
+            on_token(text)
+        response = "".join(chunks)
+    elapsed = record_stage("response_generation", start_time)
+    logger.info("[ID: %s] Response generation completed in %.2fs", request_id, elapsed)
+    
+    response = strip_think(response)
+    logger.info("[ID: %s] Query processing completed successfully", request_id)
+    
+    return build_query_response(query, response, result)
 
 @app.post("/message", response_model=ChatResponse)
-def process_message(request: ChatRequest):
+async def process_message(request: ChatRequest):
     message = request.message
-    conversation_id = request.conversation_id or f"conv_{len(conversation_history) + 1}"
+    conversation_id = request.conversation_id or f"conv_{uuid.uuid4().hex[:12]}"
     agent_type = request.tipo_agente.upper() if request.tipo_agente else "GERAL"
     request_id = str(uuid.uuid4())[:8]
+    start_request(request_id, settings.LOG_SAMPLE_RATE)
     
-    logger.info(f"[ID: {request_id}] Processing message request: '{message[:50]}...' with agent: {agent_type}")
-    
-    # Initialize or retrieve conversation history
-    # if conversation_id not in conversation_history:
-    #    logger.info(f"[ID: {request_id}] Creating new conversation with ID: {conversation_id}")
-    #    conversation_history[conversation_id] = []
-    #else:
-    #    logger.info(f"[ID: {request_id}] Appending to existing conversation ID: {conversation_id} with {len(conversation_history[conversation_id])} messages")
+    logger.info("[ID: %s] Processing message request: '%s...' with agent: %s", request_id, message[:50], agent_type)
     
-    # conversation_history[conversation_id].append({"user": message})
+    conversation_history = conversation_memory.context(conversation_id)
+    logger.info("[ID: %s] Conversation %s has %s entries in context", request_id, conversation_id, len(conversation_history))
     
     is_data_query = False
+    prefetch = StagePrefetcher(request_id, settings.SPECULATION_ENABLED)
     if agent_type == "GERAL":
-        logger.info(f"[ID: {request_id}] Classifying message for GERAL agent")
-        start_time = time.time()
-        classification = conversation_service.classify_message(message)
-        elapsed = time.time() - start_time
+        logger.info("[ID: %s] Classifying message for GERAL agent", request_id)
+        # Dataset retrieval doesn't depend on the classification, so it starts speculatively
+        prefetch.start("shortlist", prefetch_candidates, prefetch, message)
+        start_time = time.perf_counter()
+        classification = await conversation_service.aclassify_message(message)
+        elapsed = record_stage("classification", start_time)
         
         is_data_query = classification.get("is_query", False)
-        logger.info(f"[ID: {request_id}] Message classified in {elapsed:.2f}s as data query: {is_data_query}")
+        logger.info("[ID: %s] Message classified by %s in %.2fs as data query: %s", request_id, classification.get('source', 'llm'), elapsed, is_data_query)
+        if not is_data_query:
+            prefetch.cancel()
     
-    logger.info(f"[ID: {request_id}] Creating agent for type: {agent_type}")
+    logger.info("[ID: %s] Creating agent for type: %s", request_id, agent_type)
     agent = AgentFactory.create_agent(
         domain=agent_type,
-        groq_api_key=os.getenv('GROQ_API_KEY'),
-        model_name=os.getenv('MODEL_CHAT_NAME', "llama3-8b-8192")
+        registry=model_registry,
+        model_name=settings.MODEL_CHAT_NAME
     )
     
     if is_data_query:
-        logger.info(f"[ID: {request_id}] Processing as data query")
+        logger.info("[ID: %s] Processing as data query", request_id)
         try:
-            query_request = QueryRequest(query=message)
-            start_time = time.time()
-            query_response = process_query(query_request)
-            elapsed = time.time() - start_time
+            start_time = time.perf_counter()
+            query_response = await answer_query(request_id, message, prefetch)
+            elapsed = time.perf_counter() - start_time
             
             answer = query_response.answer
-            logger.info(f"[ID: {request_id}] Data query processed successfully in {elapsed:.2f}s")
+            logger.info("[ID: %s] Data query processed successfully in %.2fs", request_id, elapsed)
             
-            # conversation_history[conversation_id].append({"assistant": answer})
+            conversation_memory.record(conversation_id, message, answer)
             
             return ChatResponse(
                 answer=answer,
@@ -210,18 +513,18 @@ def process_message(request: ChatRequest):
                 agent_type=agent_type
             )
         except Exception as e:
-            logger.exception(f"[ID: {request_id}] Data query processing failed: {str(e)}")
-            logger.info(f"[ID: {request_id}] Falling back to agent processing")
+            logger.exception("[ID: %s] Data query processing failed: %s", request_id, e)
+            logger.info("[ID: %s] Falling back to agent processing", request_id)
             pass
     
-    logger.info(f"[ID: {request_id}] Processing with {agent_type} agent")
+    logger.info("[ID: %s] Processing with %s agent", request_id, agent_type)
     try:
-        start_time = time.time()
-        answer = agent.process_query(message, conversation_history)
-        elapsed = time.time() - start_time
+        start_time = time.perf_counter()
+        answer = await agent.aprocess_query(message, conversation_history)
+        elapsed = record_stage("agent_response", start_time)
         
-        logger.info(f"[ID: {request_id}] Agent processing completed in {elapsed:.2f}s")
-        # conversation_history[conversation_id].append({"assistant": answer})
+        logger.info("[ID: %s] Agent processing completed in %.2fs", request_id, elapsed)
+        conversation_memory.record(conversation_id, message, answer)
         
         return ChatResponse(
             answer=answer,
@@ -230,22 +533,136 @@ def process_message(request: ChatRequest):
             agent_type=agent_type
         )
     except Exception as e:
-        logger.exception(f"[ID: {request_id}] Agent processing failed: {str(e)}")
-        logger.info(f"[ID: {request_id}] Falling back to general conversation handler")
+        logger.exception("[ID: %s] Agent processing failed: %s", request_id, e)
+        logger.info("[ID: %s] Falling back to general conversation handler", request_id)
         
-        start_time = time.time()
-        answer = conversation_service.handle_conversation(
+        start_time = time.perf_counter()
+        answer = await conversation_service.ahandle_conversation(
             message, 
             conversation_history
         )
-        elapsed = time.time() - start_time
+        elapsed = time.perf_counter() - start_time
         
-        logger.info(f"[ID: {request_id}] Fallback processing completed in {elapsed:.2f}s")
-        # conversation_history[conversation_id].append({"assistant": answer})
+        logger.info("[ID: %s] Fallback processing completed in %.2fs", request_id, elapsed)
+        conversation_memory.record(conversation_id, message, answer)
         
         return ChatResponse(
             answer=answer,
             conversation_id=conversation_id,
             is_data_query=False,
             agent_type="GERAL"
-        )
\ No newline at end of file
+        )
+
+@app.post("/message/stream")
+async def stream_message(request: ChatRequest):
+    """Server-sent events variant of /message.
+
+    Emits ``start``, ``classification`` and one ``stage`` event per completed
+    pipeline step, then ``token`` events with the answer as it is generated
+    and a final ``done`` event carrying the full answer. Answers from the
+    cache or from an identical question already in flight arrive as a
+    single ``token`` event.
+    """
+    return StreamingResponse(
+        message_events(request),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+async def message_events(request: ChatRequest):
+    message = request.message
+    conversation_id = request.conversation_id or f"conv_{uuid.uuid4().hex[:12]}"
+    agent_type = request.tipo_agente.upper() if request.tipo_agente else "GERAL"
+    request_id = str(uuid.uuid4())[:8]
+    start_request(request_id, settings.LOG_SAMPLE_RATE)
+
+    logger.info("[ID: %s] Streaming message request: '%s...' with agent: %s", request_id, message[:50], agent_type)
+    yield sse_event("start", {"conversation_id": conversation_id, "agent_type": agent_type})
+    conversation_history = conversation_memory.context(conversation_id)
+
+    is_data_query = False
+    prefetch = StagePrefetcher(request_id, settings.SPECULATION_ENABLED)
+    if agent_type == "GERAL":
+        prefetch.start("shortlist", prefetch_candidates, prefetch, message)
+        start_time = time.perf_counter()
+        classification = await conversation_service.aclassify_message(message)
+        record_stage("classification", start_time)
+        is_data_query = classification.get("is_query", False)
+        yield sse_event("classification", {"is_data_query": is_data_query})
+        if not is_data_query:
+            prefetch.cancel()
+
+    if is_data_query:
+        try:
+            async for event in stream_data_query(request_id, message, conversation_id, agent_type, prefetch):
+                yield event
+            return
+        except Exception as e:
+            logger.exception("[ID: %s] Streaming data query failed: %s", request_id, e)
+            logger.info("[ID: %s] Falling back to agent processing", request_id)
+            yield sse_event("stage", {"stage": "fallback"})
+
+    chunks = []
+    try:
+        agent = AgentFactory.create_agent(
+            domain=agent_type,
+            registry=model_registry,
+            model_name=settings.MODEL_CHAT_NAME
+        )
+        async for text in agent.astream_query(message, conversation_history):
+            chunks.append(text)
+            yield sse_event("token", {"text": text})
+    except Exception as e:
+        logger.exception("[ID: %s] Agent streaming failed: %s", request_id, e)
+        # Tokens already sent can't be taken back; the answer ends where the agent stopped
+        if not chunks:
+            logger.info("[ID: %s] Falling back to general conversation handler", request_id)
+            agent_type = "GERAL"
+            chunks.append(await conversation_service.ahandle_conversation(message, conversation_history))
+            yield sse_event("token", {"text": chunks[0]})
+
+    answer = "".join(chunks).strip()
+    conversation_memory.record(conversation_id, message, answer)
+    yield sse_event("done", {
+        "answer": answer,
+        "conversation_id": conversation_id,
+        "is_data_query": False,
+        "agent_type": agent_type
+    })
+
+async def stream_data_query(request_id: str, message: str, conversation_id: str, agent_type: str,
+                            prefetch: Optional[StagePrefetcher] = None):
+    # Same cache and question coalescing as /message; stage and token events come from the
+    # computation this request leads and are relayed as they arrive
+    events = asyncio.Queue()
+    answer = asyncio.create_task(answer_query(
+        request_id, message, prefetch,
+        on_stage=lambda stage, payload: events.put_nowait(("stage", dict(payload, stage=stage))),
+        on_token=lambda text: events.put_nowait(("token", {"text": text}))
+    ))
+    streamed = False
+    try:
+        while not answer.done() or not events.empty():
+            getter = asyncio.ensure_future(events.get())
+            await asyncio.wait({getter, answer}, return_when=asyncio.FIRST_COMPLETED)
+            if getter.done():
+                event, payload = getter.result()
+                streamed = streamed or event == "token"
+                yield sse_event(event, payload)
+            else:
+                getter.cancel()
+        query_response = answer.result()
+    finally:
+        if not answer.done():
+            answer.cancel()
+
+    if not streamed:
+        # Served by the answer cache or by another request computing the same question
+        yield sse_event("token", {"text": query_response.answer})
+    conversation_memory.record(conversation_id, message, query_response.answer)
+    yield sse_event("done", {
+        "answer": query_response.answer,
+        "conversation_id": conversation_id,
+        "is_data_query": True,
+        "agent_type": agent_type
+    })
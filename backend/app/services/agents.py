@@ -1,9 +1,10 @@
 # app/services/agents.py
-from typing import Dict, Any, List, Optional
-from langchain_groq import ChatGroq
-from langchain.prompts import ChatPromptTemplate
-from langchain.schema.output_parser import StrOutputParser
+from typing import Dict, Any, List, Optional, AsyncIterator, Tuple
+from langchain.prompts import ChatPromptTemplate, MessagesPlaceholder
+from app.services.conversation_store import history_messages
+from app.services.registry import ModelRegistry
 from app.utils.logger import get_logger, log_time
+from app.utils.stream import ThinkStripper
 import re
 import time
 import uuid
@@ -12,26 +13,7 @@ import uuid
 logger = get_logger("agents")
 
 class BaseAgent:
-    def __init__(self, groq_api_key: str, model_name: str = "llama3-8b-8192"):
-        self.groq_api_key = groq_api_key
-        self.model_name = model_name
-        logger.info(f"BaseAgent initialized with model: {model_name}")
-        
-    def _create_chain(self, system_prompt: str, temperature: float = 0.7):
-        model = ChatGroq(api_key=self.groq_api_key, model_name=self.model_name, temperature=temperature)
-        return model, StrOutputParser()
-    
-    def _clean_output(self, text: str) -> str:
-        return re.sub(r'<think>.*?</think>', '', text, flags=re.DOTALL).strip()
-    
-    @log_time(logger)
-    def process_query(self, query: str, conversation_history: Optional[List] = None) -> str:
-        # Default implementation that uses the same logic as ConversationService
-        
-        request_id = str(uuid.uuid4())[:8]
-        logger.info(f"[ID: {request_id}] Processing query with BaseAgent: '{query[:50]}...'")
-        
-        system_prompt = """
+    system_prompt = """
         Você é um assistente virtual para a cidade do Recife.
 
         SOBRE VOCÊ:
@@ -45,290 +27,218 @@ class BaseAgent:
         - Explique que você pode consultar dados como estatísticas, serviços públicos, equipamentos urbanos, etc.
         - Não invente dados que não possui
         """
-        
-        messages = [("system", system_prompt)]
-        
-        conv_length = 0
-        #for entry in conversation_history[-5:]:
-        #    if "user" in entry:
-        #        messages.append(("human", entry["user"]))
-        #        conv_length += 1
-        #    if "assistant" in entry:
-        #        messages.append(("assistant", entry["assistant"]))
-        
-        logger.info(f"[ID: {request_id}] Using {conv_length} previous messages in conversation context")
-        messages.append(("human", query))
-        
-        chat_template = ChatPromptTemplate.from_messages(messages)
-        model, parser = self._create_chain(system_prompt)
-        chain = chat_template | model | parser
-        
+    error_message = "Desculpe, estou tendo dificuldades para processar sua mensagem. Como posso ajudá-lo com informações sobre o Recife?"
+
+    temperature = 0.7
+
+    def __init__(self, registry: ModelRegistry, model_name: str = "llama3-8b-8192"):
+        self.registry = registry
+        self.model_name = model_name
+        logger.info("BaseAgent initialized with model: %s", model_name)
+
+    @classmethod
+    def _prompt(cls) -> ChatPromptTemplate:
+        # Built once per agent class; history and the query are template inputs
+        if "_prompt_template" not in cls.__dict__:
+            cls._prompt_template = ChatPromptTemplate.from_messages([
+                ("system", cls.system_prompt),
+                MessagesPlaceholder("history"),
+                ("human", "{query}")
+            ])
+        return cls._prompt_template
+
+    def _clean_output(self, text: str) -> str:
+        return re.sub(r'<think>.*?</think>', '', text, flags=re.DOTALL).strip()
+
+    def chain(self):
+        return self.registry.chain(
+            f"agent.{self.__class__.__name__}.{self.model_name}", self._prompt(), self.model_name, self.temperature,
+            "chat"
+        )
+
+    def _build_chain(self, request_id: str, query: str,
+                     conversation_history: Optional[List] = None) -> Tuple[Any, Dict[str, Any]]:
+        # The history is already fitted to the token budget by ConversationMemory
+        history = history_messages(conversation_history)
+        conv_length = sum(1 for role, _ in history if role == "human")
+
+        logger.info("[ID: %s] Using %s previous messages in conversation context", request_id, conv_length)
+
+        return self.chain(), {"history": history, "query": query}
+
+    @log_time(logger)
+    async def aprocess_query(self, query: str, conversation_history: Optional[List] = None) -> str:
+        agent_name = self.__class__.__name__
+        request_id = str(uuid.uuid4())[:8]
+        logger.info("[ID: %s] Processing query with %s: '%s...'", request_id, agent_name, query[:50])
+
+        chain, inputs = self._build_chain(request_id, query, conversation_history)
+
         try:
-            logger.info(f"[ID: {request_id}] Sending request to LLM")
+            logger.info("[ID: %s] Sending request to LLM (%s)", request_id, agent_name)
             start_time = time.time()
-            response = chain.invoke({})
+            response = await chain.ainvoke(inputs)
             elapsed = time.time() - start_time
-            logger.info(f"[ID: {request_id}] LLM response received in {elapsed:.2f}s")
-            
+            logger.info("[ID: %s] LLM response received in %.2fs", request_id, elapsed)
+
             cleaned_response = self._clean_output(response)
-            logger.info(f"[ID: {request_id}] Response processed successfully")
+            logger.info("[ID: %s] Response processed successfully", request_id)
             return cleaned_response
         except Exception as e:
-            logger.exception(f"[ID: {request_id}] Exception in process_query: {str(e)}")
-            return "Desculpe, estou tendo dificuldades para processar sua mensagem. Como posso ajudá-lo com informações sobre o Recife?"
+            logger.exception("[ID: %s] Exception in %s: %s", request_id, agent_name, e)
+            return self.error_message
 
-class CultureAgent(BaseAgent):
-    def __init__(self, groq_api_key: str, model_name: str = "llama3-8b-8192"):
-        super().__init__(groq_api_key, model_name)
-        logger.info("CultureAgent initialized")
-        
-    @log_time(logger)
-    def process_query(self, query: str, conversation_history: Optional[List] = None) -> str:
+    async def astream_query(self, query: str, conversation_history: Optional[List] = None) -> AsyncIterator[str]:
+        agent_name = self.__class__.__name__
         request_id = str(uuid.uuid4())[:8]
-        logger.info(f"[ID: {request_id}] Processing query with CultureAgent: '{query[:50]}...'")
-        
-        system_prompt = """
+        logger.info("[ID: %s] Streaming query with %s: '%s...'", request_id, agent_name, query[:50])
+
+        chain, inputs = self._build_chain(request_id, query, conversation_history)
+        stripper = ThinkStripper()
+        emitted = False
+
+        try:
+            start_time = time.time()
+            async for chunk in chain.astream(inputs):
+                text = stripper.feed(chunk)
+                if text:
+                    emitted = True
+                    yield text
+            text = stripper.flush()
+            if text:
+                yield text
+            logger.info("[ID: %s] LLM stream completed in %.2fs", request_id, time.time() - start_time)
+        except Exception as e:
+            logger.exception("[ID: %s] Exception in %s: %s", request_id, agent_name, e)
+            if not emitted:
+                yield self.error_message
+
+class CultureAgent(BaseAgent):
+    system_prompt = """
         Você é AnaCultura Agente Cultural do Recife, especializado em:
         - Eventos culturais e festivais da cidade
         - Patrimônio histórico e pontos turísticos
         - Equipamentos culturais (teatros, museus, bibliotecas)
         - Manifestações culturais populares (frevo, maracatu, etc.)
-        
+
         Ao responder:
         - Dê prioridade a informações sobre eventos atuais e locais culturais
         - Destaque a importância histórica dos locais, quando relevante
         - Sugira roteiros culturais relacionados à pergunta
         - Mencione horários de funcionamento e valores se forem conhecidos
-        
+
         Seja amigável, entusiasta e demonstre conhecimento profundo sobre a cultura recifense.
         """
-        
-        messages = [("system", system_prompt)]
-        
-        conv_length = 0
-        if conversation_history:
-            for entry in conversation_history[-5:]:
-                if "user" in entry:
-                    messages.append(("human", entry["user"]))
-                    conv_length += 1
-                if "assistant" in entry:
-                    messages.append(("assistant", entry["assistant"]))
-        
-        logger.info(f"[ID: {request_id}] Using {conv_length} previous messages in conversation context")
-        messages.append(("human", query))
-        
-        chat_template = ChatPromptTemplate.from_messages(messages)
-        model, parser = self._create_chain(system_prompt)
-        chain = chat_template | model | parser
-        
-        try:
-            logger.info(f"[ID: {request_id}] Sending request to LLM (CultureAgent)")
-            start_time = time.time()
-            response = chain.invoke({})
-            elapsed = time.time() - start_time
-            logger.info(f"[ID: {request_id}] LLM response received in {elapsed:.2f}s")
-            
-            cleaned_response = self._clean_output(response)
-            logger.info(f"[ID: {request_id}] Response processed successfully")
-            return cleaned_response
-        except Exception as e:
-            logger.exception(f"[ID: {request_id}] Exception in CultureAgent: {str(e)}")
-            return f"Desculpe, estou com dificuldades para acessar informações culturais. Pode reformular sua pergunta?"
+    error_message = "Desculpe, estou com dificuldades para acessar informações culturais. Pode reformular sua pergunta?"
+
+    def __init__(self, registry: ModelRegistry, model_name: str = "llama3-8b-8192"):
+        super().__init__(registry, model_name)
+        logger.info("CultureAgent initialized")
 
 class PublicServicesAgent(BaseAgent):
-    def __init__(self, groq_api_key: str, model_name: str = "llama3-8b-8192"):
-        super().__init__(groq_api_key, model_name)
-        logger.info("PublicServicesAgent initialized")
-        
-    @log_time(logger)
-    def process_query(self, query: str, conversation_history: Optional[List] = None) -> str:
-        request_id = str(uuid.uuid4())[:8]
-        logger.info(f"[ID: {request_id}] Processing query with PublicServicesAgent: '{query[:50]}...'")
-        
-        system_prompt = """
+    system_prompt = """
         Você é a AnaCultura, Agente de Serviços Públicos do Recife, especializado em:
         - Serviços municipais e como acessá-los
         - Programas sociais e critérios de elegibilidade
         - Procedimentos administrativos municipais
         - Atendimento ao cidadão e canais de comunicação
-        
+
         Ao responder:
         - Forneça informações precisas sobre como acessar os serviços
         - Indique documentação necessária e prazos quando relevante
         - Mencione alternativas digitais para serviços presenciais
         - Oriente sobre direitos do cidadão relacionados aos serviços
-        
+
         Seja claro, objetivo e demonstre conhecimento técnico sobre a administração municipal.
         """
-        
-        messages = [("system", system_prompt)]
-        
-        conv_length = 0
-        if conversation_history:
-            for entry in conversation_history[-5:]:
-                if "user" in entry:
-                    messages.append(("human", entry["user"]))
-                    conv_length += 1
-                if "assistant" in entry:
-                    messages.append(("assistant", entry["assistant"]))
-        
-        logger.info(f"[ID: {request_id}] Using {conv_length} previous messages in conversation context")
-        messages.append(("human", query))
-        
-        chat_template = ChatPromptTemplate.from_messages(messages)
-        model, parser = self._create_chain(system_prompt)
-        chain = chat_template | model | parser
-        
-        try:
-            logger.info(f"[ID: {request_id}] Sending request to LLM (PublicServicesAgent)")
-            start_time = time.time()
-            response = chain.invoke({})
-            elapsed = time.time() - start_time
-            logger.info(f"[ID: {request_id}] LLM response received in {elapsed:.2f}s")
-            
-            cleaned_response = self._clean_output(response)
-            logger.info(f"[ID: {request_id}] Response processed successfully")
-            return cleaned_response
-        except Exception as e:
-            logger.exception(f"[ID: {request_id}] Exception in PublicServicesAgent: {str(e)}")
-            return f"Desculpe, estou com dificuldades para acessar informações sobre serviços municipais. Pode reformular sua pergunta?"
+    error_message = "Desculpe, estou com dificuldades para acessar informações sobre serviços municipais. Pode reformular sua pergunta?"
+
+    def __init__(self, registry: ModelRegistry, model_name: str = "llama3-8b-8192"):
+        super().__init__(registry, model_name)
+        logger.info("PublicServicesAgent initialized")
 
 class MobilityAgent(BaseAgent):
-    def __init__(self, groq_api_key: str, model_name: str = "llama3-8b-8192"):
-        super().__init__(groq_api_key, model_name)
-        logger.info("MobilityAgent initialized")
-        
-    @log_time(logger)
-    def process_query(self, query: str, conversation_history: Optional[List] = None) -> str:
-        request_id = str(uuid.uuid4())[:8]
-        logger.info(f"[ID: {request_id}] Processing query with MobilityAgent: '{query[:50]}...'")
-        
-        system_prompt = """
+    system_prompt = """
         Você é a AnaMobi, Agente de Mobilidade do Recife, especializado em:
         - Transporte público (ônibus, metrô, BRT)
         - Ciclovias e mobilidade ativa
         - Trânsito e condições das vias
         - Projetos de mobilidade urbana
-        
+
         Ao responder:
         - Forneça informações atualizadas sobre linhas e horários
         - Sugira rotas otimizadas considerando tempo e conforto
         - Mencione alternativas de transporte quando relevante
         - Indique aplicativos e recursos úteis para mobilidade
-        
+
         Seja pragmático, eficiente e demonstre conhecimento técnico sobre a mobilidade urbana.
         """
-        
-        messages = [("system", system_prompt)]
-        
-        conv_length = 0
-        if conversation_history:
-            for entry in conversation_history[-5:]:
-                if "user" in entry:
-                    messages.append(("human", entry["user"]))
-                    conv_length += 1
-                if "assistant" in entry:
-                    messages.append(("assistant", entry["assistant"]))
-        
-        logger.info(f"[ID: {request_id}] Using {conv_length} previous messages in conversation context")
-        messages.append(("human", query))
-        
-        chat_template = ChatPromptTemplate.from_messages(messages)
-        model, parser = self._create_chain(system_prompt)
-        chain = chat_template | model | parser
-        
-        try:
-            logger.info(f"[ID: {request_id}] Sending request to LLM (MobilityAgent)")
-            start_time = time.time()
-            response = chain.invoke({})
-            elapsed = time.time() - start_time
-            logger.info(f"[ID: {request_id}] LLM response received in {elapsed:.2f}s")
-            
-            cleaned_response = self._clean_output(response)
-            logger.info(f"[ID: {request_id}] Response processed successfully")
-            return cleaned_response
-        except Exception as e:
-            logger.exception(f"[ID: {request_id}] Exception in MobilityAgent: {str(e)}")
-            return f"Desculpe, estou com dificuldades para acessar informações sobre mobilidade. Pode reformular sua pergunta?"
+    error_message = "Desculpe, estou com dificuldades para acessar informações sobre mobilidade. Pode reformular sua pergunta?"
+
+    def __init__(self, registry: ModelRegistry, model_name: str = "llama3-8b-8192"):
+        super().__init__(registry, model_name)
+        logger.info("MobilityAgent initialized")
 
 class HealthAgent(BaseAgent):
-    def __init__(self, groq_api_key: str, model_name: str = "llama3-8b-8192"):
-        super().__init__(groq_api_key, model_name)
-        logger.info("HealthAgent initialized")
-        
-    @log_time(logger)
-    def process_query(self, query: str, conversation_history: Optional[List] = None) -> str:
-        request_id = str(uuid.uuid4())[:8]
-        logger.info(f"[ID: {request_id}] Processing query with HealthAgent: '{query[:50]}...'")
-        
-        system_prompt = """
+    system_prompt = """
         Você é AnaCuida, Agente de Saúde e Bem-estar do Recife, especializado em:
         - Unidades de saúde e serviços disponíveis
         - Academias da cidade e atividades físicas públicas
         - Dados epidemiológicos e campanhas de saúde
         - Programas de bem-estar e qualidade de vida
-        
+
         Ao responder:
         - Forneça informações precisas sobre locais e horários de atendimento
         - Oriente sobre o acesso a serviços de saúde específicos
         - Mencione programas de prevenção relacionados à pergunta
         - Incentive hábitos saudáveis com recomendações práticas
-        
+
         Seja atencioso, informativo e demonstre conhecimento técnico sobre saúde pública.
         """
-        
-        messages = [("system", system_prompt)]
-        
-        conv_length = 0
-        if conversation_history:
-            for entry in conversation_history[-5:]:
-                if "user" in entry:
-                    messages.append(("human", entry["user"]))
-                    conv_length += 1
-                if "assistant" in entry:
-                    messages.append(("assistant", entry["assistant"]))
-        
-        logger.info(f"[ID: {request_id}] Using {conv_length} previous messages in conversation context")
-        messages.append(("human", query))
-        
-        chat_template = ChatPromptTemplate.from_messages(messages)
-        model, parser = self._create_chain(system_prompt)
-        chain = chat_template | model | parser
-        
-        try:
-            logger.info(f"[ID: {request_id}] Sending request to LLM (HealthAgent)")
-            start_time = time.time()
-            response = chain.invoke({})
-            elapsed = time.time() - start_time
-            logger.info(f"[ID: {request_id}] LLM response received in {elapsed:.2f}s")
-            
-            cleaned_response = self._clean_output(response)
-            logger.info(f"[ID: {request_id}] Response processed successfully")
-            return cleaned_response
-        except Exception as e:
-            logger.exception(f"[ID: {request_id}] Exception in HealthAgent: {str(e)}")
-            return f"Desculpe, estou com dificuldades para acessar informações sobre saúde. Pode reformular sua pergunta?"
+    error_message = "Desculpe, estou com dificuldades para acessar informações sobre saúde. Pode reformular sua pergunta?"
+
+    def __init__(self, registry: ModelRegistry, model_name: str = "llama3-8b-8192"):
+        super().__init__(registry, model_name)
+        logger.info("HealthAgent initialized")
 
 # Factory to create the appropriate agent based on domain
 class AgentFactory:
+    # Agents are stateless, so one instance per domain and model is shared by all requests
+    _agents: Dict[Tuple[str, str], BaseAgent] = {}
+    DOMAINS = ("GERAL", "CULTURA", "SERVICOS", "MOBILIDADE", "SAUDE")
+
     @staticmethod
-    def create_agent(domain: str, groq_api_key: str, model_name: str = "llama3-8b-8192") -> BaseAgent:
+    def warm_up(registry: ModelRegistry, model_name: str = "llama3-8b-8192"):
+        """Create every domain agent and build its chain ahead of the first request."""
+        for domain in AgentFactory.DOMAINS:
+            AgentFactory.create_agent(domain, registry, model_name).chain()
+
+    @staticmethod
+    def create_agent(domain: str, registry: ModelRegistry, model_name: str = "llama3-8b-8192") -> BaseAgent:
         domain = domain.upper() if domain else "GERAL"
-        logger.info(f"Creating agent for domain: {domain} with model: {model_name}")
-        
+        key = (domain, model_name)
+        agent = AgentFactory._agents.get(key)
+        if agent is not None:
+            return agent
+
+        logger.info("Creating agent for domain: %s with model: %s", domain, model_name)
+
         if domain == "CULTURA":
             logger.info("Creating CultureAgent")
-            return CultureAgent(groq_api_key, model_name)
+            agent = CultureAgent(registry, model_name)
         elif domain == "SERVICOS":
             logger.info("Creating PublicServicesAgent")
-            return PublicServicesAgent(groq_api_key, model_name)
+            agent = PublicServicesAgent(registry, model_name)
         elif domain == "MOBILIDADE":
             logger.info("Creating MobilityAgent")
-            return MobilityAgent(groq_api_key, model_name)
+            agent = MobilityAgent(registry, model_name)
         elif domain == "SAUDE":
             logger.info("Creating HealthAgent")
-            return HealthAgent(groq_api_key, model_name)
+            agent = HealthAgent(registry, model_name)
         else:
             logger.info("Domain not recognized, creating BaseAgent")
             # Return a default general agent that uses the existing conversation service
-            return BaseAgent(groq_api_key, model_name)
\ No newline at end of file
+            agent = BaseAgent(registry, model_name)
+
+        AgentFactory._agents[key] = agent
+        return agent
@@ -0,0 +1,115 @@
+import re
+import threading
+from collections import defaultdict
+from typing import Any, Callable, Dict, Optional, Set
+from cachetools import TTLCache
+from app.services.retrieval import normalize_text
+from app.utils.logger import get_logger
+from app.utils.metrics import record_cache
+
+logger = get_logger("answer_cache")
+
+def normalize_question(question: str) -> str:
+    """Fold case, accents, punctuation and whitespace."""
+    text = re.sub(r"[^a-z0-9]+", " ", normalize_text(question))
+    return " ".join(text.split())
+
+# Only articles and pronouns. Prepositions stay, they carry direction and roles
+# ("de Olinda para o Recife" / "do Recife para Olinda")
+SIGNATURE_STOPWORDS = {"o", "os", "as", "um", "uma", "uns", "umas", "me", "eu"}
+# A trailing "no Recife" / "em Recife" only restates the city every dataset covers
+CITY_SCOPE = re.compile(r"\s*\b(?:em|no|na|de|do|da)\s+(?:cidade\s+do\s+)?recife$")
+
+def question_signature(question: str) -> str:
+    """Key over the normalized words in their original order, without fillers or a trailing city scope.
+
+    Order is kept so questions with swapped roles ("mais escolas que
+    hospitais" / "mais hospitais que escolas") never share a key.
+    """
+    text = CITY_SCOPE.sub("", normalize_question(question))
+    return " ".join(word for word in text.split() if word not in SIGNATURE_STOPWORDS)
+
+class AnswerCache:
+    """LRU + TTL cache of final query responses keyed by the normalized question.
+
+    Each entry remembers the resource (and its version) the answer was built
+    from; when ``version_lookup`` reports a newer version, or the resource is
+    invalidated explicitly, the entry is dropped.
+    """
+
+    def __init__(self, maxsize: int = 1024, ttl: float = 3600, near_duplicates: bool = False,
+                 version_lookup: Optional[Callable[[str], Optional[str]]] = None):
+        self.maxsize = maxsize
+        self.near_duplicates = near_duplicates
+        self.version_lookup = version_lookup
+        self._entries = TTLCache(maxsize=maxsize, ttl=ttl)
+        self._signatures = TTLCache(maxsize=maxsize, ttl=ttl)
+        self._by_resource: Dict[str, Set[str]] = defaultdict(set)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        logger.info("AnswerCache initialized with maxsize: %s, TTL: %ss", maxsize, ttl)
+
+    def _lookup_key(self, question: str) -> Optional[str]:
+        key = normalize_question(question)
+        if key in self._entries:
+            return key
+        if self.near_duplicates:
+            signature = question_signature(question)
+            if signature:
+                return self._signatures.get(signature)
+        return None
+
+    def get(self, question: str) -> Optional[Any]:
+        with self._lock:
+            key = self._lookup_key(question)
+            entry = self._entries.get(key) if key is not None else None
+            if entry is not None and self.version_lookup is not None:
+                current = self.version_lookup(entry["resource_id"])
+                if current is not None and current != entry["resource_version"]:
+                    logger.info("Cached answer for resource %s is outdated, invalidating", entry['resource_id'])
+                    self._invalidate_resource(entry["resource_id"])
+                    entry = None
+
+            record_cache("answer", entry is not None)
+            if entry is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            return entry["response"]
+
+    def put(self, question: str, response: Any, resource_id: str, resource_version: Optional[str] = None):
+        key = normalize_question(question)
+        with self._lock:
+            self._entries[key] = {
+                "response": response,
+                "resource_id": resource_id,
+                "resource_version": resource_version
+            }
+            if self.near_duplicates:
+                signature = question_signature(question)
+                if signature:
+                    self._signatures[signature] = key
+            self._by_resource[resource_id].add(key)
+            if sum(len(keys) for keys in self._by_resource.values()) > 2 * self.maxsize:
+                self._rebuild_resource_index()
+
+    def _rebuild_resource_index(self):
+        # Keys evicted or expired by the TTLCache linger in the reverse index until rebuilt
+        self._by_resource = defaultdict(set)
+        for key, entry in self._entries.items():
+            self._by_resource[entry["resource_id"]].add(key)
+
+    def _invalidate_resource(self, resource_id: str):
+        for key in self._by_resource.pop(resource_id, set()):
+            self._entries.pop(key, None)
+
+    def invalidate_resource(self, resource_id: str):
+        with self._lock:
+            self._invalidate_resource(resource_id)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._signatures.clear()
+            self._by_resource.clear()
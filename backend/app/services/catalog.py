@@ -0,0 +1,136 @@
+import asyncio
+import time
+from typing import List, Dict, Any, Optional
+from app.services.database import DatabaseService
+from app.services.mirror import ResourceMirror
+from app.services.retrieval import DatasetIndex
+from app.utils.logger import get_logger
+
+logger = get_logger("catalog")
+
+class CatalogCache:
+    """In-process cache of the DataHub package list.
+
+    Fresh entries are served directly; once the TTL expires the stale list is
+    still served while a single revalidation runs in the background, and a
+    failed refresh keeps the last good list instead of failing requests.
+    A background task refreshes the list periodically so requests rarely see
+    a stale entry at all. Each refresh also rebuilds the local DatasetIndex
+    used to shortlist datasets for a question and, when a ResourceMirror is
+    given, syncs the mirror in a background task (unchanged resources are skipped).
+    """
+
+    def __init__(self, database_service: DatabaseService, ttl: float = 900, refresh_interval: float = 600,
+                 mirror: Optional[ResourceMirror] = None):
+        self.database_service = database_service
+        self.mirror = mirror
+        self.ttl = ttl
+        self.refresh_interval = refresh_interval
+        self._datasets: List[str] = []
+        self.index = DatasetIndex()
+        self._resource_versions: Dict[str, Optional[str]] = {}
+        self._fetched_at: Optional[float] = None
+        self._lock = asyncio.Lock()
+        self._revalidation: Optional[asyncio.Task] = None
+        self._refresher: Optional[asyncio.Task] = None
+        self._mirror_sync: Optional[asyncio.Task] = None
+        logger.info("CatalogCache initialized with TTL: %ss, refresh interval: %ss", ttl, refresh_interval)
+
+    @property
+    def age(self) -> Optional[float]:
+        if self._fetched_at is None:
+            return None
+        return time.monotonic() - self._fetched_at
+
+    def is_fresh(self) -> bool:
+        age = self.age
+        return age is not None and age < self.ttl
+
+    async def aget_database_list(self) -> List[str]:
+        if self.is_fresh():
+            return self._datasets
+
+        if self._datasets:
+            logger.info("Serving stale catalog (%.0fs old) while revalidating", self.age)
+            self._schedule_revalidation()
+            return self._datasets
+
+        # Cold cache: nothing to serve, the caller has to wait for the first fetch
+        await self.refresh()
+        return self._datasets
+
+    async def refresh(self, force: bool = False) -> bool:
+        async with self._lock:
+            # Another caller may have refreshed while we waited for the lock
+            if not force and self.is_fresh():
+                return True
+
+            datasets = await self.database_service.aget_database_list()
+            if not datasets:
+                if self._datasets:
+                    logger.warning("Catalog refresh failed, keeping stale catalog with %s datasets", len(self._datasets))
+                else:
+                    logger.error("Catalog refresh failed and no cached catalog is available")
+                return False
+
+            packages = await self.database_service.aget_package_details()
+            known = set(datasets)
+            packages = [p for p in packages if p.get('name') in known]
+            if len(packages) < len(datasets):
+                # Datasets missing from package_search are still indexed by name
+                described = {p.get('name') for p in packages}
+                packages.extend({'name': name} for name in datasets if name not in described)
+
+            self.index = DatasetIndex.build(packages)
+            self._resource_versions = {
+                resource.get('id'): resource.get('last_modified') or resource.get('metadata_modified')
+                for package in packages
+                for resource in package.get('resources', [])
+            }
+            self._datasets = datasets
+            self._fetched_at = time.monotonic()
+            logger.info("Catalog refreshed with %s datasets", len(datasets))
+            self._schedule_mirror_sync(packages)
+            return True
+
+    def resource_version(self, resource_id: str) -> Optional[str]:
+        """Version of a resource as of the last catalog refresh, if known."""
+        return self._resource_versions.get(resource_id)
+
+    async def asearch(self, query: str, k: int = 8) -> List[Dict[str, Any]]:
+        await self.aget_database_list()
+        return self.index.search(query, k)
+
+    def _schedule_revalidation(self):
+        if self._revalidation is None or self._revalidation.done():
+            self._revalidation = asyncio.create_task(self.refresh())
+
+    def _schedule_mirror_sync(self, packages: List[Dict[str, Any]]):
+        if self.mirror is not None and (self._mirror_sync is None or self._mirror_sync.done()):
+            self._mirror_sync = asyncio.create_task(self.mirror.sync(packages))
+            self._mirror_sync.add_done_callback(lambda t: t.cancelled() or t.exception())
+
+    async def _refresh_loop(self):
+        while True:
+            try:
+                await self.refresh(force=True)
+            except Exception as e:
+                logger.exception("Exception in catalog refresh loop: %s", e)
+            await asyncio.sleep(self.refresh_interval)
+
+    def start(self):
+        if self._refresher is None or self._refresher.done():
+            self._refresher = asyncio.create_task(self._refresh_loop())
+            logger.info("Catalog background refresher started")
+
+    async def stop(self):
+        for task in (self._refresher, self._revalidation, self._mirror_sync):
+            if task is not None and not task.done():
+                task.cancel()
+                try:
+                    await task
+                except asyncio.CancelledError:
+                    pass
+        self._refresher = None
+        self._revalidation = None
+        self._mirror_sync = None
@@ -0,0 +1,175 @@
+import asyncio
+import random
+import time
+import httpx
+from typing import Dict, Any, Optional
+from app.utils.logger import get_logger
+from app.utils.metrics import CKAN_HEDGES, CKAN_LATENCY
+from app.utils.resilience import CLOSED, CircuitBreaker, LatencyTracker
+
+logger = get_logger("ckan")
+
+RETRYABLE_STATUS_CODES = {429, 502, 503, 504}
+# Read-only actions that are safe to send twice
+HEDGEABLE_ACTIONS = {"package_list", "package_show", "package_search", "datastore_search", "datastore_search_sql"}
+
+class CKANClient:
+    """Shared, pooled HTTP client for the CKAN action API of the DataHub.
+
+    Holds one async connection pool for the whole process, applies
+    per-call timeouts and retries transient failures with jittered backoff.
+
+    Each action has its own circuit breaker: after ``breaker_failures``
+    consecutive failed attempts (transport errors, 429 and 5xx) calls to that
+    action fail fast with CircuitOpenError for ``breaker_reset`` seconds, then
+    a single probe decides whether it closes again. With ``hedge_enabled``,
+    reads that outlast the action's recent ``hedge_quantile`` latency
+    send a second identical request and take whichever answers first;
+    ``hedge_max_ratio`` caps the share of hedged requests so a slow DataHub
+    is not hit twice as hard.
+    """
+
+    def __init__(self, api_url: str, timeout: float = 10.0, sql_timeout: float = 30.0,
+                 max_retries: int = 2, retry_backoff: float = 0.5, max_connections: int = 50,
+                 max_keepalive: int = 20, sql_post_threshold: int = 1500, breaker_failures: int = 5,
+                 breaker_reset: float = 30.0, hedge_enabled: bool = False, hedge_quantile: float = 0.95,
+                 hedge_max_ratio: float = 0.1):
+        self.api_url = api_url.rstrip('/')
+        self.timeout = timeout
+        self.sql_timeout = sql_timeout
+        self.max_retries = max_retries
+        self.retry_backoff = retry_backoff
+        self.sql_post_threshold = sql_post_threshold
+        self.breaker_failures = breaker_failures
+        self.breaker_reset = breaker_reset
+        self.hedge_enabled = hedge_enabled
+        self.hedge_quantile = hedge_quantile
+        self.hedge_max_ratio = hedge_max_ratio
+        self._breakers: Dict[str, CircuitBreaker] = {}
+        self._latencies: Dict[str, LatencyTracker] = {}
+        self._reads: Dict[str, int] = {}
+        self._hedges: Dict[str, int] = {}
+
+        limits = httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_keepalive)
+        self.async_client = httpx.AsyncClient(limits=limits, timeout=timeout)
+        logger.info("CKANClient initialized with API URL: %s (pool: %s, timeout: %ss)", self.api_url, max_connections, timeout)
+
+    async def aclose(self):
+        await self.async_client.aclose()
+
+    def _backoff(self, attempt: int) -> float:
+        # Full jitter: sleep a random amount up to the exponential cap
+        return random.uniform(0, self.retry_backoff * (2 ** attempt))
+
+    def _should_retry(self, attempt: int, response: Optional[httpx.Response] = None) -> bool:
+        if attempt >= self.max_retries:
+            return False
+        return response is None or response.status_code in RETRYABLE_STATUS_CODES
+
+    def breaker(self, action: str) -> CircuitBreaker:
+        breaker = self._breakers.get(action)
+        if breaker is None:
+            breaker = self._breakers.setdefault(
+                action, CircuitBreaker(f"ckan.{action}", self.breaker_failures, self.breaker_reset)
+            )
+        return breaker
+
+    def _latency(self, action: str) -> LatencyTracker:
+        tracker = self._latencies.get(action)
+        if tracker is None:
+            tracker = self._latencies.setdefault(action, LatencyTracker())
+        return tracker
+
+    def _failed(self, response: Optional[httpx.Response]) -> bool:
+        # 4xx (unknown dataset, SQL errors) means the DataHub itself is answering fine
+        return response is None or response.status_code == 429 or response.status_code >= 500
+
+    def _record(self, action: str, breaker: CircuitBreaker, elapsed: float,
+                response: Optional[httpx.Response] = None):
+        CKAN_LATENCY.labels(action, "error" if response is None else str(response.status_code)).observe(elapsed)
+        if self._failed(response):
+            breaker.record_failure()
+        else:
+            breaker.record_success()
+            self._latency(action).add(elapsed)
+
+    def _hedge_delay(self, action: str, breaker: CircuitBreaker) -> Optional[float]:
+        if not self.hedge_enabled or action not in HEDGEABLE_ACTIONS or breaker.state != CLOSED:
+            return None
+        self._reads[action] = self._reads.get(action, 0) + 1
+        if self._hedges.get(action, 0) >= self.hedge_max_ratio * self._reads[action]:
+            return None
+        return self._latency(action).quantile(self.hedge_quantile)
+
+    async def _asend(self, action: str, breaker: CircuitBreaker, request: Dict[str, Any],
+                     timeout: float) -> httpx.Response:
+        delay = self._hedge_delay(action, breaker)
+        if delay is None:
+            return await self.async_client.request(**request, timeout=timeout)
+
+        primary = asyncio.ensure_future(self.async_client.request(**request, timeout=timeout))
+        pending = {primary}
+        try:
+            done, pending = await asyncio.wait(pending, timeout=delay)
+            if done:
+                return primary.result()
+
+            self._hedges[action] = self._hedges.get(action, 0) + 1
+            hedge = asyncio.ensure_future(self.async_client.request(**request, timeout=timeout))
+            pending.add(hedge)
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        CKAN_HEDGES.labels(action, "primary" if task is primary else "hedge").inc()
+                        return task.result()
+            # Both attempts failed
+            return primary.result()
+        finally:
+            for task in pending:
+                task.cancel()
+
+    def _build_request(self, action: str, params: Optional[Dict[str, Any]] = None,
+                       json_body: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        if json_body is not None:
+            return {"method": "POST", "url": f"{self.api_url}/{action}", "json": json_body}
+        return {"method": "GET", "url": f"{self.api_url}/{action}", "params": params}
+
+    def _sql_request(self, sql: str) -> Dict[str, Any]:
+        if len(sql) > self.sql_post_threshold:
+            return {"json_body": {"sql": sql}}
+        return {"params": {"sql": sql}}
+
+    async def arequest(self, action: str, params: Optional[Dict[str, Any]] = None,
+                       json_body: Optional[Dict[str, Any]] = None, timeout: Optional[float] = None) -> httpx.Response:
+        request = self._build_request(action, params, json_body)
+        breaker = self.breaker(action)
+        attempt = 0
+        while True:
+            breaker.before_call()
+            start_time = time.perf_counter()
+            try:
+                response = await self._asend(action, breaker, request, timeout or self.timeout)
+            except httpx.TransportError as e:
+                elapsed = time.perf_counter() - start_time
+                self._record(action, breaker, elapsed)
+                if not self._should_retry(attempt):
+                    raise
+                logger.warning("CKAN %s failed after %.2fs (%s), retrying", action, elapsed, type(e).__name__)
+            except Exception:
+                self._record(action, breaker, time.perf_counter() - start_time)
+                raise
+            except BaseException:
+                # Cancelled: no verdict on the endpoint, but a half-open probe must not stay taken
+                breaker.release()
+                raise
+            else:
+                self._record(action, breaker, time.perf_counter() - start_time, response)
+                if not self._should_retry(attempt, response):
+                    return response
+                logger.warning("CKAN %s returned HTTP %s, retrying", action, response.status_code)
+            await asyncio.sleep(self._backoff(attempt))
+            attempt += 1
+
+    async def asql(self, sql: str, timeout: Optional[float] = None) -> httpx.Response:
+        return await self.arequest('datastore_search_sql', timeout=timeout or self.sql_timeout, **self._sql_request(sql))
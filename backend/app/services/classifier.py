@@ -0,0 +1,151 @@
+import json
+import math
+import os
+import re
+import zlib
+import numpy as np
+from collections import Counter
+from typing import Dict, Any, List, Optional, Tuple
+from app.services.retrieval import normalize_text
+from app.utils.logger import get_logger
+
+logger = get_logger("classifier")
+
+DEFAULT_SAMPLES_PATH = os.path.join(os.path.dirname(os.path.dirname(__file__)), "data", "classifier_samples.jsonl")
+
+# Rules run on accent-folded, lowercased text. Chat rules are anchored so that
+# "oi, quantas escolas existem?" still reaches the query rules.
+CHAT_RULES = [
+    re.compile(r"^(oi+|ola|opa|ei|alo|e ai|bom dia|boa tarde|boa noite|tudo bem|tudo certo|beleza)"
+               r"( ana)?( tudo bem| beleza| como vai( voce)?)?$"),
+    re.compile(r"^(muito )?(obrigad[oa]|valeu|tchau|ate (logo|mais|amanha)|falou)( pela ajuda)?$"),
+    re.compile(r"^(ok|certo|sim|nao|talvez|legal|perfeito|entendi|beleza|show|boa|ta bom|hm+|(ha|k)+)$"),
+    re.compile(r"^(quem (e|criou) voce|qual (e )?(o )?seu nome|o que voce (pode|sabe) fazer|voce e um robo)$"),
+]
+QUERY_RULES = [
+    re.compile(r"\bquant[oa]s\b.*\b(existem|existe|ha|foram)\b"),
+    re.compile(r"\b(numero|quantidade|total|media|percentual|taxa|ranking) (de|do|da|dos|das)\b"),
+    re.compile(r"^(liste|listar|lista (de|das|dos)|relacione|mostre os dados)\b"),
+]
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+")
+
+class NgramLogisticModel:
+    """Logistic regression over hashed character n-grams.
+
+    Words are padded with spaces and split into n-grams of ``ngram_range``;
+    each n-gram is hashed with CRC32 (stable across processes) into
+    ``n_features`` buckets. Prediction only touches the buckets present in
+    the message, so it runs in microseconds without any dense vector.
+    """
+
+    def __init__(self, n_features: int = 2 ** 13, ngram_range: Tuple[int, int] = (2, 4)):
+        self.n_features = n_features
+        self.ngram_range = ngram_range
+        self.weights: List[float] = [0.0] * n_features
+        self.bias = 0.0
+
+    def features(self, text: str) -> Dict[int, float]:
+        counts = Counter()
+        low, high = self.ngram_range
+        for token in TOKEN_PATTERN.findall(normalize_text(text)):
+            token = f" {token} "
+            for size in range(low, high + 1):
+                for start in range(len(token) - size + 1):
+                    counts[zlib.crc32(token[start:start + size].encode()) % self.n_features] += 1
+        if not counts:
+            return {}
+        # Sublinear term frequency, then L2 normalisation so message length doesn't matter
+        values = {index: 1.0 + math.log(count) for index, count in counts.items()}
+        norm = math.sqrt(sum(v * v for v in values.values()))
+        return {index: v / norm for index, v in values.items()}
+
+    def fit(self, texts: List[str], labels: List[int], epochs: int = 500,
+            learning_rate: float = 2.0, l2: float = 1e-4) -> "NgramLogisticModel":
+        matrix = np.zeros((len(texts), self.n_features), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for index, value in self.features(text).items():
+                matrix[row, index] = value
+        y = np.asarray(labels, dtype=np.float32)
+
+        weights = np.zeros(self.n_features, dtype=np.float32)
+        bias = 0.0
+        for _ in range(epochs):
+            predictions = 1.0 / (1.0 + np.exp(-(matrix @ weights + bias)))
+            error = predictions - y
+            weights -= learning_rate * (matrix.T @ error / len(y) + l2 * weights)
+            bias -= learning_rate * float(error.mean())
+
+        # Plain floats: indexing a list is much cheaper than a numpy scalar lookup
+        self.weights = weights.astype(np.float64).tolist()
+        self.bias = bias
+        return self
+
+    def predict_proba(self, text: str) -> float:
+        features = self.features(text)
+        score = self.bias + sum(self.weights[index] * value for index, value in features.items())
+        return 1.0 / (1.0 + math.exp(-score))
+
+def load_samples(path: str = DEFAULT_SAMPLES_PATH) -> List[Dict[str, str]]:
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+class MessageClassifier:
+    """Local QUERY vs CHAT classifier placed in front of the LLM classifier.
+
+    Obvious messages are decided by rules, the rest by the n-gram model when
+    its probability is beyond ``threshold`` either way; anything in between
+    returns None so the caller escalates to the LLM. Results use the same
+    shape as ConversationService's parsed classification.
+    """
+
+    def __init__(self, model: NgramLogisticModel, threshold: float = 0.85):
+        self.model = model
+        self.threshold = threshold
+        self.decided = 0
+        self.escalated = 0
+
+    @classmethod
+    def from_samples(cls, samples: List[Dict[str, str]], threshold: float = 0.85, **model_kwargs) -> "MessageClassifier":
+        model = NgramLogisticModel(**model_kwargs).fit(
+            [s["text"] for s in samples],
+            [1 if s["label"] == "QUERY" else 0 for s in samples]
+        )
+        return cls(model, threshold)
+
+    @classmethod
+    def load(cls, path: Optional[str] = None, threshold: float = 0.85) -> "MessageClassifier":
+        samples = load_samples(path or DEFAULT_SAMPLES_PATH)
+        classifier = cls.from_samples(samples, threshold)
+        logger.info("MessageClassifier trained on %s labelled messages", len(samples))
+        return classifier
+
+    def _result(self, classification: str, confidence: int, source: str) -> Dict[str, Any]:
+        return {
+            "type": classification,
+            "confidence": confidence,
+            "is_query": classification == "QUERY" and confidence > 60,
+            "source": source
+        }
+
+    def rule_match(self, message: str) -> Optional[str]:
+        text = " ".join(TOKEN_PATTERN.findall(normalize_text(message)))
+        if any(rule.search(text) for rule in QUERY_RULES):
+            return "QUERY"
+        if any(rule.search(text) for rule in CHAT_RULES):
+            return "CHAT"
+        return None
+
+    def classify(self, message: str) -> Optional[Dict[str, Any]]:
+        rule = self.rule_match(message)
+        if rule is not None:
+            self.decided += 1
+            return self._result(rule, 95, "rules")
+
+        probability = self.model.predict_proba(message)
+        if probability >= self.threshold or probability <= 1 - self.threshold:
+            self.decided += 1
+            classification = "QUERY" if probability >= 0.5 else "CHAT"
+            return self._result(classification, int(round(max(probability, 1 - probability) * 100)), "model")
+
+        self.escalated += 1
+        return None
@@ -1,102 +1,153 @@
-from typing import Dict, Any, Optional
-from langchain_groq import ChatGroq
-from langchain.prompts import ChatPromptTemplate
-from langchain.schema.output_parser import StrOutputParser
+from typing import Dict, Any, List, Optional
+from langchain.prompts import ChatPromptTemplate, MessagesPlaceholder
+from app.services.classifier import MessageClassifier
+from app.services.conversation_store import history_messages
+from app.services.registry import ModelRegistry
+from app.services.routing import ModelRouter
+from app.utils.logger import get_logger
 import re
 
+logger = get_logger("conversation")
+
+CLASSIFIER_PROMPT = ChatPromptTemplate.from_messages([
+    ("system", """
+    Você é um classificador de mensagens que determina se um texto é:
+    1. Uma pergunta sobre dados de Recife (QUERY)
+    2. Uma mensagem conversacional (CHAT)
+
+    REGRAS:
+    - Classifique como QUERY se a mensagem contém perguntas sobre dados, estatísticas, informações factuais sobre Recife
+    - Classifique como CHAT se a mensagem é saudação, conversa casual, pergunta sobre o sistema, ou não relacionada a dados de Recife
+
+    Responda apenas com o formato:
+    CLASSIFICAÇÃO: [QUERY ou CHAT]
+    CONFIANÇA: [0-100]
+    """),
+    ("human", "{message}")
+])
+
+CONVERSATION_PROMPT = ChatPromptTemplate.from_messages([
+    ("system", """
+    Você é uma assistente virtual para a cidade do Recife.
+
+    SOBRE VOCÊ:
+    - Seu nome é Ana
+    - Seu propósito é ajudar cidadãos a encontrar informações sobre a cidade
+    - Você tem acesso a bancos de dados oficiais da cidade
+
+    COMPORTAMENTO:
+    - Seja clara, amigável e direta
+    - Quando não souber responder, sugira que o usuário faça uma pergunta específica sobre dados de Recife
+    - Explique que você pode consultar dados como estatísticas, serviços públicos, equipamentos urbanos, etc.
+    - Não invente dados que não possui
+
+    IMPORTANTE: Remova qualquer texto entre <think> e </think> da sua resposta final.
+    """),
+    MessagesPlaceholder("history"),
+    ("human", "{message}")
+])
+
+SUMMARY_PROMPT = ChatPromptTemplate.from_messages([
+    ("system", """
+    Você resume conversas entre um cidadão e a assistente virtual do Recife.
+
+    REGRAS:
+    - Escreva no máximo 5 frases em português
+    - Mantenha nomes, números, bairros, datas e perguntas ainda em aberto
+    - Se houver um resumo anterior, incorpore-o ao novo resumo
+    - Responda apenas com o resumo
+    """),
+    ("human", "Resumo anterior: {summary}\n\nConversa:\n{conversation}")
+])
+
 class ConversationService:
-    def __init__(self, groq_api_key: str):
-        self.groq_api_key = groq_api_key
-        self.model_name = "llama3-8b-8192"
-    
-    def classify_message(self, message: str) -> Dict[str, Any]:
-        
-        classifier_template = ChatPromptTemplate.from_messages([
-            ("system", """
-            Você é um classificador de mensagens que determina se um texto é:
-            1. Uma pergunta sobre dados de Recife (QUERY)
-            2. Uma mensagem conversacional (CHAT)
-            
-            REGRAS:
-            - Classifique como QUERY se a mensagem contém perguntas sobre dados, estatísticas, informações factuais sobre Recife
-            - Classifique como CHAT se a mensagem é saudação, conversa casual, pergunta sobre o sistema, ou não relacionada a dados de Recife
-            
-            Responda apenas com o formato:
-            CLASSIFICAÇÃO: [QUERY ou CHAT]
-            CONFIANÇA: [0-100]
-            """),
-            ("human", "{message}")
-        ])
-        
-        model = ChatGroq(api_key=self.groq_api_key, model_name=self.model_name, temperature=0)
-        chain = classifier_template | model | StrOutputParser()
-        
+    def __init__(self, registry: ModelRegistry, fast_classifier: Optional[MessageClassifier] = None,
+                 router: Optional[ModelRouter] = None):
+        self.registry = registry
+        self.router = router or ModelRouter("llama3-8b-8192", "deepseek-r1-distill-llama-70b")
+        self.model_name = self.router.small_model
+        self.fast_classifier = fast_classifier
+
+    def _classifier_chain(self, model_name: str):
+        return self.registry.chain(f"conversation.classifier.{model_name}", CLASSIFIER_PROMPT, model_name, 0, "chat")
+
+    def warm_up(self):
+        model_name = self.router.model_for("classification")
+        self._classifier_chain(model_name)
+        self._conversation_chain()
+
+    def _fast_classification(self, message: str) -> Optional[Dict[str, Any]]:
+        # Confidently-obvious messages never reach the LLM
+        if self.fast_classifier is None:
+            return None
+        return self.fast_classifier.classify(message)
+
+    async def aclassify_message(self, message: str) -> Dict[str, Any]:
+        fast_result = self._fast_classification(message)
+        if fast_result is not None:
+            return fast_result
+
         try:
-            result = chain.invoke({"message": message})
-            
-            classification = "CHAT"
-            confidence = 50
-            
-            for line in result.split("\n"):
-                if "CLASSIFICAÇÃO:" in line:
-                    classification = line.split(":", 1)[1].strip()
-                elif "CONFIANÇA:" in line:
-                    confidence_str = line.split(":", 1)[1].strip()
-                    try:
-                        confidence = int(confidence_str)
-                    except ValueError:
-                        pass
-            
-            return {
-                "type": classification,
-                "confidence": confidence,
-                "is_query": classification == "QUERY" and confidence > 60
-            }
+            result = await self.router.ainvoke(
+                "classification", self._classifier_chain, {"message": message}, self._parse_classification
+            )
+            return result or {"type": "CHAT", "confidence": 50, "is_query": False}
         except Exception as e:
-            print(f"Classification error: {str(e)}")
+            logger.exception("Classification error: %s", e)
             return {"type": "CHAT", "confidence": 50, "is_query": False}
-    
-    def handle_conversation(self, message: str, conversation_history: Optional[list] = None) -> str:
-        
-        if conversation_history is None:
-            conversation_history = []
-        
-        system_prompt = """
-        Você é uma assistente virtual para a cidade do Recife.
-
-        SOBRE VOCÊ:
-        - Seu nome é Ana
-        - Seu propósito é ajudar cidadãos a encontrar informações sobre a cidade
-        - Você tem acesso a bancos de dados oficiais da cidade
-
-        COMPORTAMENTO:
-        - Seja clara, amigável e direta
-        - Quando não souber responder, sugira que o usuário faça uma pergunta específica sobre dados de Recife
-        - Explique que você pode consultar dados como estatísticas, serviços públicos, equipamentos urbanos, etc.
-        - Não invente dados que não possui
-        
-        IMPORTANTE: Remova qualquer texto entre <think> e </think> da sua resposta final.
-        """
-        
-        messages = [("system", system_prompt)]
-        
-        #for entry in conversation_history[-5:]:
-        #    if "user" in entry:
-        #        messages.append(("human", entry["user"]))
-        #    if "assistant" in entry:
-        #        messages.append(("assistant", entry["assistant"]))
-        
-        messages.append(("human", message))
-        
-        chat_template = ChatPromptTemplate.from_messages(messages)
-        
-        model = ChatGroq(api_key=self.groq_api_key, model_name=self.model_name, temperature=0.7)
-        chain = chat_template | model | StrOutputParser()
-        
+
+    def _parse_classification(self, result: str) -> Optional[Dict[str, Any]]:
+        classification = None
+        confidence = 50
+
+        for line in result.split("\n"):
+            if "CLASSIFICAÇÃO:" in line:
+                classification = line.split(":", 1)[1].strip().strip("[]*").upper()
+            elif "CONFIANÇA:" in line:
+                confidence_str = line.split(":", 1)[1].strip()
+                try:
+                    confidence = int(confidence_str)
+                except ValueError:
+                    pass
+
+        if classification not in ("QUERY", "CHAT"):
+            return None
+        return {
+            "type": classification,
+            "confidence": confidence,
+            "is_query": classification == "QUERY" and confidence > 60,
+            "source": "llm"
+        }
+
+    def _conversation_inputs(self, message: str, conversation_history: Optional[list] = None) -> Dict[str, Any]:
+
+        # The history is already fitted to the token budget by ConversationMemory
+        return {"history": history_messages(conversation_history), "message": message}
+
+    def _conversation_chain(self):
+        return self.registry.chain("conversation.chat", CONVERSATION_PROMPT, self.model_name, 0.7, "chat")
+
+    async def asummarize(self, summary: Optional[str], entries: List[Dict[str, str]]) -> Optional[str]:
+        chain = self.registry.chain("conversation.summary", SUMMARY_PROMPT, self.model_name, 0, "background")
+        conversation = "\n".join(
+            f"{'Cidadão' if role == 'human' else 'Assistente'}: {text}"
+            for role, text in history_messages(entries) if role != "system"
+        )
+
+        try:
+            response = await chain.ainvoke({"summary": summary or "nenhum", "conversation": conversation})
+            return re.sub(r'<think>.*?</think>', '', response, flags=re.DOTALL).strip() or None
+        except Exception as e:
+            logger.exception("Summary error: %s", e)
+            return None
+
+    async def ahandle_conversation(self, message: str, conversation_history: Optional[list] = None) -> str:
+        chain = self._conversation_chain()
+
         try:
-            response = chain.invoke({})
+            response = await chain.ainvoke(self._conversation_inputs(message, conversation_history))
             response = re.sub(r'<think>.*?</think>', '', response, flags=re.DOTALL).strip()
             return response
         except Exception as e:
-            print(f"Conversation error: {str(e)}")
-            return "Desculpe, estou tendo dificuldades para processar sua mensagem. Como posso ajudá-lo com informações sobre o Recife?"
\ No newline at end of file
+            logger.exception("Conversation error: %s", e)
+            return "Desculpe, estou tendo dificuldades para processar sua mensagem. Como posso ajudá-lo com informações sobre o Recife?"
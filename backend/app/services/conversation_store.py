@@ -0,0 +1,256 @@
+import asyncio
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set, Tuple
+from cachetools import TTLCache
+from app.utils.logger import get_logger
+from app.utils.prompt_encoding import estimate_tokens
+
+logger = get_logger("conversation_store")
+
+Entry = Dict[str, str]
+
+def entry_tokens(entry: Entry) -> int:
+    return sum(estimate_tokens(text) for text in entry.values())
+
+def history_messages(entries: Optional[List[Entry]]) -> List[Tuple[str, str]]:
+    """Convert stored entries into (role, text) messages for a MessagesPlaceholder."""
+    messages = []
+    for entry in entries or []:
+        if "summary" in entry:
+            messages.append(("system", f"Resumo da conversa até aqui: {entry['summary']}"))
+        if "user" in entry:
+            messages.append(("human", entry["user"]))
+        if "assistant" in entry:
+            messages.append(("assistant", entry["assistant"]))
+    return messages
+
+class MemoryConversationStore:
+    """Process-local conversation store, bounded by LRU size and idle TTL.
+
+    Each conversation keeps a summary of folded turns and a deque of the most
+    recent ``max_turns`` entries, so appends are O(1) and memory per
+    conversation is capped even if summarisation never runs. Turns carry an
+    increasing id so a summary can name exactly the turns it replaces.
+    """
+
+    def __init__(self, maxsize: int = 10_000, ttl: float = 24 * 3600, max_turns: int = 50):
+        self.max_turns = max_turns
+        self._conversations = TTLCache(maxsize=maxsize, ttl=ttl)
+        self._lock = threading.Lock()
+        logger.info("MemoryConversationStore initialized with maxsize: %s, TTL: %ss", maxsize, ttl)
+
+    def append(self, conversation_id: str, entry: Entry):
+        with self._lock:
+            conversation = self._conversations.get(conversation_id)
+            if conversation is None:
+                conversation = {"summary": None, "turns": deque(maxlen=self.max_turns), "next_id": 1}
+            conversation["turns"].append((conversation["next_id"], entry))
+            conversation["next_id"] += 1
+            # Re-inserting restarts the idle TTL
+            self._conversations[conversation_id] = conversation
+
+    def load(self, conversation_id: str) -> Tuple[Optional[str], List[Entry]]:
+        summary, turns = self.load_turns(conversation_id)
+        return summary, [entry for _, entry in turns]
+
+    def load_turns(self, conversation_id: str) -> Tuple[Optional[str], List[Tuple[int, Entry]]]:
+        with self._lock:
+            conversation = self._conversations.get(conversation_id)
+            if conversation is None:
+                return None, []
+            return conversation["summary"], list(conversation["turns"])
+
+    def replace_summary(self, conversation_id: str, summary: str, through_id: int):
+        """Store a new summary and drop the turns up to ``through_id`` it replaces."""
+        with self._lock:
+            conversation = self._conversations.get(conversation_id)
+            if conversation is None:
+                return
+            conversation["summary"] = summary
+            turns = conversation["turns"]
+            while turns and turns[0][0] <= through_id:
+                turns.popleft()
+
+    def __len__(self) -> int:
+        return len(self._conversations)
+
+    def close(self):
+        pass
+
+class SQLiteConversationStore:
+    """Conversation store shared by several workers through a SQLite file.
+
+    Turns are appended as rows (a single INSERT), reads return the summary
+    and the last ``max_turns`` turns, and conversations idle for longer than
+    ``ttl`` are purged periodically.
+    """
+
+    PURGE_EVERY = 200
+
+    def __init__(self, path: str = "cache/conversations.sqlite3", ttl: float = 24 * 3600, max_turns: int = 50):
+        self.path = path
+        self.ttl = ttl
+        self.max_turns = max_turns
+        self._lock = threading.Lock()
+        self._appends = 0
+
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=10)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS conversation (
+                conversation_id TEXT PRIMARY KEY,
+                summary TEXT,
+                updated_at REAL NOT NULL
+            )
+        """)
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS conversation_turn (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                conversation_id TEXT NOT NULL,
+                entry TEXT NOT NULL
+            )
+        """)
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS conversation_turn_by_id ON conversation_turn (conversation_id, id)"
+        )
+        self._conn.commit()
+        logger.info("SQLiteConversationStore initialized at %s with TTL: %ss", path, ttl)
+
+    def append(self, conversation_id: str, entry: Entry):
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO conversation (conversation_id, summary, updated_at) VALUES (?, NULL, ?) "
+                "ON CONFLICT (conversation_id) DO UPDATE SET updated_at = excluded.updated_at",
+                (conversation_id, now)
+            )
+            self._conn.execute(
+                "INSERT INTO conversation_turn (conversation_id, entry) VALUES (?, ?)",
+                (conversation_id, json.dumps(entry, ensure_ascii=False))
+            )
+            self._conn.commit()
+            self._appends += 1
+            if self._appends % self.PURGE_EVERY == 0:
+                self._purge(now)
+
+    def _recent_turns(self, conversation_id: str) -> List[Tuple[int, str]]:
+        rows = self._conn.execute(
+            "SELECT id, entry FROM conversation_turn WHERE conversation_id = ? ORDER BY id DESC LIMIT ?",
+            (conversation_id, self.max_turns)
+        ).fetchall()
+        return rows[::-1]
+
+    def load(self, conversation_id: str) -> Tuple[Optional[str], List[Entry]]:
+        summary, turns = self.load_turns(conversation_id)
+        return summary, [entry for _, entry in turns]
+
+    def load_turns(self, conversation_id: str) -> Tuple[Optional[str], List[Tuple[int, Entry]]]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT summary, updated_at FROM conversation WHERE conversation_id = ?", (conversation_id,)
+            ).fetchone()
+            if row is None or time.time() - row[1] > self.ttl:
+                return None, []
+            return row[0], [(turn_id, json.loads(entry)) for turn_id, entry in self._recent_turns(conversation_id)]
+
+    def replace_summary(self, conversation_id: str, summary: str, through_id: int):
+        """Store a new summary and drop the turns up to ``through_id`` it replaces."""
+        with self._lock:
+            self._conn.execute(
+                "UPDATE conversation SET summary = ? WHERE conversation_id = ?", (summary, conversation_id)
+            )
+            # Turns older than the visible window go as well, they'd never be read again
+            self._conn.execute(
+                "DELETE FROM conversation_turn WHERE conversation_id = ? AND id <= ?", (conversation_id, through_id)
+            )
+            self._conn.commit()
+
+    def _purge(self, now: float):
+        cutoff = now - self.ttl
+        self._conn.execute(
+            "DELETE FROM conversation_turn WHERE conversation_id IN "
+            "(SELECT conversation_id FROM conversation WHERE updated_at < ?)", (cutoff,)
+        )
+        deleted = self._conn.execute("DELETE FROM conversation WHERE updated_at < ?", (cutoff,)).rowcount
+        self._conn.commit()
+        if deleted:
+            logger.info("Purged %s idle conversations", deleted)
+
+    def close(self):
+        self._conn.close()
+
+class ConversationMemory:
+    """Assembles conversation context within a token budget.
+
+    The newest turns that fit in ``token_budget`` (after the running summary)
+    are sent to the model. Once at least ``summarize_after`` older turns no
+    longer fit, they are folded into the summary by ``summarizer`` in a
+    background task, so prompt size stays flat as a conversation grows and no
+    request waits on summarisation.
+    """
+
+    def __init__(self, store: Any, token_budget: int = 1500, summarize_after: int = 4,
+                 summarizer: Optional[Callable[[Optional[str], List[Entry]], Awaitable[Optional[str]]]] = None):
+        self.store = store
+        self.token_budget = token_budget
+        self.summarize_after = summarize_after
+        self.summarizer = summarizer
+        self._summarizing: Set[str] = set()
+        self._tasks: Set[asyncio.Task] = set()
+
+    def _fit(self, summary: Optional[str], turns: List[Entry]) -> int:
+        """Number of newest turns that fit in the budget next to the summary."""
+        budget = self.token_budget - (estimate_tokens(summary) if summary else 0)
+        used, kept = 0, 0
+        for entry in reversed(turns):
+            used += entry_tokens(entry)
+            if used > budget:
+                break
+            kept += 1
+        return kept
+
+    def context(self, conversation_id: Optional[str]) -> List[Entry]:
+        if not conversation_id:
+            return []
+        summary, turns = self.store.load_turns(conversation_id)
+        entries = [entry for _, entry in turns]
+        kept = self._fit(summary, entries)
+        overflow = len(entries) - kept
+        if overflow >= self.summarize_after:
+            self._schedule_summary(conversation_id, summary, turns[:overflow])
+        context = [{"summary": summary}] if summary else []
+        return context + entries[overflow:]
+
+    def record(self, conversation_id: str, message: str, answer: str):
+        self.store.append(conversation_id, {"user": message})
+        self.store.append(conversation_id, {"assistant": answer})
+
+    def _schedule_summary(self, conversation_id: str, summary: Optional[str], overflow: List[Tuple[int, Entry]]):
+        if self.summarizer is None or conversation_id in self._summarizing:
+            return
+        try:
+            task = asyncio.get_running_loop().create_task(self._summarize(conversation_id, summary, overflow))
+        except RuntimeError:
+            return
+        self._summarizing.add(conversation_id)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _summarize(self, conversation_id: str, summary: Optional[str], overflow: List[Tuple[int, Entry]]):
+        try:
+            new_summary = await self.summarizer(summary, [entry for _, entry in overflow])
+            if new_summary:
+                # By id, not count: turns appended while the summarizer ran must survive
+                self.store.replace_summary(conversation_id, new_summary, overflow[-1][0])
+                logger.info("Folded %s turns of %s into its summary", len(overflow), conversation_id)
+        except Exception as e:
+            logger.exception("Exception summarising conversation %s: %s", conversation_id, e)
+        finally:
+            self._summarizing.discard(conversation_id)
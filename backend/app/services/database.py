@@ -1,54 +1,93 @@
-import requests
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Tuple
+from app.services.ckan import CKANClient
+from app.services.schema_cache import SchemaCache
 from app.utils.logger import get_logger, log_time
+from app.utils.metrics import record_cache
+from app.utils.singleflight import SingleFlight
 
 logger = get_logger("database")
 
 class DatabaseService:
-    def __init__(self, api_url: str):
-        self.api_url = api_url
-        logger.info(f"DatabaseService initialized with API URL: {api_url}")
-        
+    def __init__(self, ckan_client: CKANClient, schema_cache: Optional[SchemaCache] = None):
+        self.ckan = ckan_client
+        self.schema_cache = schema_cache
+        # Concurrent requests for the same package or schema share one DataHub call
+        self._package_flights = SingleFlight("package_show")
+        self._metadata_flights = SingleFlight("resource metadata")
+        logger.info("DatabaseService initialized with API URL: %s", ckan_client.api_url)
+
     @log_time(logger)
-    def get_database_list(self) -> List[str]:
+    async def aget_database_list(self) -> List[str]:
         try:
             logger.info("Fetching database list")
-            response = requests.get(f'{self.api_url}/package_list')
-            if response.status_code == 200:
-                result = response.json().get('result', [])
-                logger.info(f"Retrieved {len(result)} databases")
-                return result
-            else:
-                logger.error(f"Error getting database list: HTTP {response.status_code}")
-                return []
+            response = await self.ckan.arequest('package_list')
+            return self._parse_database_list(response)
         except Exception as e:
-            logger.exception(f"Exception getting database list: {str(e)}")
+            logger.exception("Exception getting database list: %s", e)
+            return []
+
+    def _parse_database_list(self, response) -> List[str]:
+        if response.status_code == 200:
+            result = response.json().get('result', [])
+            logger.info("Retrieved %s databases", len(result))
+            return result
+        else:
+            logger.error("Error getting database list: HTTP %s", response.status_code)
             return []
-    
+
     @log_time(logger)
-    def get_resource_list(self, nome: str) -> Optional[Dict[str, Any]]:
+    async def aget_package_details(self, page_size: int = 1000) -> List[Dict[str, Any]]:
+        packages = []
         try:
-            logger.info(f"Fetching resource list for: {nome}")
-            response = requests.get(f'{self.api_url}/package_show?id={nome}')
-            if response.status_code == 200:
-                result = response.json().get('result', None)
-                if result:
-                    logger.info(f"Retrieved package with {len(result.get('resources', []))} resources")
-                else:
-                    logger.warning(f"No resources found for package: {nome}")
-                return result
-            else:
-                logger.error(f"Error getting resource list: HTTP {response.status_code}")
-                return None
+            logger.info("Fetching package details")
+            while True:
+                response = await self.ckan.arequest('package_search', params={'rows': page_size, 'start': len(packages)})
+                page, total = self._parse_package_page(response)
+                packages.extend(page)
+                if not page or len(packages) >= total:
+                    break
         except Exception as e:
-            logger.exception(f"Exception getting resource list: {str(e)}")
+            logger.exception("Exception getting package details: %s", e)
+        logger.info("Retrieved details for %s packages", len(packages))
+        return packages
+
+    def _parse_package_page(self, response) -> Tuple[List[Dict[str, Any]], int]:
+        if response.status_code != 200:
+            logger.error("Error getting package details: HTTP %s", response.status_code)
+            return [], 0
+        result = response.json().get('result', {})
+        return result.get('results', []), result.get('count', 0)
+
+    @log_time(logger)
+    async def aget_resource_list(self, nome: str) -> Optional[Dict[str, Any]]:
+        return await self._package_flights.do(nome, self._afetch_resource_list, nome)
+
+    async def _afetch_resource_list(self, nome: str) -> Optional[Dict[str, Any]]:
+        try:
+            logger.info("Fetching resource list for: %s", nome)
+            response = await self.ckan.arequest('package_show', params={'id': nome})
+            return self._parse_resource_list(nome, response)
+        except Exception as e:
+            logger.exception("Exception getting resource list: %s", e)
+            return None
+
+    def _parse_resource_list(self, nome: str, response) -> Optional[Dict[str, Any]]:
+        if response.status_code == 200:
+            result = response.json().get('result', None)
+            if result:
+                logger.info("Retrieved package with %s resources", len(result.get('resources', [])))
+            else:
+                logger.warning("No resources found for package: %s", nome)
+            return result
+        else:
+            logger.error("Error getting resource list: HTTP %s", response.status_code)
             return None
-    
+
     def get_metadata_from_resource_list(self, resource_json: Dict[str, Any]) -> Optional[Dict[str, Any]]:
         if not resource_json or resource_json.get('state') != 'active':
             logger.warning("Resource is inactive or empty")
             return None
-        
+
         logger.info("Extracting metadata from resource list")
         metadata = {}
         for i, resource in enumerate(resource_json.get('resources', [])):
@@ -59,28 +98,52 @@ class DatabaseService:
                 'descricao_dataset': resource.get('description', ''),
                 'tamanho_dataset': resource.get('size', '')
             }
-        
-        logger.info(f"Extracted metadata for {len(metadata)} resources")
+
+        logger.info("Extracted metadata for %s resources", len(metadata))
+        return metadata
+
+    def _cached_metadata(self, resource_id: str, version: Optional[str]) -> Optional[Dict[str, Any]]:
+        if self.schema_cache is None:
+            return None
+        metadata = self.schema_cache.get(resource_id, version)
+        record_cache("schema", metadata is not None)
+        if metadata is not None:
+            logger.info("Schema cache hit for resource ID: %s", resource_id)
         return metadata
-    
+
+    def _store_metadata(self, resource_id: str, version: Optional[str], metadata: Dict[str, Any]):
+        if self.schema_cache is not None and metadata['resultados_campos']:
+            self.schema_cache.put(resource_id, version, metadata)
+
     @log_time(logger)
-    def get_metadata_from_resource_id(self, resource_id: str) -> Dict[str, Any]:
+    async def aget_metadata_from_resource_id(self, resource_id: str, version: Optional[str] = None) -> Dict[str, Any]:
+        cached = self._cached_metadata(resource_id, version)
+        if cached is not None:
+            return cached
+
+        return await self._metadata_flights.do(
+            (resource_id, version), self._afetch_metadata, resource_id, version
+        )
+
+    async def _afetch_metadata(self, resource_id: str, version: Optional[str]) -> Dict[str, Any]:
         metadata = {'resultados_exemplos': [], 'resultados_campos': []}
         try:
-            logger.info(f"Fetching metadata for resource ID: {resource_id}")
+            logger.info("Fetching metadata for resource ID: %s", resource_id)
             QUERY = f'SELECT * FROM "{resource_id}" LIMIT 3'
-            logger.debug(f"SQL query: {QUERY}")
-            
-            response = requests.get(f'{self.api_url}/datastore_search_sql?sql={QUERY}')
-            response_json = response.json()
-            
-            if 'result' in response_json:
-                metadata['resultados_exemplos'] = response_json['result'].get('records', [])
-                metadata['resultados_campos'] = response_json['result'].get('fields', [])
-                logger.info(f"Retrieved {len(metadata['resultados_campos'])} fields and {len(metadata['resultados_exemplos'])} example records")
-            else:
-                logger.error(f"Error getting metadata: {response_json}")
+            logger.debug("SQL query: %s", QUERY)
+
+            response = await self.ckan.asql(QUERY)
+            self._parse_metadata(metadata, response.json())
+            self._store_metadata(resource_id, version, metadata)
         except Exception as e:
-            logger.exception(f"Exception getting metadata: {str(e)}")
-        
-        return metadata
\ No newline at end of file
+            logger.exception("Exception getting metadata: %s", e)
+
+        return metadata
+
+    def _parse_metadata(self, metadata: Dict[str, Any], response_json: Dict[str, Any]):
+        if 'result' in response_json:
+            metadata['resultados_exemplos'] = response_json['result'].get('records', [])
+            metadata['resultados_campos'] = response_json['result'].get('fields', [])
+            logger.info("Retrieved %s fields and %s example records", len(metadata['resultados_campos']), len(metadata['resultados_exemplos']))
+        else:
+            logger.error("Error getting metadata: %s", response_json)
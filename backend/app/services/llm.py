@@ -1,91 +1,231 @@
 import json
-from typing import List, Dict, Any, Callable
-from langchain_groq import ChatGroq
+from typing import List, Dict, Any, Callable, Awaitable, Optional, AsyncIterator, Tuple
 from langchain.prompts import ChatPromptTemplate
-from langchain.schema.output_parser import StrOutputParser
+from app.services.registry import ModelRegistry
+from app.services.routing import ModelRouter
+from app.services.schema_cache import SchemaCache
+from app.services.sql_validation import SQLValidator
 from app.utils.logger import get_logger, log_time
+from app.utils.metrics import SQL_VALIDATIONS
+from app.utils.prompt_encoding import encode_for_prompt, encode_rows, encoding_stats, estimate_tokens
+from app.utils.result_summary import summarize_rows
+from app.utils.stream import ThinkStripper
 import time
 
 # Set up logger
 logger = get_logger("llm")
 
+DATASET_SELECTION_PROMPT = ChatPromptTemplate.from_messages([
+    ("system", """
+    Você é um especialista em dados do Recife que analisa datasets disponíveis.
+
+    INSTRUÇÕES IMPORTANTES:
+    1. Identifique EXATAMENTE UM dataset que melhor responda à pergunta do usuário
+    2. Escolha APENAS O NOME EXATO da lista de datasets fornecida
+    3. NÃO invente nomes de datasets
+    4. Responda em formato único e preciso
+    5. VERIFIQUE SE O SEU DATASET ESTÁ DISPONÍVEL NA LISTA
+
+    Dataset recomendado: [nome_exato_do_dataset]
+    """),
+    ("human", "Pergunta: {query}\n\nDatasets disponíveis:\n{datasets}")
+])
+
+RESOURCE_SELECTION_PROMPT = ChatPromptTemplate.from_messages([
+    ("system", "Identifique o índice do recurso mais relevante para a pergunta. Responda apenas:\nResource index: [número do índice]"),
+    ("human", "Pergunta: {query}\n\nRecursos disponíveis:\n{resources}")
+])
+
+SQL_GENERATION_PROMPT = ChatPromptTemplate.from_messages([
+    ("system", """
+    Você é um especialista em SQL. Gere uma consulta SQL válida seguindo essas regras:
+
+    1. SEMPRE comece com SELECT
+    2. SEMPRE use aspas duplas para nomes de tabelas e campos
+    3. SEMPRE inclua o resource_id fornecido como FROM "resource_id"
+    4. SEMPRE especifique campos exatos
+    5. SEMPRE termine com LIMIT {limit}, a menos que a pergunta peça um número de resultados (ex.: "os 10 maiores")
+    6. SUA RESPOSTA DEVE SER APENAS A CONSULTA SQL, NADA MAIS
+    """),
+    ("human", """
+    Pergunta: {query}
+    Resource ID: {resource_id}
+    Campos disponíveis: {fields}
+    Exemplos de dados: {examples}
+
+    Gere APENAS a consulta SQL:
+    """)
+])
+
+SQL_REPAIR_PROMPT = ChatPromptTemplate.from_messages([
+    ("system", """
+    Você é um especialista em SQL (PostgreSQL). Corrija a consulta SQL informada para que ela execute sem erros.
+
+    1. Use apenas os campos disponíveis, com aspas duplas e exatamente como escritos
+    2. Mantenha FROM "resource_id" e o LIMIT da consulta original
+    3. Altere somente o necessário para corrigir o erro
+    4. SUA RESPOSTA DEVE SER APENAS A CONSULTA SQL CORRIGIDA, NADA MAIS
+    """),
+    ("human", """
+    Pergunta: {query}
+    Resource ID: {resource_id}
+    Campos disponíveis: {fields}
+    Consulta com erro: {sql}
+    Erro: {error}
+
+    Gere APENAS a consulta SQL corrigida:
+    """)
+])
+
+RESPONSE_PROMPT = ChatPromptTemplate.from_messages([
+    ("system", """
+    Você é um assistente oficial do Recife que responde perguntas com dados oficiais.
+
+    INSTRUÇÕES:
+    1. Responda diretamente à pergunta usando apenas os dados fornecidos
+    2. Destaque informações mais relevantes dos dados
+    3. Use linguagem clara e natural, como um funcionário municipal falaria
+    4. Inclua números específicos quando relevantes
+    5. Se os dados forem insuficientes, informe isso claramente
+    6. Quando houver um resumo estatístico, use-o para totais, contagens e médias; a amostra mostra só algumas linhas
+    """),
+    ("human", "Pergunta: {query}\n\nDados obtidos: {data}")
+])
+
+# Prompt and temperature of each stage; the model comes from the ModelRouter
+STAGES = {
+    "dataset_selection": (DATASET_SELECTION_PROMPT, 0),
+    "resource_selection": (RESOURCE_SELECTION_PROMPT, 0.2),
+    "sql_generation": (SQL_GENERATION_PROMPT, 0),
+    "sql_repair": (SQL_REPAIR_PROMPT, 0),
+    "response": (RESPONSE_PROMPT, 0.6),
+}
+
 class LLMService:
-    def __init__(self, groq_api_key: str):
-        self.groq_api_key = groq_api_key
-        self.model_name = "deepseek-r1-distill-llama-70b"
-        logger.info(f"LLMService initialized with model: {self.model_name}")
-    
+    def __init__(self, registry: ModelRegistry, schema_cache: Optional[SchemaCache] = None,
+                 max_cell_chars: int = 80, response_rows: int = 20, router: Optional[ModelRouter] = None,
+                 sql_validator: Optional[SQLValidator] = None, sql_repair: bool = True,
+                 summarize_results: bool = True, summary_sample_rows: int = 10):
+        self.registry = registry
+        self.sql_validator = sql_validator or SQLValidator()
+        self.sql_repair = sql_repair
+        self.schema_cache = schema_cache
+        self.max_cell_chars = max_cell_chars
+        self.response_rows = response_rows
+        self.summarize_results = summarize_results
+        self.summary_sample_rows = summary_sample_rows
+        self.router = router or ModelRouter("llama3-8b-8192", "deepseek-r1-distill-llama-70b")
+        logger.info("LLMService initialized with SQL model: %s", self.router.model_for('sql_generation'))
+
+    def _chain(self, stage: str, model_name: str):
+        prompt, temperature = STAGES[stage]
+        return self.registry.chain(f"llm.{stage}.{model_name}", prompt, model_name, temperature)
+
+    def warm_up(self):
+        """Build the chains of every stage for its routed model (and escalation target)."""
+        for stage in STAGES:
+            model_name = self.router.model_for(stage)
+            self._chain(stage, model_name)
+            escalation = self.router.escalation_for(stage, model_name)
+            if escalation:
+                self._chain(stage, escalation)
+
+    async def _arun_stage(self, stage: str, inputs: Dict[str, Any], parse: Callable[[str], Any]) -> Any:
+        return await self.router.ainvoke(stage, lambda model_name: self._chain(stage, model_name), inputs, parse)
+
     @log_time(logger)
-    def find_relevant_dataset(self, query: str, dataset_list: List[str]) -> Dict[str, Any]:
+    async def afind_relevant_dataset(self, query: str, dataset_list: List[Any]) -> Dict[str, Any]:
         if not dataset_list:
             logger.error("Failed to get datasets list")
             return {"error": "Falha ao obter datasets"}
-        
-        logger.info(f"Finding relevant dataset for query: '{query[:50]}...' among {len(dataset_list)} datasets")
-        
-        dataset_selection_template = ChatPromptTemplate.from_messages([
-            ("system", """
-            Você é um especialista em dados do Recife que analisa datasets disponíveis.
-            
-            INSTRUÇÕES IMPORTANTES:
-            1. Identifique EXATAMENTE UM dataset que melhor responda à pergunta do usuário
-            2. Escolha APENAS O NOME EXATO da lista de datasets fornecida
-            3. NÃO invente nomes de datasets
-            4. Responda em formato único e preciso
-            5. VERIFIQUE SE O SEU DATASET ESTÁ DISPONÍVEL NA LISTA
-            
-            Dataset recomendado: [nome_exato_do_dataset]
-            """),
-            ("human", "Pergunta: {query}\n\nDatasets disponíveis:\n{datasets}")
-        ])
-        
-        model = ChatGroq(api_key=self.groq_api_key, model_name=self.model_name, temperature=0)
-        chain = dataset_selection_template | model | StrOutputParser()
-        
+
+        logger.info("Finding relevant dataset for query: '%s...' among %s datasets", query[:50], len(dataset_list))
+        names = self._dataset_names(dataset_list)
+
         try:
             logger.info("Sending dataset selection request to LLM")
             start_time = time.time()
-            result = chain.invoke({
-                "query": query, 
-                "datasets": json.dumps(dataset_list[:100], ensure_ascii=False)
-            })
+            result = await self._arun_stage(
+                "dataset_selection", self._dataset_selection_inputs(query, dataset_list),
+                lambda text: self._parse_dataset_selection(text, names)
+            )
             elapsed = time.time() - start_time
-            logger.info(f"LLM dataset selection completed in {elapsed:.2f}s")
-            
-            logger.debug(f"LLM dataset selection raw result: {result}")
-            
-            selected_dataset = None
-            for line in result.split("\n"):
-                if "Dataset recomendado:" in line:
-                    selected_dataset = line.split(":", 1)[1].strip().replace('"', '') 
-                    break
-            
-            if selected_dataset:
-                logger.info(f"Selected dataset: {selected_dataset}")
-                return {"selected_dataset": selected_dataset}
-            else:
+            logger.info("LLM dataset selection completed in %.2fs", elapsed)
+
+            if result is None:
                 logger.error("Invalid response format from LLM for dataset selection")
                 return {"error": "Formato de resposta inválido"}
+            return result
         except Exception as e:
-            logger.exception(f"Exception finding dataset: {str(e)}")
+            logger.exception("Exception finding dataset: %s", e)
             return {"error": f"Erro: {str(e)}"}
-    
+
+    def _dataset_selection_inputs(self, query: str, dataset_list: List[Any]) -> Dict[str, Any]:
+        return {
+            "query": query,
+            "datasets": json.dumps(dataset_list[:100], ensure_ascii=False)
+        }
+
+    def _dataset_names(self, dataset_list: List[Any]) -> set:
+        return {d["name"] if isinstance(d, dict) else d for d in dataset_list[:100]}
+
+    def _parse_dataset_selection(self, result: str, names: set) -> Optional[Dict[str, Any]]:
+        logger.debug("LLM dataset selection raw result: %s", result)
+
+        selected_dataset = None
+        for line in result.split("\n"):
+            if "Dataset recomendado:" in line:
+                selected_dataset = line.split(":", 1)[1].strip().strip("[]").replace('"', '')
+                break
+
+        if selected_dataset not in names:
+            logger.warning("Dataset selection not in the offered list: %s", selected_dataset)
+            return None
+        logger.info("Selected dataset: %s", selected_dataset)
+        return {"selected_dataset": selected_dataset}
+
     @log_time(logger)
-    def find_relevant_resource_id(self, query: str, dataset_result: Dict[str, Any], 
-                                get_resource_list_fn: Callable) -> Dict[str, Any]:
+    async def afind_relevant_resource_id(self, query: str, dataset_result: Dict[str, Any],
+                                         get_resource_list_fn: Callable[[str], Awaitable[Optional[Dict[str, Any]]]]) -> Dict[str, Any]:
         if "error" in dataset_result or not dataset_result.get("selected_dataset"):
-            logger.error(f"Invalid dataset result: {dataset_result}")
+            logger.error("Invalid dataset result: %s", dataset_result)
             return {"error": "Dataset inválido ou não encontrado"}
-        
+
         dataset_name = dataset_result["selected_dataset"]
-        logger.info(f"Finding relevant resource ID for dataset: {dataset_name}")
-        
-        resource_info = get_resource_list_fn(dataset_name)
-        
+        logger.info("Finding relevant resource ID for dataset: %s", dataset_name)
+
+        resource_info = await get_resource_list_fn(dataset_name)
+        metadata = self._extract_resource_metadata(dataset_name, resource_info)
+        if "error" in metadata:
+            return metadata
+        if len(metadata) == 1:
+            return self._pick_resource(metadata, "resource_0")
+
+        logger.info("Multiple resources found (%s), selecting most relevant", len(metadata))
+        try:
+            logger.info("Sending resource selection request to LLM")
+            start_time = time.time()
+            result = await self._arun_stage(
+                "resource_selection", {"query": query, "resources": self._resources_prompt(metadata)},
+                lambda text: self._parse_resource_selection(text, metadata)
+            )
+            elapsed = time.time() - start_time
+            logger.info("LLM resource selection completed in %.2fs", elapsed)
+
+            if result is None:
+                logger.warning("Could not parse resource index, falling back to first resource")
+                return self._pick_resource(metadata, "resource_0")
+            return result
+        except Exception as e:
+            logger.exception("Exception selecting resource: %s", e)
+            logger.warning("Falling back to first resource after exception")
+            return self._pick_resource(metadata, "resource_0")
+
+    def _extract_resource_metadata(self, dataset_name: str, resource_info: Optional[Dict[str, Any]]) -> Dict[str, Any]:
         if not resource_info:
-            logger.error(f"No resources found for dataset: {dataset_name}")
+            logger.error("No resources found for dataset: %s", dataset_name)
             return {"error": f"Não foi possível obter recursos para {dataset_name}"}
-        
+
         # Extract metadata from resources
         metadata = {}
         if resource_info and resource_info.get('state') == 'active':
@@ -95,190 +235,255 @@ class LLMService:
                     'formato_dataset': resource.get('format', ''),
                     'nome_dataset': resource.get('name', ''),
                     'descricao_dataset': resource.get('description', ''),
-                    'tamanho_dataset': resource.get('size', '')
+                    'tamanho_dataset': resource.get('size', ''),
+                    'resource_version': resource.get('last_modified') or resource.get('metadata_modified')
                 }
-            
-            logger.info(f"Extracted metadata for {len(metadata)} resources")
-        
+
+            logger.info("Extracted metadata for %s resources", len(metadata))
+
         if not metadata:
             logger.error("Dataset inactive or no resources found")
             return {"error": "Dataset inativo ou sem recursos"}
-        
-        # If there's only one resource, return it directly
+
         if len(metadata) == 1:
-            resource_id = metadata["resource_0"]["resource_id"]
-            resource_name = metadata["resource_0"]["nome_dataset"]
-            logger.info(f"Only one resource found, using resource ID: {resource_id}")
-            return {
-                "resource_id": resource_id,
-                "resource_name": resource_name
-            }
-        
-        logger.info(f"Multiple resources found ({len(metadata)}), selecting most relevant")
-        
-        resource_selection_template = ChatPromptTemplate.from_messages([
-            ("system", "Identifique o índice do recurso mais relevante para a pergunta. Responda apenas:\nResource index: [número do índice]"),
-            ("human", "Pergunta: {query}\n\nRecursos disponíveis:\n{resources}")
-        ])
-        
-        model = ChatGroq(api_key=self.groq_api_key, model_name=self.model_name, temperature=0.2)
-        chain = resource_selection_template | model | StrOutputParser()
-        
-        try:
-            logger.info("Sending resource selection request to LLM")
-            start_time = time.time()
-            result = chain.invoke({"query": query, "resources": json.dumps(metadata, ensure_ascii=False)})
-            elapsed = time.time() - start_time
-            logger.info(f"LLM resource selection completed in {elapsed:.2f}s")
-            
-            logger.debug(f"LLM resource selection raw result: {result}")
-            
-            selected_index = None
-            for line in result.split("\n"):
-                if "Resource index:" in line:
-                    index = line.split(":", 1)[1].strip()
-                    resource_key = f"resource_{index.strip()}"
-                    if resource_key in metadata:
-                        resource_id = metadata[resource_key]["resource_id"]
-                        resource_name = metadata[resource_key]["nome_dataset"]
-                        logger.info(f"Selected resource: {resource_key} (ID: {resource_id})")
-                        return {
-                            "resource_id": resource_id,
-                            "resource_name": resource_name
-                        }
-            
-            # Fallback to first resource
-            logger.warning("Could not parse resource index, falling back to first resource")
-            return {
-                "resource_id": metadata["resource_0"]["resource_id"],
-                "resource_name": metadata["resource_0"]["nome_dataset"]
-            }
-        except Exception as e:
-            logger.exception(f"Exception selecting resource: {str(e)}")
-            logger.warning("Falling back to first resource after exception")
-            return {
-                "resource_id": metadata["resource_0"]["resource_id"],
-                "resource_name": metadata["resource_0"]["nome_dataset"]
-            }
-    
+            logger.info("Only one resource found, using resource ID: %s", metadata['resource_0']['resource_id'])
+
+        return metadata
+
+    def _resources_prompt(self, metadata: Dict[str, Any]) -> str:
+        # The version is only used for cache invalidation, keep it out of the prompt
+        resources = {
+            key: {k: v for k, v in resource.items() if k != 'resource_version'}
+            for key, resource in metadata.items()
+        }
+        return json.dumps(resources, ensure_ascii=False)
+
+    def _pick_resource(self, metadata: Dict[str, Any], resource_key: str) -> Dict[str, Any]:
+        return {
+            "resource_id": metadata[resource_key]["resource_id"],
+            "resource_name": metadata[resource_key]["nome_dataset"],
+            "resource_version": metadata[resource_key]["resource_version"]
+        }
+
+    def _parse_resource_selection(self, result: str, metadata: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        logger.debug("LLM resource selection raw result: %s", result)
+
+        for line in result.split("\n"):
+            if "Resource index:" in line:
+                index = line.split(":", 1)[1].strip()
+                resource_key = f"resource_{index.strip()}"
+                if resource_key in metadata:
+                    logger.info("Selected resource: %s (ID: %s)", resource_key, metadata[resource_key]['resource_id'])
+                    return self._pick_resource(metadata, resource_key)
+
+        logger.warning("Resource index missing or out of range")
+        return None
+
     @log_time(logger)
-    def generate_sql_query(self, query: str, resource_id: str, metadata: Dict[str, Any]) -> str:
+    async def agenerate_sql_query(self, query: str, resource_id: str, metadata: Optional[Dict[str, Any]] = None) -> str:
+        metadata = self._resolve_metadata(resource_id, metadata)
         field_names = [f.get("id", "") for f in metadata.get("resultados_campos", [])]
-        
-        logger.info(f"Generating SQL query for resource ID: {resource_id}")
-        logger.debug(f"Available fields: {field_names}")
-        
+
+        logger.info("Generating SQL query for resource ID: %s", resource_id)
+        logger.debug("Available fields: %s", field_names)
+
         if not field_names:
             logger.warning("No fields found, using fallback query")
-            fallback_query = f'SELECT * FROM "{resource_id}" LIMIT 100'
-            return fallback_query
-        
-        sql_generation_template = ChatPromptTemplate.from_messages([
-            ("system", """
-            Você é um especialista em SQL. Gere uma consulta SQL válida seguindo essas regras:
-            
-            1. SEMPRE comece com SELECT
-            2. SEMPRE use aspas duplas para nomes de tabelas e campos
-            3. SEMPRE inclua o resource_id fornecido como FROM "resource_id"
-            4. SEMPRE especifique campos exatos
-            5. SEMPRE termine com LIMIT 100
-            6. SUA RESPOSTA DEVE SER APENAS A CONSULTA SQL, NADA MAIS
-            """),
-            ("human", """
-            Pergunta: {query}
-            Resource ID: {resource_id}
-            Campos disponíveis: {fields}
-            Exemplos de dados: {examples}
-            
-            Gere APENAS a consulta SQL:
-            """)
-        ])
-        
-        model = ChatGroq(api_key=self.groq_api_key, model_name=self.model_name, temperature=0)
-        chain = sql_generation_template | model | StrOutputParser()
-        
+            return f'SELECT * FROM "{resource_id}" LIMIT {self.sql_validator.default_limit}'
+
         try:
             logger.info("Sending SQL generation request to LLM")
             start_time = time.time()
-            sql_query = chain.invoke({
-                "query": query,
-                "resource_id": resource_id,
-                "fields": json.dumps(field_names),
-                "examples": json.dumps(metadata.get("resultados_exemplos", []), ensure_ascii=False)
-            }).strip()
+            sql_query = await self._arun_stage(
+                "sql_generation", self._sql_generation_inputs(query, resource_id, field_names, metadata),
+                self._parse_sql_query
+            )
             elapsed = time.time() - start_time
-            logger.info(f"LLM SQL generation completed in {elapsed:.2f}s")
-            
-            logger.debug(f"Generated SQL query: {sql_query}")
-            
-            if not sql_query.upper().startswith("SELECT"):
-                logger.warning("Invalid SQL generated, using fallback")
-                fields_str = ', '.join([f'"{field}"' for field in field_names[:10]]) 
-                sql_query = f'SELECT {fields_str} FROM "{resource_id}" LIMIT 100'
-            
-            if f'FROM "{resource_id}"' not in sql_query:
-                logger.warning("Missing resource_id in FROM clause, fixing query")
-                sql_query = sql_query.replace('FROM ', f'FROM "{resource_id}" ')
-            
-            if "LIMIT" not in sql_query.upper():
-                logger.warning("Missing LIMIT clause, adding LIMIT 100")
-                sql_query += " LIMIT 100"
-
-            # Fix double resource_id
-            if f'FROM "{resource_id}" "resource_id"' in sql_query:
-                logger.warning("Double resource_id in FROM clause, fixing query")
-                sql_query = sql_query.replace(f'FROM "{resource_id}" "resource_id"', f'FROM "{resource_id}"')
-            
-            return sql_query
+            logger.info("LLM SQL generation completed in %.2fs", elapsed)
+
+            return await self._avalidated_sql(query, resource_id, metadata, sql_query)
         except Exception as e:
-            logger.exception(f"Exception in SQL generation: {str(e)}")
+            logger.exception("Exception in SQL generation: %s", e)
             logger.warning("Using fallback SQL query after exception")
-            fields_str = ', '.join([f'"{field}"' for field in field_names[:10]])
-            return f'SELECT {fields_str} FROM "{resource_id}" LIMIT 100'
-    
+            return self._fallback_sql_query(resource_id, field_names)
+
+    def _resolve_metadata(self, resource_id: str, metadata: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+        if metadata and metadata.get("resultados_campos"):
+            return metadata
+        if self.schema_cache is not None:
+            cached = self.schema_cache.get(resource_id)
+            if cached is not None:
+                logger.info("Using cached schema for resource ID: %s", resource_id)
+                return cached
+        return metadata or {}
+
+    def _sql_generation_inputs(self, query: str, resource_id: str, field_names: List[str],
+                               metadata: Dict[str, Any]) -> Dict[str, Any]:
+        return {
+            "query": query,
+            "resource_id": resource_id,
+            "fields": json.dumps(field_names),
+            "examples": encode_for_prompt("sql_generation", metadata.get("resultados_exemplos", []), self.max_cell_chars),
+            "limit": self.sql_validator.default_limit
+        }
+
+    def _parse_sql_query(self, result: str) -> Optional[str]:
+        sql_query = self._clean_response(result).replace("```sql", "").replace("```", "").strip()
+        return sql_query if sql_query.upper().startswith("SELECT") else None
+
+    def _fallback_sql_query(self, resource_id: str, field_names: List[str]) -> str:
+        fields_str = ', '.join([f'"{field}"' for field in field_names[:10]])
+        return f'SELECT {fields_str} FROM "{resource_id}" LIMIT {self.sql_validator.default_limit}'
+
+    async def _avalidated_sql(self, query: str, resource_id: str, metadata: Dict[str, Any],
+                              sql_query: Optional[str]) -> str:
+        fields = metadata.get("resultados_campos", [])
+        sql_query, error = self._check_sql(sql_query, resource_id, fields)
+        if error is None:
+            return sql_query
+
+        repaired = None
+        if self.sql_repair:
+            try:
+                model_name = self.router.model_for("sql_repair")
+                self.router.record_call("sql_repair", model_name)
+                repaired = await self._chain("sql_repair", model_name).ainvoke(
+                    self._sql_repair_inputs(query, resource_id, fields, sql_query, error)
+                )
+            except Exception as e:
+                logger.exception("Exception in SQL repair: %s", e)
+        return self._repaired_sql(repaired, resource_id, fields)
+
+    def _check_sql(self, sql_query: Optional[str], resource_id: str,
+                   fields: List[Dict[str, Any]]) -> Tuple[Optional[str], Optional[str]]:
+        logger.debug("Generated SQL query: %s", sql_query)
+        if not sql_query:
+            return None, "A resposta não contém um SELECT"
+
+        fixed, error = self.sql_validator.validate(sql_query, resource_id, fields)
+        if error is None:
+            SQL_VALIDATIONS.labels("valid" if fixed == sql_query else "fixed").inc()
+            if fixed != sql_query:
+                logger.info("SQL fixed locally: %s", fixed)
+        else:
+            logger.warning("Generated SQL failed local validation: %s", error)
+        return fixed, error
+
+    def _sql_repair_inputs(self, query: str, resource_id: str, fields: List[Dict[str, Any]],
+                           sql_query: Optional[str], error: str) -> Dict[str, Any]:
+        return {
+            "query": query,
+            "resource_id": resource_id,
+            "fields": json.dumps([f.get("id", "") for f in fields]),
+            "sql": sql_query or "(vazia)",
+            "error": error
+        }
+
+    def _repaired_sql(self, repaired: Optional[str], resource_id: str, fields: List[Dict[str, Any]]) -> str:
+        sql_query = self._parse_sql_query(repaired) if repaired else None
+        if sql_query:
+            sql_query, error = self.sql_validator.validate(sql_query, resource_id, fields)
+            if error is None:
+                logger.info("SQL repaired by LLM: %s", sql_query)
+                SQL_VALIDATIONS.labels("repaired").inc()
+                return sql_query
+            logger.warning("Repaired SQL still invalid: %s", error)
+
+        logger.warning("Using fallback SQL query after failed validation")
+        SQL_VALIDATIONS.labels("fallback").inc()
+        return self._fallback_sql_query(resource_id, [f.get("id", "") for f in fields])
+
     @log_time(logger)
-    def generate_response(self, query: str, data: List[Dict[str, Any]]) -> str:
-        logger.info(f"Generating response for query with {len(data)} data points")
-        
+    async def agenerate_response(self, query: str, data: List[Dict[str, Any]], summary: Optional[str] = None) -> str:
+        logger.info("Generating response for query with %s data points", len(data))
+
         if not data:
             logger.warning("No data available for response generation")
             return "Não foi possível encontrar dados relevantes para responder à sua pergunta."
-        
-        response_template = ChatPromptTemplate.from_messages([
-            ("system", """
-            Você é um assistente oficial do Recife que responde perguntas com dados oficiais.
-            
-            INSTRUÇÕES:
-            1. Responda diretamente à pergunta usando apenas os dados fornecidos
-            2. Destaque informações mais relevantes dos dados
-            3. Use linguagem clara e natural, como um funcionário municipal falaria
-            4. Inclua números específicos quando relevantes
-            5. Se os dados forem insuficientes, informe isso claramente
-            """),
-            ("human", "Pergunta: {query}\n\nDados obtidos: {data}")
-        ])
-        
-        model = ChatGroq(api_key=self.groq_api_key, model_name=self.model_name, temperature=0.6)
-        chain = response_template | model | StrOutputParser()
-        
+
         try:
             logger.info("Sending response generation request to LLM")
             start_time = time.time()
-            response = chain.invoke({
-                "query": query,
-                "data": json.dumps(data[:20], ensure_ascii=False)
-            })
+            response = await self._arun_stage("response", self._response_inputs(query, data, summary), self._parse_response)
             elapsed = time.time() - start_time
-            logger.info(f"LLM response generation completed in {elapsed:.2f}s")
-            
-            # Clean response
-            response = self._clean_response(response)
-            
-            return response
+            logger.info("LLM response generation completed in %.2fs", elapsed)
+
+            return response or self._fallback_response(data)
         except Exception as e:
-            logger.exception(f"Exception generating response: {str(e)}")
-            return f"Com base nos dados obtidos: {json.dumps(data[:5], indent=2, ensure_ascii=False)}"
-    
+            logger.exception("Exception generating response: %s", e)
+            return self._fallback_response(data)
+
+    async def astream_response(self, query: str, data: List[Dict[str, Any]],
+                               summary: Optional[str] = None) -> AsyncIterator[str]:
+        """Streams the answer tokens with <think> blocks removed on the fly."""
+        logger.info("Streaming response for query with %s data points", len(data))
+
+        if not data:
+            logger.warning("No data available for response generation")
+            yield "Não foi possível encontrar dados relevantes para responder à sua pergunta."
+            return
+
+        model_name = self.router.model_for("response")
+        chain = self._chain("response", model_name)
+        self.router.record_call("response", model_name)
+        stripper = ThinkStripper()
+        emitted = False
+
+        try:
+            start_time = time.time()
+            async for chunk in chain.astream(self._response_inputs(query, data, summary)):
+                text = stripper.feed(chunk)
+                if text:
+                    emitted = True
+                    yield text
+            text = stripper.flush()
+            if text:
+                yield text
+            logger.info("LLM response streaming completed in %.2fs", time.time() - start_time)
+        except Exception as e:
+            logger.exception("Exception streaming response: %s", e)
+            if not emitted:
+                yield self._fallback_response(data)
+
+    def needs_summary(self, data: List[Dict[str, Any]]) -> bool:
+        return self.summarize_results and len(data) > self.response_rows
+
+    def _response_inputs(self, query: str, data: List[Dict[str, Any]], summary: Optional[str] = None) -> Dict[str, Any]:
+        if self.needs_summary(data):
+            return {"query": query, "data": self._summarized_data(data, summary)}
+
+        rows = data[:self.response_rows]
+        table = encode_for_prompt("response", rows, self.max_cell_chars)
+        if len(data) > len(rows):
+            table = f"({len(rows)} de {len(data)} linhas)\n{table}"
+        return {"query": query, "data": table}
+
+    def _summarized_data(self, data: List[Dict[str, Any]], summary: Optional[str] = None) -> str:
+        # Statistics over every row plus a small sample; prompt size no longer grows with the result.
+        # ``summary`` covers the full result beyond the query's LIMIT when the pipeline paged through it
+        sample = data[:self.summary_sample_rows]
+        if summary is None:
+            summary = f"Resumo estatístico de todas as {len(data)} linhas:\n{summarize_rows(data)}"
+        else:
+            summary = f"Resumo estatístico do resultado completo:\n{summary}"
+        text = (
+            f"{summary}\n\n"
+            f"Amostra ({len(sample)} de {len(data)} linhas):\n{encode_rows(sample, self.max_cell_chars)}"
+        )
+        # Baseline extrapolated from the sample: serialising every row would cost what the summary saves
+        sample_tokens = estimate_tokens(json.dumps(sample, ensure_ascii=False, default=str))
+        encoding_stats.record_tokens(
+            "response_summary", sample_tokens * len(data) // max(len(sample), 1), estimate_tokens(text)
+        )
+        return text
+
+    def _fallback_response(self, data: List[Dict[str, Any]]) -> str:
+        return f"Com base nos dados obtidos: {json.dumps(data[:5], indent=2, ensure_ascii=False, default=str)}"
+
+    def _parse_response(self, result: str) -> Optional[str]:
+        # An empty answer (e.g. only a <think> block) is worth a retry on the large model
+        return self._clean_response(result).strip() or None
+
     def _clean_response(self, text: str) -> str:
         import re
-        return re.sub(r'<think>.*?</think>', '', text, flags=re.DOTALL)
\ No newline at end of file
+        return re.sub(r'<think>.*?</think>', '', text, flags=re.DOTALL)
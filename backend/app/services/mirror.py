@@ -0,0 +1,234 @@
+import asyncio
+import datetime
+import json
+import os
+import re
+import threading
+import time
+import duckdb
+import pandas as pd
+from typing import Iterator, List, Dict, Any, Optional
+from app.services.ckan import CKANClient
+from app.utils.logger import get_logger, log_time
+
+logger = get_logger("mirror")
+
+NUMERIC_TYPES = {'int', 'int4', 'int8', 'integer', 'bigint', 'numeric', 'float', 'float8', 'double precision'}
+TIMESTAMP_TYPES = {'timestamp', 'date'}
+TABLE_REFERENCE = re.compile(r'\b(?:from|join)\s+"([^"]+)"', re.IGNORECASE)
+
+class ResourceMirror:
+    """Local columnar copy of datastore-active DataHub resources.
+
+    The sync job downloads each resource through datastore_search into one
+    Parquet file per resource id and records its version in a manifest;
+    ``execute`` runs SQL written for datastore_search_sql against those files
+    with an embedded DuckDB, returning None whenever it can't answer locally so
+    the caller can fall back to the remote API. A resource whose mirrored
+    version differs from the version the caller expects is not answered
+    locally until the next sync. Dates and timestamps come back as ISO strings,
+    like they do from datastore_search_sql.
+    """
+
+    def __init__(self, ckan_client: CKANClient, directory: str = "mirror",
+                 max_rows: int = 500_000, page_size: int = 10_000):
+        self.ckan = ckan_client
+        self.directory = os.path.abspath(directory)
+        self.max_rows = max_rows
+        self.page_size = page_size
+        self.manifest_path = os.path.join(self.directory, "manifest.json")
+        self._manifest: Dict[str, Dict[str, Any]] = {}
+        self._manifest_mtime: Optional[float] = None
+        self._lock = threading.Lock()
+        os.makedirs(self.directory, exist_ok=True)
+        self._load_manifest()
+        logger.info("ResourceMirror initialized at %s with %s resources", self.directory, len(self._manifest))
+
+    def _load_manifest(self):
+        # The sync job may run in another process, so pick up its writes lazily
+        try:
+            mtime = os.path.getmtime(self.manifest_path)
+        except OSError:
+            return
+        if mtime == self._manifest_mtime:
+            return
+        with open(self.manifest_path, encoding="utf-8") as f:
+            self._manifest = json.load(f)
+        self._manifest_mtime = mtime
+
+    def _save_manifest(self):
+        tmp_path = f"{self.manifest_path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self._manifest, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, self.manifest_path)
+        self._manifest_mtime = os.path.getmtime(self.manifest_path)
+
+    def _parquet_path(self, resource_id: str) -> str:
+        return os.path.join(self.directory, f"{resource_id}.parquet")
+
+    def has(self, resource_id: str, version: Optional[str] = None) -> bool:
+        self._load_manifest()
+        entry = self._manifest.get(resource_id)
+        if entry is None or not os.path.exists(self._parquet_path(resource_id)):
+            return False
+        if version is not None and entry.get('version') != version:
+            logger.info("Mirror of %s is outdated (%s != %s)", resource_id, entry.get('version'), version)
+            return False
+        return True
+
+    @log_time(logger)
+    async def sync(self, packages: List[Dict[str, Any]]) -> Dict[str, int]:
+        stats = {"synced": 0, "unchanged": 0, "skipped": 0, "failed": 0}
+        for package in packages:
+            for resource in package.get('resources', []):
+                if not resource.get('datastore_active'):
+                    continue
+                resource_id = resource['id']
+                version = resource.get('last_modified') or resource.get('metadata_modified')
+                entry = self._manifest.get(resource_id)
+                if entry and entry.get('version') == version and self.has(resource_id):
+                    stats["unchanged"] += 1
+                    continue
+                try:
+                    rows = await self._sync_resource(resource_id)
+                except Exception as e:
+                    logger.exception("Exception mirroring resource %s: %s", resource_id, e)
+                    stats["failed"] += 1
+                    continue
+                if rows is None:
+                    stats["skipped"] += 1
+                    continue
+                with self._lock:
+                    self._manifest[resource_id] = {"version": version, "rows": rows, "synced_at": time.time()}
+                    self._save_manifest()
+                stats["synced"] += 1
+        logger.info("Mirror sync finished: %s", stats)
+        return stats
+
+    async def _sync_resource(self, resource_id: str) -> Optional[int]:
+        records, fields = [], []
+        while True:
+            response = await self.ckan.arequest('datastore_search', params={
+                'resource_id': resource_id, 'limit': self.page_size, 'offset': len(records)
+            })
+            response.raise_for_status()
+            result = response.json().get('result', {})
+            if result.get('total', 0) > self.max_rows:
+                logger.warning("Resource %s has %s rows, above the mirror limit", resource_id, result['total'])
+                return None
+            fields = fields or result.get('fields', [])
+            page = result.get('records', [])
+            records.extend(page)
+            if len(page) < self.page_size:
+                break
+
+        # Building the frame and writing Parquet block, so they run on a worker thread
+        return await asyncio.to_thread(self._write_resource, resource_id, records, fields)
+
+    def _write_resource(self, resource_id: str, records: List[Dict[str, Any]], fields: List[Dict[str, Any]]) -> int:
+        frame = self._to_frame(records, fields)
+        tmp_path = f"{self._parquet_path(resource_id)}.tmp"
+        frame.to_parquet(tmp_path, index=False)
+        os.replace(tmp_path, self._parquet_path(resource_id))
+        logger.info("Mirrored resource %s with %s rows", resource_id, len(frame))
+        return len(frame)
+
+    def _to_frame(self, records: List[Dict[str, Any]], fields: List[Dict[str, Any]]) -> pd.DataFrame:
+        columns = [f['id'] for f in fields if f.get('id') != '_full_text']
+        frame = pd.DataFrame.from_records(records, columns=columns)
+        # Keep the datastore column types so aggregates behave like in PostgreSQL
+        for field in fields:
+            column, field_type = field.get('id'), (field.get('type') or '').lower()
+            if column not in frame.columns:
+                continue
+            if field_type in NUMERIC_TYPES:
+                frame[column] = pd.to_numeric(frame[column], errors='coerce')
+            elif field_type in TIMESTAMP_TYPES:
+                frame[column] = pd.to_datetime(frame[column], errors='coerce')
+            else:
+                frame[column] = frame[column].astype('string')
+        return frame
+
+    def can_execute(self, sql: str, resource_version: Optional[str] = None) -> bool:
+        """Whether every table in ``sql`` is mirrored, at ``resource_version`` when given.
+
+        Generated SQL reads a single resource, so the version applies to all tables.
+        """
+        tables = set(TABLE_REFERENCE.findall(sql))
+        return bool(tables) and all(self.has(table, resource_version) for table in tables)
+
+    def execute(self, sql: str, resource_version: Optional[str] = None) -> Optional[List[Dict[str, Any]]]:
+        if not self.can_execute(sql, resource_version):
+            return None
+
+        try:
+            connection = self._connect(sql)
+            try:
+                cursor = connection.execute(sql)
+                columns = [column[0] for column in cursor.description]
+                return [self._record(columns, row) for row in cursor.fetchall()]
+            finally:
+                connection.close()
+        except Exception as e:
+            logger.warning("Local execution failed, falling back to remote: %s", e)
+            return None
+
+    def iter_batches(self, sql: str, batch_size: int = 10_000) -> Iterator[List[Dict[str, Any]]]:
+        """Yield the result of ``sql`` in batches without materialising it; check ``can_execute`` first."""
+        connection = self._connect(sql)
+        try:
+            cursor = connection.execute(sql)
+            columns = [column[0] for column in cursor.description]
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    break
+                yield [self._record(columns, row) for row in rows]
+        finally:
+            connection.close()
+
+    def _record(self, columns: List[str], row: tuple) -> Dict[str, Any]:
+        # DuckDB returns datetime objects; the rest of the pipeline expects JSON values
+        return {
+            column: value.isoformat() if isinstance(value, (datetime.date, datetime.time)) else value
+            for column, value in zip(columns, row)
+        }
+
+    def _connect(self, sql: str):
+        connection = duckdb.connect()
+        try:
+            statements = connection.extract_statements(sql)
+            if len(statements) != 1 or statements[0].type != duckdb.StatementType.SELECT:
+                raise ValueError("Refusing to run a non-SELECT statement on the local mirror")
+            self._sandbox(connection, set(TABLE_REFERENCE.findall(sql)))
+        except Exception:
+            connection.close()
+            raise
+        return connection
+
+    def _sandbox(self, connection, tables):
+        # Generated SQL must only see the mirrored resources, never the filesystem
+        for table in tables:
+            path = self._parquet_path(table).replace("'", "''")
+            name = table.replace('"', '""')
+            connection.execute(f"CREATE VIEW \"{name}\" AS SELECT * FROM read_parquet('{path}')")
+        connection.execute(f"SET allowed_directories=['{self.directory}/']")
+        connection.execute("SET enable_external_access=false")
+        connection.execute("SET lock_configuration=true")
+
+if __name__ == "__main__":
+    from dotenv import load_dotenv
+    from app.config import get_settings
+    from app.services.database import DatabaseService
+
+    async def main():
+        settings = get_settings()
+        ckan_client = CKANClient(settings.API_URL, timeout=settings.CKAN_SQL_TIMEOUT, max_retries=settings.CKAN_MAX_RETRIES)
+        mirror = ResourceMirror(ckan_client, settings.MIRROR_PATH, settings.MIRROR_MAX_ROWS, settings.MIRROR_PAGE_SIZE)
+        try:
+            await mirror.sync(await DatabaseService(ckan_client).aget_package_details())
+        finally:
+            await ckan_client.aclose()
+
+    load_dotenv()
+    asyncio.run(main())
@@ -1,38 +1,214 @@
-import requests
-from typing import List, Dict, Any
+import asyncio
+import re
+from typing import AsyncIterator, List, Dict, Any, Optional, Tuple
+from app.services.ckan import CKANClient
+from app.services.mirror import ResourceMirror
+from app.services.result_cache import SQLResultCache, canonicalize_sql
+from app.services.sql_validation import TRAILING_LIMIT
 from app.utils.logger import get_logger, log_time
+from app.utils.singleflight import SingleFlight
 import time
 
 # Set up logger
 logger = get_logger("query")
 
+TRAILING_OFFSET = re.compile(r"\boffset\s+(\d+)\s*$", re.IGNORECASE)
+# Queries whose rows have no stable order of their own and can be ordered by the datastore "_id"
+UNORDERED_PLAIN_SELECT = re.compile(
+    r"\b(?:order\s+by|group\s+by|distinct|having|union|count|sum|avg|min|max)\b", re.IGNORECASE
+)
+
+class ResultTruncatedError(RuntimeError):
+    """A page of a paginated fetch failed; the batches yielded so far are incomplete."""
+
 class QueryService:
-    def __init__(self, api_url: str):
-        self.api_url = api_url
-        logger.info(f"QueryService initialized with API URL: {api_url}")
-    
+    def __init__(self, ckan_client: CKANClient, result_cache: Optional[SQLResultCache] = None,
+                 mirror: Optional[ResourceMirror] = None, execution_mode: str = "remote",
+                 page_size: int = 5000, default_limit: Optional[int] = None):
+        self.ckan = ckan_client
+        self.result_cache = result_cache
+        self.mirror = mirror
+        self.execution_mode = execution_mode
+        self.page_size = page_size
+        # The LIMIT the SQL generator adds when the question asks for no row count
+        self.default_limit = default_limit
+        self._flights = SingleFlight("SQL")
+        logger.info("QueryService initialized with API URL: %s (execution mode: %s)", ckan_client.api_url, execution_mode)
+
+    def _use_mirror(self) -> bool:
+        return self.execution_mode == "local" and self.mirror is not None
+
+    def _local_records(self, sql: str, resource_version: Optional[str],
+                       records: Optional[List[Dict[str, Any]]]) -> Optional[List[Dict[str, Any]]]:
+        if records is None:
+            return None
+        logger.info("Query answered from local mirror with %s records", len(records))
+        if self.result_cache is not None:
+            self.result_cache.put(sql, resource_version, records)
+        return records
+
     @log_time(logger)
-    def execute_sql_on_resource_id(self, sql: str) -> List[Dict[str, Any]]:
+    async def aexecute_sql_on_resource_id(self, sql: str, resource_version: Optional[str] = None) -> List[Dict[str, Any]]:
+        cached = self._cached_records(sql, resource_version)
+        if cached is not None:
+            return cached
+
+        # Same key as the result cache, so equivalent SQL shares one execution
+        return await self._flights.do(
+            (canonicalize_sql(sql), resource_version), self._aexecute, sql, resource_version
+        )
+
+    async def _aexecute(self, sql: str, resource_version: Optional[str]) -> List[Dict[str, Any]]:
+        if self._use_mirror():
+            local = await asyncio.to_thread(self.mirror.execute, sql, resource_version)
+            records = self._local_records(sql, resource_version, local)
+            if records is not None:
+                return records
+
         try:
             query_id = f"q-{int(time.time())}"
-            logger.info(f"Executing SQL query [ID: {query_id}]")
-            logger.debug(f"SQL query [ID: {query_id}]: {sql}")
-            
+            logger.info("Executing SQL query [ID: %s]", query_id)
+            logger.debug("SQL query [ID: %s]: %s", query_id, sql)
+
             start_time = time.time()
-            response = requests.get(f'{self.api_url}/datastore_search_sql?sql={sql}')
+            response = await self.ckan.asql(sql)
             elapsed = time.time() - start_time
-            
-            logger.info(f"Query [ID: {query_id}] HTTP response in {elapsed:.2f}s with status: {response.status_code}")
-            
-            response_json = response.json()
-            
-            if 'result' in response_json and 'records' in response_json['result']:
-                records = response_json['result']['records']
-                logger.info(f"Query [ID: {query_id}] returned {len(records)} records")
-                return records
-            else:
-                logger.error(f"API error response for query [ID: {query_id}]: {response_json}")
-                return []
+
+            logger.info("Query [ID: %s] HTTP response in %.2fs with status: %s", query_id, elapsed, response.status_code)
+
+            return self._parse_records(query_id, response.json(), sql, resource_version)
         except Exception as e:
-            logger.exception(f"Error executing SQL: {str(e)}")
-            return []
\ No newline at end of file
+            logger.exception("Error executing SQL: %s", e)
+            return []
+
+    def _cached_records(self, sql: str, resource_version: Optional[str]) -> Optional[List[Dict[str, Any]]]:
+        if self.result_cache is None:
+            return None
+        records = self.result_cache.get(sql, resource_version)
+        if records is not None:
+            logger.info("SQL result cache hit with %s records", len(records))
+        return records
+
+    def _parse_records(self, query_id: str, response_json: Dict[str, Any],
+                       sql: str, resource_version: Optional[str]) -> List[Dict[str, Any]]:
+        if 'result' in response_json and 'records' in response_json['result']:
+            records = response_json['result']['records']
+            logger.info("Query [ID: %s] returned %s records", query_id, len(records))
+            if self.result_cache is not None:
+                self.result_cache.put(sql, resource_version, records)
+            return records
+        else:
+            logger.error("API error response for query [ID: %s]: %s", query_id, response_json)
+            return []
+
+    def _trailing_bounds(self, sql: str) -> Tuple[str, int, Optional[int]]:
+        """Split ``sql`` into the query without its trailing LIMIT/OFFSET, the offset and the limit."""
+        base, start, limit = sql.strip().rstrip(";"), 0, None
+        match = TRAILING_LIMIT.search(base)
+        if match:
+            limit = int(match.group(1))
+            start = int(match.group(2).split()[-1]) if match.group(2) else 0
+            base = base[:match.start()].rstrip()
+        else:
+            offset = TRAILING_OFFSET.search(base)
+            if offset:
+                start = int(offset.group(1))
+                base = base[:offset.start()].rstrip()
+        return base, start, limit
+
+    def has_default_limit(self, sql: str) -> bool:
+        """Whether the only bound on ``sql`` is the generator's default LIMIT, not a row count the user asked for."""
+        _, start, limit = self._trailing_bounds(sql)
+        return self.default_limit is not None and limit == self.default_limit and start == 0
+
+    def has_more_rows(self, sql: str, records: List[Dict[str, Any]]) -> bool:
+        """Whether ``records`` filled the default LIMIT of ``sql``, so the full result may be larger.
+
+        A LIMIT written for the question (e.g. a top 10) is the answer itself and never counts.
+        """
+        return self.has_default_limit(sql) and len(records) >= self.default_limit
+
+    def _paged_query(self, sql: str, max_rows: Optional[int],
+                     full_result: bool = False) -> Tuple[str, int, Optional[int]]:
+        """Return a query with a stable row order to page over, the start offset and a row cap.
+
+        With ``full_result`` a default LIMIT (see has_default_limit) is dropped
+        and only ``max_rows`` bounds the fetch; any other LIMIT is kept.
+        """
+        base, start, limit = self._trailing_bounds(sql)
+        if full_result and self.has_default_limit(sql):
+            limit = None
+
+        # OFFSET pages are only consistent over a stable order
+        if not UNORDERED_PLAIN_SELECT.search(base):
+            base = f'{base} ORDER BY "_id"'
+        else:
+            # Grouped, sorted or aggregated rows have no "_id": the query keeps its own
+            # bounds inside and the pages are taken over its rows ordered as a whole
+            inner = base if limit is None else self._page_sql(base, start, limit)
+            base, start = f"SELECT * FROM ({inner}) AS paged ORDER BY paged", 0
+        if max_rows is not None:
+            limit = max_rows if limit is None else min(limit, max_rows)
+        return base, start, limit
+
+    def _page_sql(self, base: str, offset: int, size: int) -> str:
+        return f"{base} LIMIT {size} OFFSET {offset}"
+
+    def _mirror_sql(self, base: str, offset: int, limit: Optional[int]) -> str:
+        # DuckDB streams the whole result itself, only the caller's bounds apply
+        if limit is not None:
+            return self._page_sql(base, offset, limit)
+        return f"{base} OFFSET {offset}" if offset else base
+
+    async def aiter_sql_batches(self, sql: str, max_rows: Optional[int] = None, page_size: Optional[int] = None,
+                                resource_version: Optional[str] = None,
+                                full_result: bool = False) -> AsyncIterator[List[Dict[str, Any]]]:
+        """Yield the rows of ``sql`` in batches of at most ``page_size``.
+
+        The query is paged with LIMIT/OFFSET, honouring its own LIMIT and
+        OFFSET and ``max_rows``, so only one page is held in memory at a time
+        however large the result is. Bypasses the result cache; on the local
+        mirror (at ``resource_version``) DuckDB streams the batches directly.
+        Raises ResultTruncatedError if a page fails after the first one, so a
+        partial result is never mistaken for a complete one.
+        """
+        page_size = page_size or self.page_size
+        base, offset, limit = self._paged_query(sql, max_rows, full_result)
+
+        if self._use_mirror() and self.mirror.can_execute(sql, resource_version):
+            batches = self.mirror.iter_batches(self._mirror_sql(base, offset, limit), page_size)
+            yielded = False
+            try:
+                # DuckDB blocks, so each batch is pulled on a worker thread
+                while (batch := await asyncio.to_thread(next, batches, None)) is not None:
+                    yielded = True
+                    yield batch
+                return
+            except Exception as e:
+                if yielded:
+                    raise
+                logger.warning("Local paged execution failed, falling back to remote: %s", e)
+            finally:
+                batches.close()
+
+        fetched = 0
+        while limit is None or fetched < limit:
+            size = page_size if limit is None else min(page_size, limit - fetched)
+            try:
+                response = await self.ckan.asql(self._page_sql(base, offset + fetched, size))
+                records = self._page_records(response.json())
+            except Exception as e:
+                logger.exception("Error fetching SQL page at offset %s: %s", offset + fetched, e)
+                raise ResultTruncatedError(f"Page at offset {offset + fetched} failed after {fetched} rows") from e
+            if records:
+                yield records
+            fetched += len(records)
+            if len(records) < size:
+                break
+        logger.info("Paged SQL fetch returned %s records", fetched)
+
+    def _page_records(self, response_json: Dict[str, Any]) -> List[Dict[str, Any]]:
+        result = response_json.get('result')
+        if not isinstance(result, dict) or 'records' not in result:
+            raise ValueError(f"API error response: {response_json}")
+        return result['records']
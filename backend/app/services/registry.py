@@ -0,0 +1,78 @@
+import threading
+import httpx
+from typing import Dict, Optional, Tuple
+from langchain_groq import ChatGroq
+from langchain.prompts import ChatPromptTemplate
+from langchain.schema.output_parser import StrOutputParser
+from langchain_core.runnables import Runnable
+from app.services.scheduler import LANE_HEADER, AsyncScheduledTransport, LLMScheduler
+from app.utils.logger import get_logger
+from app.utils.metrics import LLMMetricsHandler
+
+logger = get_logger("registry")
+
+class ModelRegistry:
+    """Process-wide cache of chat model clients and prompt chains.
+
+    Each ChatGroq client is built once per (model name, temperature, lane) and
+    every client shares the same async HTTP connection pool; chains are
+    built once per key and reused across requests.
+    """
+
+    def __init__(self, groq_api_key: str, max_connections: int = 100, max_keepalive: int = 20,
+                 request_timeout: float = 60.0, scheduler: Optional[LLMScheduler] = None):
+        self.groq_api_key = groq_api_key
+        self.request_timeout = request_timeout
+        self.scheduler = scheduler
+        limits = httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_keepalive)
+        if scheduler is None:
+            self.http_async_client = httpx.AsyncClient(limits=limits, timeout=request_timeout)
+        else:
+            # Every model call passes the shared rate limits and priority queue on its way out
+            self.http_async_client = httpx.AsyncClient(
+                transport=AsyncScheduledTransport(httpx.AsyncHTTPTransport(limits=limits), scheduler),
+                timeout=request_timeout
+            )
+        self._models: Dict[Tuple[str, float, str], ChatGroq] = {}
+        self._chains: Dict[str, Runnable] = {}
+        self._lock = threading.Lock()
+        logger.info("ModelRegistry initialized with pool: %s", max_connections)
+
+    def model(self, model_name: str, temperature: float, lane: str = "query") -> ChatGroq:
+        key = (model_name, temperature, lane)
+        model = self._models.get(key)
+        if model is None:
+            with self._lock:
+                model = self._models.get(key)
+                if model is None:
+                    logger.info("Building model client: %s (temperature: %s, lane: %s)", model_name, temperature, lane)
+                    model = ChatGroq(
+                        api_key=self.groq_api_key,
+                        model_name=model_name,
+                        temperature=temperature,
+                        request_timeout=self.request_timeout,
+                        # The scheduler already retries 429s after Retry-After; SDK retries would multiply them
+                        max_retries=0 if self.scheduler is not None else 2,
+                        http_async_client=self.http_async_client,
+                        callbacks=[LLMMetricsHandler(model_name)],
+                        default_headers={LANE_HEADER: lane}
+                    )
+                    self._models[key] = model
+        return model
+
+    def chain(self, key: str, prompt: ChatPromptTemplate, model_name: str, temperature: float,
+              lane: str = "query") -> Runnable:
+        """Chain cached under ``key``; ``lane`` is its priority in the LLMScheduler (chat, query, background)."""
+        chain = self._chains.get(key)
+        if chain is None:
+            model = self.model(model_name, temperature, lane)
+            with self._lock:
+                chain = self._chains.get(key)
+                if chain is None:
+                    logger.info("Building chain: %s", key)
+                    chain = prompt | model | StrOutputParser()
+                    self._chains[key] = chain
+        return chain
+
+    async def aclose(self):
+        await self.http_async_client.aclose()
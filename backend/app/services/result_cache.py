@@ -0,0 +1,77 @@
+import json
+import re
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+from cachetools import TTLCache
+from app.utils.logger import get_logger
+from app.utils.metrics import record_cache
+
+logger = get_logger("result_cache")
+
+_SQL_TOKEN = re.compile(r'"(?:[^"]|"")*"|\'(?:[^\']|\'\')*\'|\s+|[^\s"\']+')
+
+def canonicalize_sql(sql: str) -> str:
+    """Collapse whitespace and fold case outside quoted identifiers and literals."""
+    parts = []
+    for token in _SQL_TOKEN.findall(sql.strip().rstrip(';').strip()):
+        if token[0] in ('"', "'"):
+            parts.append(token)
+        elif token.isspace():
+            parts.append(' ')
+        else:
+            parts.append(token.lower())
+    return ''.join(parts)
+
+def _record_size(value: Tuple[List[Dict[str, Any]], int]) -> int:
+    return value[1]
+
+class SQLResultCache:
+    """LRU cache of datastore_search_sql results bounded by an approximate byte budget.
+
+    Keys combine the canonical SQL text with the resource version, so a new
+    version of the resource never serves old rows.
+    """
+
+    def __init__(self, max_bytes: int = 64 * 1024 * 1024, ttl: float = 1800):
+        self.max_bytes = max_bytes
+        self._entries = TTLCache(maxsize=max_bytes, ttl=ttl, getsizeof=_record_size)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        logger.info("SQLResultCache initialized with budget: %s bytes, TTL: %ss", max_bytes, ttl)
+
+    def _key(self, sql: str, resource_version: Optional[str]) -> Tuple[str, Optional[str]]:
+        return canonicalize_sql(sql), resource_version
+
+    def get(self, sql: str, resource_version: Optional[str] = None) -> Optional[List[Dict[str, Any]]]:
+        with self._lock:
+            value = self._entries.get(self._key(sql, resource_version))
+            record_cache("sql_result", value is not None)
+            if value is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            return value[0]
+
+    def put(self, sql: str, resource_version: Optional[str], records: List[Dict[str, Any]]):
+        size = len(json.dumps(records, ensure_ascii=False, default=str).encode('utf-8'))
+        if size > self.max_bytes:
+            logger.info("Result of %s bytes exceeds the cache budget, not caching", size)
+            return
+        with self._lock:
+            self._entries[self._key(sql, resource_version)] = (records, size)
+
+    @property
+    def current_bytes(self) -> int:
+        return self._entries.currsize
+
+    def stats(self) -> Dict[str, Any]:
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / total if total else 0.0,
+            "entries": len(self._entries),
+            "bytes": self.current_bytes,
+            "max_bytes": self.max_bytes
+        }
@@ -0,0 +1,101 @@
+import math
+import re
+import unicodedata
+from collections import Counter, defaultdict
+from typing import List, Dict, Any, Tuple
+from app.utils.logger import get_logger
+
+logger = get_logger("retrieval")
+
+STOPWORDS = {
+    "a", "ao", "aos", "as", "com", "como", "da", "das", "de", "do", "dos", "e", "em", "esta",
+    "este", "eu", "ha", "isso", "mais", "me", "na", "nas", "no", "nos", "o", "os", "ou", "para",
+    "pela", "pelo", "por", "qual", "quais", "quando", "quanto", "quantos", "quantas", "que",
+    "quem", "se", "sao", "sobre", "tem", "um", "uma", "onde", "existem", "existe", "recife",
+    "cidade", "dados", "lista", "listar", "mostre", "quero", "saber", "informe", "informacoes"
+}
+
+def normalize_text(text: str) -> str:
+    """Lowercase and strip accents so 'Saúde' and 'saude' match."""
+    decomposed = unicodedata.normalize("NFKD", text or "")
+    return "".join(c for c in decomposed if not unicodedata.combining(c)).casefold()
+
+def tokenize(text: str) -> List[str]:
+    tokens = []
+    for token in re.findall(r"[a-z0-9]+", normalize_text(text)):
+        if token in STOPWORDS or len(token) < 2:
+            continue
+        # Light plural folding: "academias" -> "academia", "hospitais" stays as is
+        if len(token) > 3 and token.endswith("s") and not token.endswith("is"):
+            token = token[:-1]
+        tokens.append(token)
+    return tokens
+
+class DatasetIndex:
+    """BM25 index over DataHub packages (name, title, description and tags).
+
+    Names, titles and tags are weighted above the free-text description since
+    they are short and curated.
+    """
+
+    def __init__(self, k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.documents: List[Dict[str, Any]] = []
+        self.postings: Dict[str, List[Tuple[int, int]]] = {}
+        self.doc_lengths: List[int] = []
+        self.avg_length = 0.0
+
+    def __len__(self) -> int:
+        return len(self.documents)
+
+    @classmethod
+    def build(cls, packages: List[Any], **kwargs) -> "DatasetIndex":
+        index = cls(**kwargs)
+        postings = defaultdict(list)
+        for doc_id, package in enumerate(packages):
+            if isinstance(package, str):
+                package = {"name": package}
+            document = {
+                "name": package.get("name", ""),
+                "title": package.get("title") or package.get("name", ""),
+                "description": (package.get("notes") or "")[:300]
+            }
+            tags = " ".join(tag.get("name", "") for tag in package.get("tags", []) or [])
+            text_fields = [document["name"], document["title"], document["title"], tags, tags, document["description"]]
+            terms = Counter(tokenize(" ".join(text_fields).replace("-", " ").replace("_", " ")))
+            for term, tf in terms.items():
+                postings[term].append((doc_id, tf))
+            index.documents.append(document)
+            index.doc_lengths.append(sum(terms.values()))
+
+        index.postings = dict(postings)
+        index.avg_length = (sum(index.doc_lengths) / len(index.doc_lengths)) if index.doc_lengths else 0.0
+        logger.info("DatasetIndex built with %s datasets and %s terms", len(index.documents), len(index.postings))
+        return index
+
+    def search(self, query: str, k: int = 8) -> List[Dict[str, Any]]:
+        if not self.documents:
+            return []
+
+        n_docs = len(self.documents)
+        scores = defaultdict(float)
+        for term in set(tokenize(query)):
+            postings = self.postings.get(term)
+            if not postings:
+                continue
+            idf = math.log(1 + (n_docs - len(postings) + 0.5) / (len(postings) + 0.5))
+            for doc_id, tf in postings:
+                norm = self.k1 * (1 - self.b + self.b * self.doc_lengths[doc_id] / self.avg_length)
+                scores[doc_id] += idf * tf * (self.k1 + 1) / (tf + norm)
+
+        ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)[:k]
+        return [dict(self.documents[doc_id], score=round(score, 3)) for doc_id, score in ranked]
+
+def is_decisive(results: List[Dict[str, Any]], min_score: float, ratio: float) -> bool:
+    """True when the top hit is strong enough to skip LLM arbitration."""
+    if not results or results[0]["score"] < min_score:
+        return False
+    if len(results) == 1:
+        return True
+    return results[0]["score"] >= ratio * results[1]["score"]
@@ -0,0 +1,79 @@
+from typing import Any, Callable, Dict, Optional
+from langchain_core.runnables import Runnable
+from app.utils.logger import get_logger
+from app.utils.metrics import MODEL_ESCALATIONS, MODEL_STAGE_CALLS
+
+logger = get_logger("routing")
+
+# Only SQL generation needs the large model by default
+DEFAULT_ROUTES = {
+    "dataset_selection": "small",
+    "resource_selection": "small",
+    "classification": "small",
+    "sql_generation": "large",
+    "sql_repair": "large",
+    "response": "small",
+}
+
+class ModelRouter:
+    """Maps each pipeline stage to a chat model.
+
+    A route is "small", "large" or an explicit model name. Stages served by a
+    model other than the large one may escalate to the large model when their
+    output fails validation or the call errors, so cheap models handle the
+    common case and the large model only pays for the hard ones.
+    """
+
+    def __init__(self, small_model: str, large_model: str, routes: Optional[Dict[str, str]] = None,
+                 escalation: bool = True):
+        self.small_model = small_model
+        self.large_model = large_model
+        self.escalation = escalation
+        self.routes = dict(DEFAULT_ROUTES, **(routes or {}))
+        logger.info("ModelRouter initialized: %s", ', '.join((f'{s}={self.model_for(s)}' for s in self.routes)))
+
+    def model_for(self, stage: str) -> str:
+        route = self.routes.get(stage, "large")
+        if route == "small":
+            return self.small_model
+        if route == "large":
+            return self.large_model
+        return route
+
+    def escalation_for(self, stage: str, model_name: str) -> Optional[str]:
+        """Model to retry ``stage`` with after ``model_name`` failed, if any."""
+        if not self.escalation or model_name == self.large_model:
+            return None
+        return self.large_model
+
+    def record_call(self, stage: str, model_name: str):
+        MODEL_STAGE_CALLS.labels(stage, "large" if model_name == self.large_model else "small").inc()
+
+    def record_escalation(self, stage: str, reason: str):
+        logger.warning("Escalating %s to %s (%s)", stage, self.large_model, reason)
+        MODEL_ESCALATIONS.labels(stage, reason).inc()
+
+    async def ainvoke(self, stage: str, chain_for: Callable[[str], Runnable], inputs: Dict[str, Any],
+                      parse: Callable[[str], Any]) -> Any:
+        """Run ``stage`` on its routed model and escalate once if needed.
+
+        ``parse`` turns the raw output into the stage result and returns None
+        when it fails validation; errors on the routed model escalate too.
+        """
+        model_name = self.model_for(stage)
+        escalate_to = self.escalation_for(stage, model_name)
+        self.record_call(stage, model_name)
+        try:
+            result = parse(await chain_for(model_name).ainvoke(inputs))
+            reason = "invalid"
+        except Exception as e:
+            if escalate_to is None:
+                raise
+            logger.warning("%s failed on %s: %s", stage, model_name, e)
+            result, reason = None, "error"
+
+        if result is None and escalate_to is not None:
+            self.record_escalation(stage, reason)
+            self.record_call(stage, escalate_to)
+            result = parse(await chain_for(escalate_to).ainvoke(inputs))
+        return result
@@ -0,0 +1,232 @@
+import asyncio
+import email.utils
+import heapq
+import itertools
+import json
+import re
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+import httpx
+from app.utils.logger import get_logger
+from app.utils.metrics import LLM_QUEUE_DEPTH, LLM_QUEUE_WAIT, LLM_RATE_LIMITED
+
+logger = get_logger("scheduler")
+
+# Lower runs first: quick chat replies, then data query stages, then background work
+LANES = {"chat": 0, "query": 1, "background": 2}
+# Set by ModelRegistry on each client and removed before the request leaves the process
+LANE_HEADER = "x-recife-lane"
+# Completion budget assumed when a request doesn't set max_tokens
+DEFAULT_COMPLETION_TOKENS = 256
+DURATION_PART = re.compile(r"([\d.]+)(ms|h|m|s)")
+
+class TokenBucket:
+    """Refills ``per_minute`` units evenly over a minute; a limit of 0 disables it."""
+
+    def __init__(self, per_minute: int):
+        self.capacity = float(per_minute)
+        self.rate = per_minute / 60.0
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount: float, now: float) -> float:
+        if not self.capacity:
+            return 0.0
+        self._refill(now)
+        # A request larger than the whole bucket waits for a full bucket instead of forever
+        amount = min(amount, self.capacity)
+        return max(0.0, (amount - self.tokens) / self.rate)
+
+    def take(self, amount: float, now: float):
+        if self.capacity:
+            self._refill(now)
+            self.tokens -= min(amount, self.capacity)
+
+    def cap(self, remaining: float, now: float):
+        """Trust the provider's remaining count when it is lower than ours."""
+        if self.capacity:
+            self._refill(now)
+            self.tokens = min(self.tokens, remaining)
+
+class ModelLimiter:
+    """Requests/min and tokens/min buckets for one model with a priority queue of waiters.
+
+    Callers queue by lane and are admitted strictly in priority order (FIFO
+    within a lane) as soon as both buckets allow it; a 429 pauses the whole
+    model until its Retry-After has passed.
+    """
+
+    def __init__(self, model_name: str, rpm: int = 0, tpm: int = 0):
+        self.model_name = model_name
+        self.requests = TokenBucket(rpm)
+        self.tokens = TokenBucket(tpm)
+        self.paused_until = 0.0
+        self._lock = threading.Lock()
+        self._queue: List[Tuple[int, int]] = []
+        self._sequence = itertools.count()
+        self._condition: Optional[asyncio.Condition] = None
+
+    def _wait_time(self, tokens: float, now: float) -> float:
+        return max(self.requests.wait_time(1, now), self.tokens.wait_time(tokens, now), self.paused_until - now)
+
+    def _take(self, tokens: float, now: float):
+        self.requests.take(1, now)
+        self.tokens.take(tokens, now)
+
+    async def acquire(self, tokens: float, lane: str):
+        if self._condition is None:
+            self._condition = asyncio.Condition()
+        priority = LANES.get(lane, LANES["query"])
+        entry = (priority, next(self._sequence))
+        start_time = time.perf_counter()
+
+        async with self._condition:
+            heapq.heappush(self._queue, entry)
+            LLM_QUEUE_DEPTH.labels(self.model_name, lane).inc()
+            # A new head of the queue must re-check the buckets
+            self._condition.notify_all()
+            try:
+                while True:
+                    if self._queue[0] == entry:
+                        with self._lock:
+                            now = time.monotonic()
+                            wait = self._wait_time(tokens, now)
+                            if wait <= 0:
+                                self._take(tokens, now)
+                                break
+                        try:
+                            await asyncio.wait_for(self._condition.wait(), wait)
+                        except asyncio.TimeoutError:
+                            pass
+                    else:
+                        await self._condition.wait()
+            finally:
+                self._queue.remove(entry)
+                heapq.heapify(self._queue)
+                LLM_QUEUE_DEPTH.labels(self.model_name, lane).dec()
+                self._condition.notify_all()
+        LLM_QUEUE_WAIT.labels(self.model_name, lane).observe(time.perf_counter() - start_time)
+
+    def pause(self, delay: float):
+        with self._lock:
+            self.paused_until = max(self.paused_until, time.monotonic() + delay)
+
+    def observe_headers(self, headers: httpx.Headers):
+        remaining_requests = headers.get("x-ratelimit-remaining-requests")
+        remaining_tokens = headers.get("x-ratelimit-remaining-tokens")
+        with self._lock:
+            now = time.monotonic()
+            try:
+                if remaining_requests is not None:
+                    self.requests.cap(float(remaining_requests), now)
+                if remaining_tokens is not None:
+                    self.tokens.cap(float(remaining_tokens), now)
+            except ValueError:
+                pass
+
+def parse_retry_after(headers: httpx.Headers, default: float) -> float:
+    """Seconds to wait after a 429, from Retry-After or Groq's x-ratelimit-reset-* headers."""
+    value = headers.get("retry-after")
+    if value:
+        try:
+            return max(0.0, float(value))
+        except ValueError:
+            parsed = email.utils.parsedate_to_datetime(value)
+            if parsed is not None:
+                return max(0.0, parsed.timestamp() - time.time())
+    resets = [headers.get("x-ratelimit-reset-requests"), headers.get("x-ratelimit-reset-tokens")]
+    durations = [_duration(value) for value in resets if value]
+    durations = [d for d in durations if d is not None]
+    return max(durations) if durations else default
+
+def _duration(value: str) -> Optional[float]:
+    # Groq writes resets like "2m59.56s" or "120ms"
+    parts = DURATION_PART.findall(value)
+    if not parts:
+        return None
+    scale = {"ms": 0.001, "s": 1, "m": 60, "h": 3600}
+    return sum(float(number) * scale[unit] for number, unit in parts)
+
+def _request_cost(request: httpx.Request) -> Tuple[Optional[str], float]:
+    """Model name and estimated tokens (prompt + completion budget) of a chat completion request."""
+    try:
+        body = json.loads(request.content or b"{}")
+    except ValueError:
+        return None, 0.0
+    prompt_chars = sum(len(str(m.get("content") or "")) for m in body.get("messages", []))
+    completion = body.get("max_tokens") or body.get("max_completion_tokens") or DEFAULT_COMPLETION_TOKENS
+    return body.get("model"), prompt_chars / 4 + completion
+
+class LLMScheduler:
+    """Process-wide admission control for outbound chat model calls.
+
+    ``limits`` maps model names to {"rpm": ..., "tpm": ...}; models without an
+    entry use the defaults. Plugged in as the httpx transport of the shared
+    model clients, so every caller goes through it.
+    """
+
+    def __init__(self, default_rpm: int = 0, default_tpm: int = 0,
+                 limits: Optional[Dict[str, Dict[str, int]]] = None, max_retries: int = 3,
+                 default_backoff: float = 2.0):
+        self.default_rpm = default_rpm
+        self.default_tpm = default_tpm
+        self.limits = limits or {}
+        self.max_retries = max_retries
+        self.default_backoff = default_backoff
+        self._limiters: Dict[str, ModelLimiter] = {}
+        self._lock = threading.Lock()
+        logger.info("LLMScheduler initialized with default limits: %s rpm, %s tpm", default_rpm, default_tpm)
+
+    def limiter(self, model_name: str) -> ModelLimiter:
+        limiter = self._limiters.get(model_name)
+        if limiter is None:
+            with self._lock:
+                limiter = self._limiters.get(model_name)
+                if limiter is None:
+                    limits = self.limits.get(model_name, {})
+                    limiter = ModelLimiter(
+                        model_name, limits.get("rpm", self.default_rpm), limits.get("tpm", self.default_tpm)
+                    )
+                    self._limiters[model_name] = limiter
+        return limiter
+
+    def _prepare(self, request: httpx.Request) -> Tuple[Optional[ModelLimiter], float, str]:
+        lane = request.headers.pop(LANE_HEADER, None) or "query"
+        model_name, tokens = _request_cost(request)
+        return (self.limiter(model_name) if model_name else None), tokens, lane
+
+    def _rate_limited(self, limiter: ModelLimiter, response: httpx.Response, attempt: int) -> bool:
+        if response.status_code != 429:
+            limiter.observe_headers(response.headers)
+            return False
+        LLM_RATE_LIMITED.labels(limiter.model_name).inc()
+        delay = parse_retry_after(response.headers, self.default_backoff * (2 ** attempt))
+        limiter.pause(delay)
+        logger.warning("Rate limited by provider for %s, pausing %.2fs", limiter.model_name, delay)
+        return attempt < self.max_retries
+
+class AsyncScheduledTransport(httpx.AsyncBaseTransport):
+    def __init__(self, transport: httpx.AsyncBaseTransport, scheduler: LLMScheduler):
+        self.transport = transport
+        self.scheduler = scheduler
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        limiter, tokens, lane = self.scheduler._prepare(request)
+        if limiter is None:
+            return await self.transport.handle_async_request(request)
+        attempt = 0
+        while True:
+            await limiter.acquire(tokens, lane)
+            response = await self.transport.handle_async_request(request)
+            if not self.scheduler._rate_limited(limiter, response, attempt):
+                return response
+            await response.aclose()
+            attempt += 1
+
+    async def aclose(self):
+        await self.transport.aclose()
@@ -0,0 +1,135 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, Any, List, Optional
+from app.utils.logger import get_logger
+
+logger = get_logger("schema_cache")
+
+# Usage counts are written in batches: one query in USAGE_FLUSH_EVERY pays for a commit
+USAGE_FLUSH_EVERY = 20
+
+class SchemaCache:
+    """Field list and sample rows per datastore resource, persisted in SQLite.
+
+    Entries are keyed by resource id and tagged with the resource version
+    (``last_modified``/``metadata_modified`` from package_show); a lookup with a
+    different version is a miss. Reads are served from an in-memory mirror
+    loaded at startup, so only writes touch the file.
+
+    The same file keeps how often each resource was queried, which is the hot
+    list the startup warm-up preloads.
+    """
+
+    def __init__(self, path: str = "cache/schema_cache.sqlite3", max_age: float = 7 * 24 * 3600):
+        self.path = path
+        self.max_age = max_age
+        self._lock = threading.Lock()
+        self._entries: Dict[str, Dict[str, Any]] = {}
+        self._usage: Dict[str, int] = {}
+        self._pending_usage: Dict[str, int] = {}
+
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS resource_schema (
+                resource_id TEXT PRIMARY KEY,
+                version TEXT,
+                fields TEXT NOT NULL,
+                samples TEXT NOT NULL,
+                fetched_at REAL NOT NULL
+            )
+        """)
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS resource_usage (
+                resource_id TEXT PRIMARY KEY,
+                hits INTEGER NOT NULL,
+                last_used REAL NOT NULL
+            )
+        """)
+        self._conn.commit()
+        self._load()
+
+    def _load(self):
+        rows = self._conn.execute("SELECT resource_id, version, fields, samples, fetched_at FROM resource_schema").fetchall()
+        for resource_id, version, fields, samples, fetched_at in rows:
+            self._entries[resource_id] = {
+                "version": version,
+                "resultados_campos": json.loads(fields),
+                "resultados_exemplos": json.loads(samples),
+                "fetched_at": fetched_at
+            }
+        self._usage = dict(self._conn.execute("SELECT resource_id, hits FROM resource_usage").fetchall())
+        logger.info("SchemaCache loaded %s resources from %s", len(self._entries), self.path)
+
+    def get(self, resource_id: str, version: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        entry = self._entries.get(resource_id)
+        if entry is None:
+            return None
+        if version is not None and entry["version"] != version:
+            logger.info("Schema for %s is outdated (%s != %s)", resource_id, entry['version'], version)
+            return None
+        if version is None and time.time() - entry["fetched_at"] > self.max_age:
+            return None
+        return {
+            "resultados_campos": entry["resultados_campos"],
+            "resultados_exemplos": entry["resultados_exemplos"]
+        }
+
+    def put(self, resource_id: str, version: Optional[str], metadata: Dict[str, Any]):
+        fields = metadata.get("resultados_campos", [])
+        samples = metadata.get("resultados_exemplos", [])
+        fetched_at = time.time()
+        with self._lock:
+            self._entries[resource_id] = {
+                "version": version,
+                "resultados_campos": fields,
+                "resultados_exemplos": samples,
+                "fetched_at": fetched_at
+            }
+            self._conn.execute(
+                "INSERT OR REPLACE INTO resource_schema VALUES (?, ?, ?, ?, ?)",
+                (resource_id, version, json.dumps(fields, ensure_ascii=False),
+                 json.dumps(samples, ensure_ascii=False, default=str), fetched_at)
+            )
+            self._conn.commit()
+
+    def record_use(self, resource_id: str):
+        """Count a query against ``resource_id`` towards the hot list."""
+        with self._lock:
+            self._usage[resource_id] = self._usage.get(resource_id, 0) + 1
+            self._pending_usage[resource_id] = self._pending_usage.get(resource_id, 0) + 1
+            if sum(self._pending_usage.values()) >= USAGE_FLUSH_EVERY:
+                self._flush_usage()
+
+    def hot_resources(self, limit: int) -> List[str]:
+        """Ids of the ``limit`` most queried resources, most used first."""
+        with self._lock:
+            return sorted(self._usage, key=self._usage.get, reverse=True)[:limit]
+
+    def _flush_usage(self):
+        if not self._pending_usage:
+            return
+        now = time.time()
+        self._conn.executemany(
+            """INSERT INTO resource_usage VALUES (?, ?, ?)
+               ON CONFLICT(resource_id) DO UPDATE SET hits = hits + excluded.hits, last_used = excluded.last_used""",
+            [(resource_id, hits, now) for resource_id, hits in self._pending_usage.items()]
+        )
+        self._conn.commit()
+        self._pending_usage = {}
+
+    def invalidate(self, resource_id: str):
+        with self._lock:
+            self._entries.pop(resource_id, None)
+            self._conn.execute("DELETE FROM resource_schema WHERE resource_id = ?", (resource_id,))
+            self._conn.commit()
+
+    def close(self):
+        with self._lock:
+            self._flush_usage()
+        self._conn.close()
@@ -0,0 +1,61 @@
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+from app.utils.logger import get_logger
+
+logger = get_logger("speculation")
+
+class StagePrefetcher:
+    """Per-request registry of speculative pipeline work.
+
+    Stages whose inputs are already known are started early with ``start``
+    and keyed by what they fetch (e.g. ``resources:<dataset>``). When the
+    pipeline reaches that stage, ``get`` awaits the running task instead of
+    issuing the call again, or simply runs it if nothing was started. Tasks
+    carry a group (usually the candidate dataset) so work for candidates that
+    lost can be cancelled as soon as the choice is made; leaving the context
+    cancels whatever is still pending.
+    """
+
+    def __init__(self, request_id: str, enabled: bool = True):
+        self.request_id = request_id
+        self.enabled = enabled
+        self._tasks: Dict[str, Tuple[asyncio.Task, Optional[str]]] = {}
+        self.hits = 0
+
+    async def __aenter__(self) -> "StagePrefetcher":
+        return self
+
+    async def __aexit__(self, *exc_info):
+        self.cancel()
+
+    def start(self, key: str, fn: Callable[..., Awaitable[Any]], *args, group: Optional[str] = None):
+        if not self.enabled or key in self._tasks:
+            return
+        task = asyncio.create_task(fn(*args))
+        # Speculative failures are only surfaced if the result is actually used
+        task.add_done_callback(lambda t: t.cancelled() or t.exception())
+        self._tasks[key] = (task, group)
+
+    async def get(self, key: str, fn: Callable[..., Awaitable[Any]], *args) -> Any:
+        entry = self._tasks.get(key)
+        if entry is None or entry[0].cancelled():
+            return await fn(*args)
+        # wait() doesn't propagate the task's own cancellation: the request that
+        # started it may have cancelled it while a coalesced flight still needs the result
+        await asyncio.wait({entry[0]})
+        if entry[0].cancelled():
+            return await fn(*args)
+        self.hits += 1
+        logger.info("[ID: %s] Using speculative result for %s", self.request_id, key)
+        return entry[0].result()
+
+    def cancel(self, keep_group: Optional[str] = None):
+        cancelled = 0
+        for key, (task, group) in self._tasks.items():
+            if keep_group is not None and group == keep_group:
+                continue
+            if not task.done():
+                task.cancel()
+                cancelled += 1
+        if cancelled:
+            logger.info("[ID: %s] Cancelled %s speculative tasks", self.request_id, cancelled)
@@ -0,0 +1,108 @@
+import asyncio
+import time
+from typing import Any, Callable, Dict, List, Optional
+from app.services.catalog import CatalogCache
+from app.services.database import DatabaseService
+from app.services.schema_cache import SchemaCache
+from app.utils.logger import get_logger
+
+logger = get_logger("warmup")
+
+class WarmUp:
+    """Startup warm-up that gates the /ready endpoint.
+
+    Runs in the background once the app starts: builds the model clients and
+    prompt chains (``warmers`` are plain callables, run in a worker thread),
+    waits for the first catalog fetch and loads the schema of the
+    ``hot_resources`` most queried resources that are missing or outdated in
+    the SchemaCache. Failed steps are retried every ``retry_interval``
+    seconds; the instance reports ready once every step has succeeded or
+    ``timeout`` has passed, so a DataHub outage delays readiness but never
+    blocks it.
+    """
+
+    def __init__(self, catalog_cache: CatalogCache, database_service: DatabaseService,
+                 schema_cache: SchemaCache, warmers: Optional[List[Callable[[], Any]]] = None,
+                 hot_resources: int = 20, concurrency: int = 4, timeout: float = 60.0, enabled: bool = True,
+                 retry_interval: float = 5.0):
+        self.catalog_cache = catalog_cache
+        self.database_service = database_service
+        self.schema_cache = schema_cache
+        self.warmers = warmers or []
+        self.hot_resources = hot_resources
+        self.concurrency = concurrency
+        self.timeout = timeout
+        self.retry_interval = retry_interval
+        self.ready = not enabled
+        self.steps: Dict[str, str] = {} if enabled else {"warmup": "disabled"}
+        self._task: Optional[asyncio.Task] = None
+
+    def status(self) -> Dict[str, Any]:
+        return {"status": "ready" if self.ready else "warming", "steps": self.steps}
+
+    def start(self):
+        if not self.ready and (self._task is None or self._task.done()):
+            self._task = asyncio.create_task(self.run())
+
+    async def stop(self):
+        if self._task is not None and not self._task.done():
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        self._task = None
+
+    async def run(self):
+        start_time = time.perf_counter()
+        try:
+            await asyncio.wait_for(self._run_steps(), self.timeout)
+        except asyncio.TimeoutError:
+            self.steps = {name: "timeout" if state == "running" else state for name, state in self.steps.items()}
+            self.ready = True
+            logger.warning("Warm-up did not finish within %ss, reporting ready anyway: %s", self.timeout, self.steps)
+            return
+        self.ready = True
+        logger.info("Warm-up finished in %.2fs: %s", time.perf_counter() - start_time, self.steps)
+
+    async def _run_steps(self):
+        # Chains first: they need no network and the other steps don't depend on them
+        steps = [("models", self._build_models), ("catalog", self.catalog_cache.refresh),
+                 ("schemas", self._preload_schemas)]
+        while True:
+            for name, fn in steps:
+                if self.steps.get(name) != "ok":
+                    await self._step(name, fn)
+            failed = [name for name, _ in steps if self.steps[name] != "ok"]
+            if not failed:
+                return
+            logger.info("Warm-up steps %s failed, retrying in %ss", failed, self.retry_interval)
+            await asyncio.sleep(self.retry_interval)
+
+    async def _step(self, name: str, fn: Callable[[], Any]):
+        self.steps[name] = "running"
+        try:
+            result = await fn()
+            self.steps[name] = "failed" if result is False else "ok"
+        except Exception as e:
+            logger.exception("Warm-up step %s failed: %s", name, e)
+            self.steps[name] = "failed"
+
+    async def _build_models(self):
+        for warmer in self.warmers:
+            await asyncio.to_thread(warmer)
+
+    async def _preload_schemas(self) -> bool:
+        resource_ids = self.schema_cache.hot_resources(self.hot_resources)
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def preload(resource_id: str) -> bool:
+            async with semaphore:
+                metadata = await self.database_service.aget_metadata_from_resource_id(
+                    resource_id, self.catalog_cache.resource_version(resource_id)
+                )
+                return bool(metadata.get("resultados_campos"))
+
+        loaded = await asyncio.gather(*(preload(resource_id) for resource_id in resource_ids))
+        logger.info("Preloaded schemas for %s of %s hot resources", sum(loaded), len(resource_ids))
+        return all(loaded)
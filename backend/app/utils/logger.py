@@ -1,9 +1,125 @@
+import asyncio
+import atexit
+import contextvars
+import copy
+import json
 import logging
 import os
-from logging.handlers import RotatingFileHandler
+import queue
+import random
+import threading
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
 import time
 from functools import wraps
 
+# Request id and sampling decision of the request being handled, set by start_request
+_request = contextvars.ContextVar("recife_request", default=None)
+
+# Attributes every LogRecord has; anything else was passed through ``extra``
+RECORD_ATTRIBUTES = set(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {"message", "asctime", "request_id"}
+
+_TRACEBACK_FORMATTER = logging.Formatter()
+
+class JSONFormatter(logging.Formatter):
+    """One JSON object per line, with ``extra`` fields and the request id as keys."""
+
+    def format(self, record):
+        entry = {
+            "time": self.formatTime(record),
+            "level": record.levelname,
+            "logger": record.name,
+            "location": f"{record.filename}:{record.lineno}",
+            "message": record.getMessage(),
+        }
+        if getattr(record, "request_id", None):
+            entry["request_id"] = record.request_id
+        entry.update({k: v for k, v in vars(record).items() if k not in RECORD_ATTRIBUTES})
+        if record.exc_text:
+            entry["exception"] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+class RequestFilter(logging.Filter):
+    """Tags records with the current request id and drops INFO/DEBUG lines of unsampled requests."""
+
+    def filter(self, record):
+        context = _request.get()
+        record.request_id = context[0] if context else None
+        return context is None or context[1] or record.levelno >= logging.WARNING
+
+class _RenderingQueueHandler(QueueHandler):
+    def prepare(self, record):
+        # Render the %-args in the caller: they may be mutated after the call returns
+        # and their __str__ shouldn't run on the writer thread. Unlike the stdlib
+        # QueueHandler the traceback stays separate, for the JSON "exception" key
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = _TRACEBACK_FORMATTER.formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+class _LogPipeline:
+    """Single background writer shared by every module logger.
+
+    Module loggers render the message and put the record on an in-memory
+    queue; a QueueListener thread applies the formatters and does the
+    console/file I/O.
+    """
+
+    def __init__(self):
+        self.queue = queue.SimpleQueue()
+        self.formatter = self._formatter()
+        console_handler = logging.StreamHandler()
+        console_handler.setFormatter(self.formatter)
+        self.handlers = [console_handler]
+        self.listener = QueueListener(self.queue, *self.handlers, respect_handler_level=True)
+        self.listener.start()
+        self._lock = threading.Lock()
+        self._files = set()
+        atexit.register(self.listener.stop)
+
+    def _formatter(self):
+        if os.environ.get('LOG_FORMAT', 'text').lower() == 'json':
+            return JSONFormatter()
+        return logging.Formatter(
+            '%(asctime)s - %(name)s - %(levelname)s - %(filename)s:%(lineno)d - %(message)s'
+        )
+
+    def add_file(self, name, log_file):
+        with self._lock:
+            if log_file in self._files:
+                return
+            os.makedirs(os.path.dirname(log_file), exist_ok=True)
+            file_handler = RotatingFileHandler(log_file, maxBytes=10*1024*1024, backupCount=5)
+            file_handler.setFormatter(self.formatter)
+            file_handler.addFilter(logging.Filter(name))
+            self.handlers.append(file_handler)
+            self._files.add(log_file)
+            # QueueListener reads this tuple for every record
+            self.listener.handlers = tuple(self.handlers)
+
+_pipeline = None
+_pipeline_lock = threading.Lock()
+
+def _get_pipeline():
+    global _pipeline
+    if _pipeline is None:
+        with _pipeline_lock:
+            if _pipeline is None:
+                _pipeline = _LogPipeline()
+    return _pipeline
+
+def start_request(request_id, sample_rate=1.0):
+    """Mark the current task as handling ``request_id``; returns whether its INFO lines are kept.
+
+    The decision is made once per request so a sampled request keeps all of
+    its lines; warnings and errors are always kept.
+    """
+    sampled = sample_rate >= 1 or random.random() < sample_rate
+    _request.set((request_id, sampled))
+    return sampled
+
 def setup_logger(name, log_file=None, level=logging.INFO, enable_file_logging=False):
     logger = logging.getLogger(name)
     logger.setLevel(level)
@@ -11,24 +127,14 @@ def setup_logger(name, log_file=None, level=logging.INFO, enable_file_logging=Fa
     if logger.handlers:
         logger.handlers = []
     
-    detailed_formatter = logging.Formatter(
-        '%(asctime)s - %(name)s - %(levelname)s - %(filename)s:%(lineno)d - %(message)s'
-    )
-    
-    console_handler = logging.StreamHandler()
-    console_handler.setLevel(level)
-    console_handler.setFormatter(detailed_formatter)
-    logger.addHandler(console_handler)
+    pipeline = _get_pipeline()
+    queue_handler = _RenderingQueueHandler(pipeline.queue)
+    queue_handler.setLevel(level)
+    queue_handler.addFilter(RequestFilter())
+    logger.addHandler(queue_handler)
     
     if enable_file_logging and log_file:
-        os.makedirs(os.path.dirname(log_file), exist_ok=True)
-        
-        file_handler = RotatingFileHandler(
-            log_file, maxBytes=10*1024*1024, backupCount=5
-        )
-        file_handler.setLevel(level)
-        file_handler.setFormatter(detailed_formatter)
-        logger.addHandler(file_handler)
+        pipeline.add_file(name, log_file)
     
     return logger
 
@@ -44,17 +150,32 @@ def get_logger(module_name):
 
 def log_time(logger):
     def decorator(func):
+        if asyncio.iscoroutinefunction(func):
+            @wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                start_time = time.perf_counter()
+                try:
+                    result = await func(*args, **kwargs)
+                    elapsed = time.perf_counter() - start_time
+                    logger.info("%s completed in %.2fs", func.__name__, elapsed)
+                    return result
+                except Exception as e:
+                    elapsed = time.perf_counter() - start_time
+                    logger.error("%s failed after %.2fs: %s", func.__name__, elapsed, e)
+                    raise
+            return async_wrapper
+
         @wraps(func) 
         def wrapper(*args, **kwargs):
-            start_time = time.time()
+            start_time = time.perf_counter()
             try:
                 result = func(*args, **kwargs)
-                elapsed = time.time() - start_time
-                logger.info(f"{func.__name__} completed in {elapsed:.2f}s")
+                elapsed = time.perf_counter() - start_time
+                logger.info("%s completed in %.2fs", func.__name__, elapsed)
                 return result
             except Exception as e:
-                elapsed = time.time() - start_time
-                logger.error(f"{func.__name__} failed after {elapsed:.2f}s: {str(e)}")
+                elapsed = time.perf_counter() - start_time
+                logger.error("%s failed after %.2fs: %s", func.__name__, elapsed, e)
                 raise
         return wrapper
     return decorator
\ No newline at end of file
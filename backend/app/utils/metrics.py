@@ -0,0 +1,95 @@
+import os
+import time
+from typing import Any, Dict
+from uuid import UUID
+from langchain_core.callbacks import BaseCallbackHandler
+from prometheus_client import CONTENT_TYPE_LATEST, CollectorRegistry, Counter, Gauge, Histogram, generate_latest, multiprocess
+
+# Latencies are measured with time.perf_counter (monotonic); wall-clock time.time
+# can jump and would corrupt the tails we care about.
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60)
+
+STAGE_LATENCY = Histogram(
+    "recife_stage_duration_seconds", "Latency of each query pipeline stage",
+    ["stage"], buckets=LATENCY_BUCKETS
+)
+LLM_LATENCY = Histogram(
+    "recife_llm_request_duration_seconds", "Latency of chat model calls",
+    ["model"], buckets=LATENCY_BUCKETS
+)
+LLM_ERRORS = Counter("recife_llm_errors_total", "Failed chat model calls", ["model"])
+CKAN_LATENCY = Histogram(
+    "recife_ckan_request_duration_seconds", "Latency of DataHub (CKAN) HTTP calls, per attempt",
+    ["endpoint", "outcome"], buckets=LATENCY_BUCKETS
+)
+# Hit ratio: rate(recife_cache_lookups_total{result="hit"}[5m]) / rate(recife_cache_lookups_total[5m])
+CACHE_LOOKUPS = Counter("recife_cache_lookups_total", "Cache lookups by cache and result", ["cache", "result"])
+PROMPT_TOKENS = Counter(
+    "recife_prompt_tokens_total", "Estimated prompt tokens for encoded rows, before and after compact encoding",
+    ["stage", "encoding"]
+)
+# Escalation rate: rate(recife_model_escalations_total[5m]) / rate(recife_model_stage_calls_total{tier="small"}[5m])
+MODEL_STAGE_CALLS = Counter("recife_model_stage_calls_total", "Chat model calls per pipeline stage and model tier",
+                            ["stage", "tier"])
+MODEL_ESCALATIONS = Counter(
+    "recife_model_escalations_total", "Stage calls retried on the large model, by reason (invalid or error)",
+    ["stage", "reason"]
+)
+# Outcome of local SQL validation: valid, fixed (deterministically), repaired (by the LLM) or fallback
+SQL_VALIDATIONS = Counter("recife_sql_validation_total", "Generated SQL by local validation outcome", ["outcome"])
+LLM_QUEUE_DEPTH = Gauge(
+    "recife_llm_queue_depth", "Chat model calls waiting for rate limit capacity", ["model", "lane"],
+    multiprocess_mode="livesum"
+)
+LLM_QUEUE_WAIT = Histogram(
+    "recife_llm_queue_wait_seconds", "Time chat model calls spent queued before being sent",
+    ["model", "lane"], buckets=LATENCY_BUCKETS
+)
+LLM_RATE_LIMITED = Counter("recife_llm_rate_limited_total", "HTTP 429 responses from the chat model provider", ["model"])
+CIRCUIT_STATE = Gauge(
+    "recife_circuit_state", "Circuit breaker state per endpoint (0 closed, 1 half-open, 2 open)", ["endpoint"],
+    multiprocess_mode="max"
+)
+CIRCUIT_REJECTIONS = Counter("recife_circuit_rejections_total", "Calls failed fast by an open circuit", ["endpoint"])
+CKAN_HEDGES = Counter(
+    "recife_ckan_hedged_requests_total", "Hedged DataHub reads by the attempt that answered first", ["endpoint", "winner"]
+)
+
+def record_stage(stage: str, start_time: float) -> float:
+    """Observe a stage that started at ``start_time`` (perf_counter) and return its duration."""
+    elapsed = time.perf_counter() - start_time
+    STAGE_LATENCY.labels(stage).observe(elapsed)
+    return elapsed
+
+def record_cache(cache: str, hit: bool):
+    CACHE_LOOKUPS.labels(cache, "hit" if hit else "miss").inc()
+
+class LLMMetricsHandler(BaseCallbackHandler):
+    """LangChain callback recording latency and errors for one chat model."""
+
+    # Called inline on the event loop; a thread-pool hop per token isn't worth it
+    run_inline = True
+
+    def __init__(self, model_name: str):
+        self.model_name = model_name
+        self._started: Dict[UUID, float] = {}
+
+    def on_chat_model_start(self, serialized: Dict[str, Any], messages: Any, *, run_id: UUID, **kwargs: Any):
+        self._started[run_id] = time.perf_counter()
+
+    def on_llm_end(self, response: Any, *, run_id: UUID, **kwargs: Any):
+        start_time = self._started.pop(run_id, None)
+        if start_time is not None:
+            LLM_LATENCY.labels(self.model_name).observe(time.perf_counter() - start_time)
+
+    def on_llm_error(self, error: BaseException, *, run_id: UUID, **kwargs: Any):
+        self._started.pop(run_id, None)
+        LLM_ERRORS.labels(self.model_name).inc()
+
+def render_metrics():
+    """Exposition payload and content type; aggregates all workers in multiprocess mode."""
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry), CONTENT_TYPE_LATEST
+    return generate_latest(), CONTENT_TYPE_LATEST
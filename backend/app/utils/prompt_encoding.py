@@ -0,0 +1,92 @@
+import json
+import threading
+from typing import Any, Dict, List, Optional
+from app.utils.logger import get_logger
+from app.utils.metrics import PROMPT_TOKENS
+
+logger = get_logger("prompt_encoding")
+
+# Datastore bookkeeping columns that never help the model
+INTERNAL_COLUMNS = {"_id", "_full_text"}
+
+def estimate_tokens(text: str) -> int:
+    """Cheap token estimate (~4 characters per token), good enough for budgeting."""
+    return len(text or "") // 4 + 1
+
+def _cell(value: Any, max_chars: int) -> str:
+    if value is None:
+        return ""
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)
+    text = value if isinstance(value, str) else str(value)
+    text = " ".join(text.split()).replace("|", "/")
+    if len(text) > max_chars:
+        text = text[:max_chars - 1] + "…"
+    return text
+
+def encode_rows(rows: List[Dict[str, Any]], max_chars: int = 80) -> str:
+    """Encode records as a pipe-separated table with the header written once.
+
+    Empty columns and datastore internals are dropped, cells are collapsed to
+    one line and truncated to ``max_chars``, and columns holding the same
+    value in every row are written once above the table instead of per row.
+    """
+    if not rows:
+        return "(sem linhas)"
+
+    columns = []
+    for row in rows:
+        for column in row:
+            if column not in columns and column not in INTERNAL_COLUMNS:
+                columns.append(column)
+
+    cells = {column: [_cell(row.get(column), max_chars) for row in rows] for column in columns}
+    columns = [column for column in columns if any(cells[column])]
+    constants = [column for column in columns if len(rows) > 1 and len(set(cells[column])) == 1]
+    varying = [column for column in columns if column not in constants]
+
+    lines = []
+    if constants:
+        lines.append("Valores comuns a todas as linhas: " + "; ".join(f"{c}={cells[c][0]}" for c in constants))
+    if varying:
+        lines.append(" | ".join(varying))
+        lines.extend(" | ".join(cells[column][i] for column in varying) for i in range(len(rows)))
+    return "\n".join(lines)
+
+class EncodingStats:
+    """Running totals of prompt tokens before and after compact encoding, per stage."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stages: Dict[str, Dict[str, int]] = {}
+
+    def record(self, stage: str, baseline: str, encoded: str):
+        self.record_tokens(stage, estimate_tokens(baseline), estimate_tokens(encoded))
+
+    def record_tokens(self, stage: str, before: int, after: int):
+        with self._lock:
+            totals = self._stages.setdefault(stage, {"calls": 0, "tokens_before": 0, "tokens_after": 0})
+            totals["calls"] += 1
+            totals["tokens_before"] += before
+            totals["tokens_after"] += after
+        PROMPT_TOKENS.labels(stage, "json").inc(before)
+        PROMPT_TOKENS.labels(stage, "compact").inc(after)
+        logger.info("Prompt encoding for %s: ~%s -> ~%s tokens (saved ~%s)", stage, before, after, before - after)
+
+    def snapshot(self) -> Dict[str, Dict[str, int]]:
+        with self._lock:
+            return {
+                stage: dict(totals, tokens_saved=totals["tokens_before"] - totals["tokens_after"])
+                for stage, totals in self._stages.items()
+            }
+
+encoding_stats = EncodingStats()
+
+def encode_for_prompt(stage: str, rows: List[Dict[str, Any]], max_chars: int = 80,
+                      baseline: Optional[str] = None) -> str:
+    """encode_rows plus bookkeeping of the tokens saved against plain JSON."""
+    encoded = encode_rows(rows, max_chars)
+    if baseline is None:
+        baseline = json.dumps(rows, ensure_ascii=False, default=str)
+    encoding_stats.record(stage, baseline, encoded)
+    return encoded
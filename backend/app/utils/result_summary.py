@@ -0,0 +1,115 @@
+from typing import Any, AsyncIterable, Dict, List
+import numpy as np
+import pandas as pd
+from app.utils.prompt_encoding import INTERNAL_COLUMNS
+
+# Share of non-empty values that must parse for a column to be treated as numeric or as a date
+PARSE_RATIO = 0.9
+SAMPLE_SIZE = 50
+
+def _number(value: float) -> str:
+    if pd.isna(value):
+        return "-"
+    if float(value).is_integer():
+        return f"{int(value):,}".replace(",", ".")
+    return f"{value:,.2f}".replace(",", "_").replace(".", ",").replace("_", ".")
+
+def _label(value: Any, max_chars: int) -> str:
+    text = " ".join(str(value).split())
+    return text if len(text) <= max_chars else text[:max_chars - 1] + "…"
+
+def _classify(frame: pd.DataFrame) -> Dict[str, Dict[str, Any]]:
+    """Split columns into numeric, date and text, converting the first two in place."""
+    kinds: Dict[str, Dict[str, Any]] = {"numeric": {}, "date": {}, "text": {}}
+    for column in frame.columns:
+        series = frame[column]
+        if pd.api.types.is_numeric_dtype(series) and not pd.api.types.is_bool_dtype(series):
+            if series.notna().any():
+                kinds["numeric"][column] = series.dropna().astype(float)
+            continue
+
+        text = series.astype("string").str.strip()
+        text = text[text.notna() & (text != "")]
+        if text.empty:
+            continue
+        # A small sample rules out most text columns before parsing every value
+        sample = text.head(SAMPLE_SIZE)
+        if pd.to_numeric(sample, errors="coerce").notna().mean() >= PARSE_RATIO:
+            numbers = pd.to_numeric(text, errors="coerce")
+            if numbers.notna().mean() >= PARSE_RATIO:
+                kinds["numeric"][column] = numbers
+                continue
+        if sample.str.match(r"^\d{4}-\d{2}-\d{2}").mean() >= PARSE_RATIO:
+            dates = pd.to_datetime(text, errors="coerce", format="ISO8601")
+            if dates.notna().mean() >= PARSE_RATIO:
+                kinds["date"][column] = dates
+                continue
+        kinds["text"][column] = text
+    return kinds
+
+async def aframe_from_batches(batches: AsyncIterable[List[Dict[str, Any]]]) -> pd.DataFrame:
+    """Build one columnar frame from row batches (e.g. QueryService.aiter_sql_batches).
+
+    Each batch is converted and released before the next one is read, so at
+    most one batch of row dicts is alive next to the (much more compact)
+    columnar frames; memory still grows with the number of rows fetched, which
+    the caller bounds with ``max_rows``.
+    """
+    frames = [pd.DataFrame.from_records(batch) async for batch in batches if batch]
+    return pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
+
+def summarize_rows(rows: List[Dict[str, Any]], top_k: int = 5, max_groups: int = 50,
+                   max_chars: int = 40) -> str:
+    return summarize_frame(pd.DataFrame.from_records(rows), top_k, max_groups, max_chars)
+
+def summarize_frame(frame: pd.DataFrame, top_k: int = 5, max_groups: int = 50,
+                    max_chars: int = 40) -> str:
+    """Compact statistical summary of a full query result for the answer prompt.
+
+    Everything is computed with vectorized pandas operations over the whole
+    result: min/max/mean/sum per numeric column, date ranges, distinct counts
+    and the ``top_k`` most frequent values per text column, and per-group
+    counts and sums for text columns with at most ``max_groups`` distinct
+    values. The output size depends on the number of columns, not rows.
+    """
+    if frame.empty:
+        return "(sem linhas)"
+
+    frame = frame.drop(columns=[c for c in frame.columns if c in INTERNAL_COLUMNS])
+    kinds = _classify(frame)
+    lines = [f"Total de linhas: {len(frame)}"]
+
+    for column, numbers in kinds["numeric"].items():
+        values = numbers.to_numpy(dtype=float)
+        values = values[~np.isnan(values)]
+        lines.append(
+            f"{column} (número, {len(values)} valores): mín {_number(values.min())}, máx {_number(values.max())}, "
+            f"média {_number(values.mean())}, mediana {_number(np.median(values))}, soma {_number(values.sum())}"
+        )
+
+    for column, dates in kinds["date"].items():
+        dates = dates.dropna()
+        lines.append(f"{column} (data): de {dates.min():%Y-%m-%d} a {dates.max():%Y-%m-%d}")
+
+    group_columns = []
+    for column, values in kinds["text"].items():
+        counts = values.value_counts()
+        if counts.iloc[0] == 1 and len(counts) > 1:
+            examples = "; ".join(_label(value, max_chars) for value in values.head(top_k))
+            lines.append(f"{column} (texto, {len(counts)} valores, todos distintos): exemplos: {examples}")
+            continue
+        top = "; ".join(f"{_label(value, max_chars)} ({count})" for value, count in counts.head(top_k).items())
+        lines.append(f"{column} (texto, {len(counts)} valores distintos): mais frequentes: {top}")
+        if 1 < len(counts) <= max_groups and counts.iloc[0] > 1:
+            group_columns.append(column)
+
+    # Per-group sums answer the typical "quantos X por bairro" questions
+    numeric_columns = list(kinds["numeric"])[:2]
+    for column in group_columns[:2]:
+        keys = kinds["text"][column].reindex(frame.index)
+        for numeric in numeric_columns:
+            sums = kinds["numeric"][numeric].reindex(frame.index).groupby(keys).sum().sort_values(ascending=False)
+            top = "; ".join(f"{_label(key, max_chars)} {_number(total)}" for key, total in sums.head(top_k).items())
+            lines.append(f"Soma de {numeric} por {column} (maiores): {top}")
+
+    return "\n".join(lines)
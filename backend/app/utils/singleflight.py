@@ -0,0 +1,41 @@
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Hashable
+from app.utils.logger import get_logger
+
+logger = get_logger("singleflight")
+
+class SingleFlight:
+    """Coalesces identical concurrent async calls into one in-flight computation.
+
+    The first caller for a key starts the work; callers arriving with the same
+    key while it runs await that same task and receive its result (or its
+    exception). The key is forgotten as soon as the task finishes, so this
+    never serves stale results - caching stays with the caches. The task is
+    shielded, so one waiter disconnecting doesn't cancel it for the others.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self._calls: Dict[Hashable, asyncio.Task] = {}
+        self.coalesced = 0
+
+    def __len__(self) -> int:
+        return len(self._calls)
+
+    async def do(self, key: Hashable, fn: Callable[..., Awaitable[Any]], *args) -> Any:
+        task = self._calls.get(key)
+        if task is not None:
+            self.coalesced += 1
+            logger.info("Joining in-flight %s call (%s in flight)", self.name, len(self._calls))
+        else:
+            task = asyncio.ensure_future(fn(*args))
+            self._calls[key] = task
+            task.add_done_callback(lambda t: self._forget(key, t))
+        return await asyncio.shield(task)
+
+    def _forget(self, key: Hashable, task: asyncio.Task):
+        if self._calls.get(key) is task:
+            del self._calls[key]
+        # Waiters that were cancelled never retrieve the exception themselves
+        if not task.cancelled():
+            task.exception()
@@ -0,0 +1,68 @@
+import json
+import re
+from typing import Any
+
+THINK_OPEN = "<think>"
+THINK_CLOSE = "</think>"
+
+def strip_think(text: str) -> str:
+    return re.sub(r'<think>.*?</think>', '', text, flags=re.DOTALL).strip()
+
+def _partial_suffix(text: str, tag: str) -> int:
+    """Length of the longest suffix of text that is a proper prefix of tag."""
+    for size in range(min(len(tag) - 1, len(text)), 0, -1):
+        if text.endswith(tag[:size]):
+            return size
+    return 0
+
+class ThinkStripper:
+    """Removes <think>...</think> blocks from a token stream as it arrives.
+
+    Text that might be the start of a tag is held back until the next chunk
+    disambiguates it, so tags split across chunks are still removed. Leading
+    whitespace of the answer is dropped, matching strip_think.
+    """
+
+    def __init__(self):
+        self._buffer = ""
+        self._inside = False
+        self._started = False
+
+    def _emit(self, text: str) -> str:
+        if not self._started:
+            text = text.lstrip()
+            self._started = bool(text)
+        return text
+
+    def feed(self, chunk: str) -> str:
+        self._buffer += chunk
+        output = []
+        while True:
+            if self._inside:
+                index = self._buffer.find(THINK_CLOSE)
+                if index == -1:
+                    keep = _partial_suffix(self._buffer, THINK_CLOSE)
+                    self._buffer = self._buffer[len(self._buffer) - keep:]
+                    break
+                self._buffer = self._buffer[index + len(THINK_CLOSE):]
+                self._inside = False
+            else:
+                index = self._buffer.find(THINK_OPEN)
+                if index == -1:
+                    keep = _partial_suffix(self._buffer, THINK_OPEN)
+                    output.append(self._buffer[:len(self._buffer) - keep])
+                    self._buffer = self._buffer[len(self._buffer) - keep:]
+                    break
+                output.append(self._buffer[:index])
+                self._buffer = self._buffer[index + len(THINK_OPEN):]
+                self._inside = True
+        return self._emit("".join(output))
+
+    def flush(self) -> str:
+        # An unterminated <think> block never reached the answer, so it is dropped
+        remaining = "" if self._inside else self._buffer
+        self._buffer = ""
+        return self._emit(remaining)
+
+def sse_event(event: str, data: Any) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False, default=str)}\n\n"
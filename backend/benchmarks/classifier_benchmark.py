@@ -0,0 +1,107 @@
+"""Accuracy and latency of the local message classifier.
+
+Runs stratified k-fold cross-validation over the labelled sample: each fold
+trains MessageClassifier on the remaining messages and classifies the held-out
+ones, recording whether the fast path decided, whether it was right and how
+long it took. With --llm the LLM classifier is measured on the same sample.
+
+Usage (from backend/):
+    python -m benchmarks.classifier_benchmark [--folds 5] [--threshold 0.85] [--llm]
+"""
+import argparse
+import asyncio
+import random
+import time
+import numpy as np
+from app.services.classifier import MessageClassifier, load_samples, DEFAULT_SAMPLES_PATH
+
+def stratified_folds(samples, folds, seed):
+    rng = random.Random(seed)
+    assignment = [[] for _ in range(folds)]
+    for label in sorted({s["label"] for s in samples}):
+        group = [s for s in samples if s["label"] == label]
+        rng.shuffle(group)
+        for i, sample in enumerate(group):
+            assignment[i % folds].append(sample)
+    return assignment
+
+def percentiles(values):
+    if not values:
+        return "n/a"
+    p50, p95, p99 = np.percentile(values, [50, 95, 99])
+    return f"p50 {p50:.1f}us  p95 {p95:.1f}us  p99 {p99:.1f}us"
+
+def run_local(samples, folds, threshold, seed):
+    split = stratified_folds(samples, folds, seed)
+    stats = {"rules": [0, 0], "model": [0, 0], "escalated": 0}
+    latencies, train_times = [], []
+
+    for i, held_out in enumerate(split):
+        training = [s for j, fold in enumerate(split) if j != i for s in fold]
+        start = time.perf_counter()
+        classifier = MessageClassifier.from_samples(training, threshold)
+        train_times.append(time.perf_counter() - start)
+
+        for sample in held_out:
+            start = time.perf_counter()
+            result = classifier.classify(sample["text"])
+            latencies.append((time.perf_counter() - start) * 1e6)
+            if result is None:
+                stats["escalated"] += 1
+                continue
+            stats[result["source"]][0] += 1
+            stats[result["source"]][1] += result["type"] == sample["label"]
+
+    total = len(samples)
+    decided = stats["rules"][0] + stats["model"][0]
+    correct = stats["rules"][1] + stats["model"][1]
+    print(f"Local classifier ({folds}-fold, threshold {threshold}, {total} messages)")
+    for source in ("rules", "model"):
+        count, right = stats[source]
+        accuracy = f"{right / count:.1%}" if count else "n/a"
+        print(f"  {source:<9} decided {count:>4} ({count / total:.1%})  accuracy {accuracy}")
+    print(f"  escalated {stats['escalated']:>4} ({stats['escalated'] / total:.1%})")
+    print(f"  fast-path accuracy {correct / max(decided, 1):.1%} on {decided / total:.1%} coverage")
+    print(f"  latency   {percentiles(latencies)}")
+    print(f"  training  {np.mean(train_times) * 1000:.1f}ms per fold")
+
+def run_llm(samples):
+    import os
+    from dotenv import load_dotenv
+    from app.services.conversation import ConversationService
+    from app.services.registry import ModelRegistry
+
+    async def classify_all():
+        registry = ModelRegistry(os.getenv("GROQ_API_KEY"))
+        service = ConversationService(registry)
+        latencies, correct = [], 0
+        for sample in samples:
+            start = time.perf_counter()
+            result = await service.aclassify_message(sample["text"])
+            latencies.append((time.perf_counter() - start) * 1e6)
+            correct += ("QUERY" if result["is_query"] else "CHAT") == sample["label"]
+        await registry.aclose()
+        return latencies, correct
+
+    load_dotenv()
+    latencies, correct = asyncio.run(classify_all())
+    print(f"LLM classifier ({len(samples)} messages)")
+    print(f"  accuracy  {correct / len(samples):.1%}")
+    print(f"  latency   {percentiles(latencies)}")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--samples", default=DEFAULT_SAMPLES_PATH)
+    parser.add_argument("--folds", type=int, default=5)
+    parser.add_argument("--threshold", type=float, default=0.85)
+    parser.add_argument("--seed", type=int, default=13)
+    parser.add_argument("--llm", action="store_true", help="also measure the LLM classifier (needs GROQ_API_KEY)")
+    args = parser.parse_args()
+
+    samples = load_samples(args.samples)
+    run_local(samples, args.folds, args.threshold, args.seed)
+    if args.llm:
+        run_llm(samples)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,155 @@
+"""Local stand-ins for the DataHub (CKAN) action API and the Groq chat API.
+
+One FastAPI app serves both, so the backend can be benchmarked offline:
+CKAN actions live under /api and answer from fixtures/datahub.json, the chat
+model lives under /openai/v1 and answers each pipeline prompt with a plausible
+reply. Latency is configurable through environment variables:
+
+    FAKE_CKAN_LATENCY       seconds added to every CKAN call (default 0.05)
+    FAKE_CKAN_SQL_LATENCY   seconds added to datastore_search_sql (default 0.15)
+    FAKE_LLM_LATENCY        time to first token, in seconds (default 0.2)
+    FAKE_LLM_TOKEN_RATE     generated tokens per second (default 250)
+
+Usage (from backend/):
+    uvicorn benchmarks.fakes:app --port 8765
+"""
+import asyncio
+import json
+import os
+import re
+import time
+import uuid
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+FIXTURES_PATH = os.path.join(os.path.dirname(__file__), "fixtures", "datahub.json")
+
+CKAN_LATENCY = float(os.environ.get("FAKE_CKAN_LATENCY", 0.05))
+CKAN_SQL_LATENCY = float(os.environ.get("FAKE_CKAN_SQL_LATENCY", 0.15))
+LLM_LATENCY = float(os.environ.get("FAKE_LLM_LATENCY", 0.2))
+LLM_TOKEN_RATE = float(os.environ.get("FAKE_LLM_TOKEN_RATE", 250))
+
+with open(FIXTURES_PATH, encoding="utf-8") as f:
+    FIXTURES = json.load(f)
+PACKAGES = {package["name"]: package for package in FIXTURES["packages"]}
+DATASTORE = FIXTURES["datastore"]
+
+app = FastAPI(title="Fake DataHub and chat model")
+
+def ckan_result(result, status_code=200):
+    return JSONResponse({"success": status_code == 200, "result": result}, status_code=status_code)
+
+@app.get("/api/package_list")
+async def package_list():
+    await asyncio.sleep(CKAN_LATENCY)
+    return ckan_result(list(PACKAGES))
+
+@app.get("/api/package_search")
+async def package_search(rows: int = 1000, start: int = 0):
+    await asyncio.sleep(CKAN_LATENCY)
+    packages = list(PACKAGES.values())
+    return ckan_result({"count": len(packages), "results": packages[start:start + rows]})
+
+@app.get("/api/package_show")
+async def package_show(id: str):
+    await asyncio.sleep(CKAN_LATENCY)
+    if id not in PACKAGES:
+        return ckan_result({"message": "Not found"}, 404)
+    return ckan_result(PACKAGES[id])
+
+@app.get("/api/datastore_search")
+async def datastore_search(resource_id: str, limit: int = 100, offset: int = 0):
+    await asyncio.sleep(CKAN_LATENCY)
+    table = DATASTORE.get(resource_id)
+    if table is None:
+        return ckan_result({"message": "Not found"}, 404)
+    records = table["records"][offset:offset + limit]
+    return ckan_result({"records": records, "fields": table["fields"], "total": len(table["records"])})
+
+@app.api_route("/api/datastore_search_sql", methods=["GET", "POST"])
+async def datastore_search_sql(request: Request):
+    sql = request.query_params.get("sql")
+    if sql is None:
+        sql = (await request.json()).get("sql", "")
+    await asyncio.sleep(CKAN_SQL_LATENCY)
+
+    # Only FROM, LIMIT and OFFSET are honoured; enough for realistic payload sizes
+    table = re.search(r'from\s+"([^"]+)"', sql, re.IGNORECASE)
+    table = DATASTORE.get(table.group(1)) if table else None
+    if table is None:
+        return ckan_result({"message": "Resource not found"}, 409)
+    limit = re.search(r"\blimit\s+(\d+)", sql, re.IGNORECASE)
+    offset = re.search(r"\boffset\s+(\d+)", sql, re.IGNORECASE)
+    start = int(offset.group(1)) if offset else 0
+    end = start + (int(limit.group(1)) if limit else 100)
+    return ckan_result({"records": table["records"][start:end], "fields": table["fields"], "sql": sql})
+
+def pick_dataset(question: str, candidates):
+    words = set(re.findall(r"\w+", question.lower()))
+    for name in candidates:
+        if any(part.rstrip("s") in word for part in name.split("-") if len(part) > 3 for word in words):
+            return name
+    return candidates[0] if candidates else next(iter(PACKAGES))
+
+def chat_reply(messages) -> str:
+    system = messages[0]["content"]
+    human = messages[-1]["content"]
+    question = re.search(r"Pergunta:\s*(.*)", human)
+    question = question.group(1) if question else human
+
+    if "Dataset recomendado" in system:
+        listed = re.search(r"Datasets disponíveis:\s*(.*)", human, re.DOTALL)
+        candidates = [name for name in PACKAGES if listed and name in listed.group(1)]
+        return f"<think>Comparando datasets.</think>\nDataset recomendado: {pick_dataset(question, candidates)}"
+    if "Resource index" in system:
+        return "Resource index: 0"
+    if "especialista em SQL" in system:
+        resource_id = re.search(r"Resource ID:\s*(\S+)", human).group(1)
+        fields = re.search(r"Campos disponíveis:\s*(\[.*?\])", human)
+        fields = [f for f in json.loads(fields.group(1)) if not f.startswith("_")][:3] if fields else []
+        columns = ", ".join(f'"{f}"' for f in fields) or "*"
+        limit = re.search(r"LIMIT (\d+)", system)
+        return f'SELECT {columns} FROM "{resource_id}" LIMIT {limit.group(1) if limit else 100}'
+    if "classificador" in system:
+        is_query = re.search(r"quant|quais|onde|lista|numero|número|total", human.lower())
+        return f"CLASSIFICAÇÃO: {'QUERY' if is_query else 'CHAT'}\nCONFIANÇA: 90"
+    if "resume conversas" in system:
+        return "O cidadão fez perguntas sobre serviços da cidade e recebeu respostas com dados oficiais."
+    return ("<think>Analisando os dados recebidos.</think>De acordo com os dados oficiais da Prefeitura do Recife, "
+            "foram encontrados registros relevantes para a sua pergunta, distribuídos por diversos bairros "
+            "da cidade, com destaque para Boa Viagem e Casa Forte.")
+
+def chunks(text: str):
+    # Roughly one token per four characters, like the prompt budget estimate
+    return [text[i:i + 4] for i in range(0, len(text), 4)]
+
+@app.post("/openai/v1/chat/completions")
+async def chat_completions(request: Request):
+    body = await request.json()
+    text = chat_reply(body["messages"])
+    model = body.get("model", "fake")
+    completion_id = f"chatcmpl-{uuid.uuid4().hex[:12]}"
+    usage = {"prompt_tokens": sum(len(m["content"]) for m in body["messages"]) // 4,
+             "completion_tokens": len(chunks(text)), "total_tokens": 0}
+    usage["total_tokens"] = usage["prompt_tokens"] + usage["completion_tokens"]
+
+    if body.get("stream"):
+        async def events():
+            await asyncio.sleep(LLM_LATENCY)
+            for piece in chunks(text):
+                await asyncio.sleep(1 / LLM_TOKEN_RATE)
+                chunk = {"id": completion_id, "object": "chat.completion.chunk", "created": int(time.time()),
+                         "model": model, "choices": [{"index": 0, "delta": {"content": piece}, "finish_reason": None}]}
+                yield f"data: {json.dumps(chunk)}\n\n"
+            final = {"id": completion_id, "object": "chat.completion.chunk", "created": int(time.time()), "model": model,
+                     "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}], "x_groq": {"usage": usage}}
+            yield f"data: {json.dumps(final)}\n\n"
+            yield "data: [DONE]\n\n"
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    await asyncio.sleep(LLM_LATENCY + usage["completion_tokens"] / LLM_TOKEN_RATE)
+    return {
+        "id": completion_id, "object": "chat.completion", "created": int(time.time()), "model": model,
+        "choices": [{"index": 0, "message": {"role": "assistant", "content": text}, "finish_reason": "stop"}],
+        "usage": usage
+    }
@@ -0,0 +1,174 @@
+"""Offline load test of the backend against local CKAN and chat model stand-ins.
+
+Boots benchmarks.fakes and app.main:app with uvicorn, drives /query and
+/message at fixed concurrency levels and reports latency percentiles and
+throughput per level. Results can be saved with --json and compared with a
+previous run through --compare.
+
+In "cold" mode every question is made unique so each request runs the whole
+pipeline; in "warm" mode a small set of questions repeats and the answer
+cache serves most requests.
+
+Usage (from backend/):
+    python -m benchmarks.load_test [--levels 1,4,16] [--requests 60] [--cache cold]
+        [--endpoints query,message] [--llm-token-rate 250] [--ckan-latency 0.05]
+        [--json results.json] [--compare previous.json] [--env KEY=VALUE ...]
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+import httpx
+import numpy as np
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+DATA_QUESTIONS = [
+    "Quantas academias da cidade existem em Boa Viagem?",
+    "Quais escolas municipais têm ensino integral?",
+    "Quantos acidentes de trânsito com vítimas aconteceram em 2023?",
+    "Quais unidades de saúde funcionam 24 horas?",
+    "Em quais dias funcionam as feiras livres?",
+    "Qual o número de matrículas nas escolas municipais em 2024?",
+]
+CHAT_MESSAGES = ["Olá, tudo bem?", "O que você pode fazer?", "Obrigado pela ajuda!"]
+
+def start_server(target, port, env, log_path):
+    log = open(log_path, "w")
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", target, "--port", str(port), "--log-level", "warning"],
+        cwd=BACKEND_DIR, env=env, stdout=log, stderr=subprocess.STDOUT
+    )
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"{target} exited early, see {log_path}")
+        try:
+            httpx.get(f"http://127.0.0.1:{port}/", timeout=1)
+            return process
+        except httpx.HTTPError:
+            time.sleep(0.2)
+    process.terminate()
+    raise RuntimeError(f"{target} did not start in time, see {log_path}")
+
+def request_bodies(endpoint, cache_mode):
+    if endpoint == "query":
+        questions = itertools.cycle(DATA_QUESTIONS)
+    else:
+        # Roughly one chat message for every three data questions
+        questions = itertools.cycle(DATA_QUESTIONS[:3] + CHAT_MESSAGES[:1] + DATA_QUESTIONS[3:] + CHAT_MESSAGES[1:])
+    while True:
+        text = next(questions)
+        if cache_mode == "cold":
+            # A random tag defeats both exact and near-duplicate answer cache matches
+            text = f"{text} (pedido {uuid.uuid4().hex[:8]})"
+        yield {"query": text} if endpoint == "query" else {"message": text}
+
+async def run_level(base_url, endpoint, concurrency, total, cache_mode):
+    bodies = request_bodies(endpoint, cache_mode)
+    latencies, errors = [], 0
+    remaining = itertools.count()
+
+    async def worker(client):
+        nonlocal errors
+        while next(remaining) < total:
+            start = time.perf_counter()
+            try:
+                response = await client.post(f"{base_url}/{endpoint}", json=next(bodies))
+                ok = response.status_code == 200
+            except httpx.HTTPError:
+                ok = False
+            latencies.append(time.perf_counter() - start)
+            errors += not ok
+
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(timeout=120, limits=limits) as client:
+        started = time.perf_counter()
+        await asyncio.gather(*(worker(client) for _ in range(concurrency)))
+        wall = time.perf_counter() - started
+
+    p50, p95, p99 = np.percentile(latencies, [50, 95, 99]) * 1000
+    return {
+        "endpoint": endpoint, "concurrency": concurrency, "requests": len(latencies), "errors": errors,
+        "rps": len(latencies) / wall, "p50_ms": p50, "p95_ms": p95, "p99_ms": p99
+    }
+
+def print_results(results, previous=None):
+    baseline = {(r["endpoint"], r["concurrency"]): r for r in previous or []}
+    print(f"{'endpoint':<9} {'conc':>4} {'reqs':>5} {'err':>4} {'req/s':>8} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}")
+    for r in results:
+        line = (f"{r['endpoint']:<9} {r['concurrency']:>4} {r['requests']:>5} {r['errors']:>4} {r['rps']:>8.1f} "
+                f"{r['p50_ms']:>9.1f} {r['p95_ms']:>9.1f} {r['p99_ms']:>9.1f}")
+        before = baseline.get((r["endpoint"], r["concurrency"]))
+        if before:
+            line += (f"   vs previous: req/s {r['rps'] / before['rps'] - 1:+.0%}, "
+                     f"p95 {r['p95_ms'] / before['p95_ms'] - 1:+.0%}, p99 {r['p99_ms'] / before['p99_ms'] - 1:+.0%}")
+        print(line)
+
+async def run(args, base_url):
+    results = []
+    for endpoint in args.endpoints.split(","):
+        # One untimed request per endpoint so the catalog and model clients are warm
+        await run_level(base_url, endpoint, 1, 1, args.cache)
+        for level in (int(x) for x in args.levels.split(",")):
+            results.append(await run_level(base_url, endpoint, level, args.requests, args.cache))
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--levels", default="1,4,16", help="comma-separated concurrency levels")
+    parser.add_argument("--requests", type=int, default=60, help="requests per endpoint and level")
+    parser.add_argument("--endpoints", default="query,message")
+    parser.add_argument("--cache", choices=["cold", "warm"], default="cold")
+    parser.add_argument("--ckan-latency", type=float, default=0.05)
+    parser.add_argument("--ckan-sql-latency", type=float, default=0.15)
+    parser.add_argument("--llm-latency", type=float, default=0.2, help="time to first token, in seconds")
+    parser.add_argument("--llm-token-rate", type=float, default=250, help="generated tokens per second")
+    parser.add_argument("--app-port", type=int, default=8790)
+    parser.add_argument("--fake-port", type=int, default=8791)
+    parser.add_argument("--env", action="append", default=[], help="extra KEY=VALUE settings for the app")
+    parser.add_argument("--json", help="write results to this file")
+    parser.add_argument("--compare", help="previous --json output to compare against")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="recife-bench-")
+    fake_env = dict(os.environ,
+                    FAKE_CKAN_LATENCY=str(args.ckan_latency), FAKE_CKAN_SQL_LATENCY=str(args.ckan_sql_latency),
+                    FAKE_LLM_LATENCY=str(args.llm_latency), FAKE_LLM_TOKEN_RATE=str(args.llm_token_rate))
+    fake_url = f"http://127.0.0.1:{args.fake_port}"
+    app_env = dict(os.environ,
+                   API_URL=f"{fake_url}/api", GROQ_API_KEY="benchmark",
+                   GROQ_API_BASE=fake_url, GROQ_BASE_URL=fake_url,
+                   SCHEMA_CACHE_PATH=os.path.join(workdir, "schema_cache.sqlite3"),
+                   CONVERSATION_STORE_PATH=os.path.join(workdir, "conversations.sqlite3"),
+                   MIRROR_PATH=os.path.join(workdir, "mirror"))
+    app_env.update(item.split("=", 1) for item in args.env)
+
+    processes = []
+    try:
+        processes.append(start_server("benchmarks.fakes:app", args.fake_port, fake_env, os.path.join(workdir, "fakes.log")))
+        processes.append(start_server("app.main:app", args.app_port, app_env, os.path.join(workdir, "app.log")))
+        print(f"Benchmarking with {args.cache} cache, logs in {workdir}")
+        results = asyncio.run(run(args, f"http://127.0.0.1:{args.app_port}"))
+    finally:
+        for process in processes:
+            process.terminate()
+            process.wait()
+
+    previous = None
+    if args.compare:
+        with open(args.compare) as f:
+            previous = json.load(f)["results"]
+    print_results(results, previous)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"settings": vars(args), "results": results}, f, indent=2)
+
+if __name__ == "__main__":
+    main()
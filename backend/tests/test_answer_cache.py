@@ -0,0 +1,42 @@
+from app.services.answer_cache import AnswerCache, question_signature
+
+def test_interrogatives_keep_questions_apart():
+    cache = AnswerCache(near_duplicates=True)
+    cache.put("Quantas academias existem?", "42 academias", "res-1")
+
+    assert cache.get("Quais academias existem?") is None
+    assert cache.get("Onde existem academias?") is None
+    assert cache.get("Quantas academias existem no Recife?") == "42 academias"
+
+def test_near_duplicates_match_articles_and_city_scope():
+    cache = AnswerCache(near_duplicates=True)
+    cache.put("Quantas academias existem em Recife?", "42 academias", "res-1")
+
+    assert cache.get("quantas academias existem") == "42 academias"
+    assert cache.get("Quantas academias existem na cidade do Recife?") == "42 academias"
+
+def test_word_order_keeps_questions_apart():
+    cache = AnswerCache(near_duplicates=True)
+    cache.put("Quais bairros têm mais hospitais que escolas?", "Boa Viagem", "res-1")
+    cache.put("Quantos ônibus vão do Recife para Olinda?", "12 linhas", "res-2")
+
+    assert cache.get("Quais bairros têm mais escolas que hospitais?") is None
+    assert cache.get("Quantos ônibus vão de Olinda para o Recife?") is None
+
+def test_near_duplicates_disabled_only_match_normalized_text():
+    cache = AnswerCache()
+    cache.put("Quantas academias existem?", "42 academias", "res-1")
+
+    assert cache.get("quantas   ACADEMIAS existem") == "42 academias"
+    assert cache.get("Quantas academias existem no Recife?") is None
+
+def test_signature_keeps_quantifiers():
+    assert question_signature("Quais bairros têm mais escolas?") != question_signature("Quais bairros têm escolas?")
+
+def test_outdated_resource_version_invalidates():
+    versions = {"res-1": "v1"}
+    cache = AnswerCache(version_lookup=versions.get)
+    cache.put("Quantas academias existem?", "42 academias", "res-1", "v1")
+    versions["res-1"] = "v2"
+
+    assert cache.get("Quantas academias existem?") is None
@@ -0,0 +1,138 @@
+import asyncio
+import time
+import httpx
+import pytest
+from app.services.ckan import CKANClient
+from app.utils.resilience import CLOSED, HALF_OPEN, OPEN, CircuitBreaker, CircuitOpenError
+
+def client_with(handler, **kwargs):
+    ckan = CKANClient("http://datahub.test/api", max_retries=0, **kwargs)
+
+    async def async_handler(request):
+        return await handler(request) if asyncio.iscoroutinefunction(handler) else handler(request)
+
+    ckan.async_client = httpx.AsyncClient(transport=httpx.MockTransport(async_handler))
+    return ckan
+
+def expire(breaker):
+    breaker.opened_at = time.monotonic() - breaker.reset_timeout
+
+def test_opens_after_consecutive_failures_and_fails_fast():
+    calls = []
+
+    def handler(request):
+        calls.append(request)
+        return httpx.Response(503)
+
+    async def main():
+        ckan = client_with(handler, breaker_failures=2)
+        await ckan.arequest("package_show")
+        await ckan.arequest("package_show")
+        with pytest.raises(CircuitOpenError):
+            await ckan.arequest("package_show")
+        return ckan
+
+    ckan = asyncio.run(main())
+    assert len(calls) == 2
+    assert ckan.breaker("package_show").state == OPEN
+    # Other actions keep their own breaker
+    assert ckan.breaker("package_list").state == CLOSED
+
+def test_client_errors_do_not_open_the_circuit():
+    async def main():
+        ckan = client_with(lambda request: httpx.Response(404), breaker_failures=1)
+        for _ in range(3):
+            assert (await ckan.arequest("package_show")).status_code == 404
+        return ckan
+
+    ckan = asyncio.run(main())
+    assert ckan.breaker("package_show").state == CLOSED
+
+def test_half_open_allows_a_single_probe():
+    breaker = CircuitBreaker("test", failure_threshold=1, reset_timeout=30)
+    breaker.record_failure()
+    expire(breaker)
+
+    breaker.before_call()
+    assert breaker.state == HALF_OPEN
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+
+    breaker.record_success()
+    assert breaker.state == CLOSED
+    breaker.before_call()
+
+def test_failed_probe_reopens():
+    breaker = CircuitBreaker("test", failure_threshold=3, reset_timeout=30)
+    for _ in range(3):
+        breaker.record_failure()
+    expire(breaker)
+
+    breaker.before_call()
+    breaker.record_failure()
+
+    assert breaker.state == OPEN
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+
+def test_cancelled_probe_releases_the_breaker():
+    async def slow(request):
+        await asyncio.sleep(10)
+        return httpx.Response(200, json={"result": []})
+
+    async def main():
+        ckan = client_with(slow, breaker_failures=1)
+        breaker = ckan.breaker("package_list")
+        breaker.record_failure()
+        expire(breaker)
+
+        probe = asyncio.create_task(ckan.arequest("package_list"))
+        await asyncio.sleep(0.01)
+        probe.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await probe
+
+        # The next caller gets to probe instead of failing fast forever
+        breaker.before_call()
+        return breaker.state
+
+    assert asyncio.run(main()) == HALF_OPEN
+
+def test_unexpected_error_in_probe_counts_as_failure():
+    def broken(request):
+        raise ValueError("bad response")
+
+    ckan = client_with(broken, breaker_failures=1)
+    breaker = ckan.breaker("package_show")
+    breaker.record_failure()
+    expire(breaker)
+
+    with pytest.raises(ValueError):
+        asyncio.run(ckan.arequest("package_show"))
+
+    assert breaker.state == OPEN
+    expire(breaker)
+    breaker.before_call()
+    assert breaker.state == HALF_OPEN
+
+def test_hedged_read_answers_from_the_faster_attempt():
+    attempts = []
+
+    async def handler(request):
+        attempts.append(request)
+        # The first attempt of the last call hangs; its hedge answers right away
+        if len(attempts) == 21:
+            await asyncio.sleep(10)
+        return httpx.Response(200, json={"result": len(attempts)})
+
+    async def main():
+        ckan = client_with(handler, hedge_enabled=True, hedge_max_ratio=1.0)
+        for _ in range(20):
+            await ckan.arequest("package_show")
+        start = time.perf_counter()
+        response = await ckan.arequest("package_show")
+        return response, time.perf_counter() - start
+
+    response, elapsed = asyncio.run(main())
+    assert response.json() == {"result": 22}
+    assert elapsed < 1
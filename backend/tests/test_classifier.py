@@ -0,0 +1,20 @@
+import pytest
+from app.services.classifier import MessageClassifier
+
+@pytest.fixture(scope="module")
+def classifier():
+    return MessageClassifier.load()
+
+@pytest.mark.parametrize("message", ["quantas escolas existem no Recife?", "Qual o número de leitos dos hospitais?"])
+def test_data_questions_match_query_rules(classifier, message):
+    assert classifier.rule_match(message) == "QUERY"
+
+@pytest.mark.parametrize("message", ["oi, tudo bem?", "muito obrigado pela ajuda"])
+def test_greetings_match_chat_rules(classifier, message):
+    assert classifier.rule_match(message) == "CHAT"
+
+@pytest.mark.parametrize("message", ["quantos anos você tem?", "quantas línguas você fala?", "quantos irmãos você tem?"])
+def test_small_talk_with_quantos_is_never_a_rule_query(classifier, message):
+    assert classifier.rule_match(message) is None
+    result = classifier.classify(message)
+    assert result is None or not result["is_query"]
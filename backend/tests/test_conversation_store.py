@@ -0,0 +1,45 @@
+import asyncio
+import pytest
+from app.services.conversation_store import ConversationMemory, MemoryConversationStore, SQLiteConversationStore
+
+@pytest.fixture(params=["memory", "sqlite"])
+def store(request, tmp_path):
+    if request.param == "memory":
+        yield MemoryConversationStore(max_turns=8)
+        return
+    store = SQLiteConversationStore(str(tmp_path / "conversations.sqlite3"), max_turns=8)
+    yield store
+    store.close()
+
+def test_summary_only_drops_the_turns_it_covers(store):
+    async def main():
+        release = asyncio.Event()
+        summarized = []
+
+        async def summarizer(summary, entries):
+            summarized.extend(entries)
+            await release.wait()
+            return "resumo"
+
+        memory = ConversationMemory(store, token_budget=10, summarize_after=2, summarizer=summarizer)
+        for i in range(3):
+            memory.record("c1", f"pergunta {i} " * 5, f"resposta {i} " * 5)
+
+        memory.context("c1")
+        await asyncio.sleep(0)
+        # Turns arriving while the summarizer runs shift the stored window
+        for i in range(3, 6):
+            memory.record("c1", f"pergunta {i} " * 5, f"resposta {i} " * 5)
+        release.set()
+        await asyncio.gather(*memory._tasks)
+        return summarized
+
+    summarized = asyncio.run(main())
+    summary, turns = store.load("c1")
+
+    assert summary == "resumo"
+    assert summarized
+    assert not any(entry in turns for entry in summarized)
+    assert turns[-1] == {"assistant": "resposta 5 " * 5}
+    # Everything after the last summarized turn is still there
+    assert {"user": "pergunta 3 " * 5} in turns
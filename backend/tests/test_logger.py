@@ -0,0 +1,61 @@
+import contextvars
+import json
+import logging
+import queue
+from app.utils.logger import JSONFormatter, RequestFilter, _RenderingQueueHandler, start_request
+
+def captured_logger(name):
+    records = queue.SimpleQueue()
+    logger = logging.getLogger(name)
+    logger.handlers = []
+    logger.propagate = False
+    handler = _RenderingQueueHandler(records)
+    handler.addFilter(RequestFilter())
+    logger.addHandler(handler)
+    logger.setLevel(logging.DEBUG)
+    return logger, records
+
+def test_args_are_rendered_when_logged():
+    logger, records = captured_logger("test.render")
+    fields = ["nome"]
+
+    logger.info("Available fields: %s", fields)
+    fields.append("bairro")
+
+    record = records.get_nowait()
+    assert record.getMessage() == "Available fields: ['nome']"
+    assert record.args is None
+
+def test_json_output_keeps_exception_and_extra_fields():
+    logger, records = captured_logger("test.json")
+    try:
+        raise ValueError("boom")
+    except ValueError:
+        logger.exception("Failed for %s", "res-1", extra={"stage": "sql"})
+
+    entry = json.loads(JSONFormatter().format(records.get_nowait()))
+    assert entry["message"] == "Failed for res-1"
+    assert entry["stage"] == "sql"
+    assert "ValueError: boom" in entry["exception"]
+
+def test_unsampled_requests_keep_only_warnings():
+    logger, records = captured_logger("test.sampling")
+
+    def handle_request():
+        start_request("req-1", sample_rate=0)
+        logger.info("step")
+        logger.warning("slow")
+
+    contextvars.copy_context().run(handle_request)
+
+    record = records.get_nowait()
+    assert record.getMessage() == "slow"
+    assert record.request_id == "req-1"
+    assert records.empty()
+
+def test_lines_outside_requests_are_kept():
+    logger, records = captured_logger("test.outside")
+
+    logger.info("startup")
+
+    assert records.get_nowait().request_id is None
@@ -0,0 +1,41 @@
+import asyncio
+import httpx
+from app.services.ckan import CKANClient
+from app.services.mirror import ResourceMirror
+
+FIELDS = [{"id": "_id", "type": "int"}, {"id": "nome", "type": "text"}, {"id": "inaugurado", "type": "timestamp"}]
+RECORDS = [
+    {"_id": 1, "nome": "Academia A", "inaugurado": "2020-01-02T00:00:00"},
+    {"_id": 2, "nome": "Academia B", "inaugurado": "2021-05-06T12:30:00"},
+]
+
+def datastore(request):
+    return httpx.Response(200, json={"result": {"total": len(RECORDS), "fields": FIELDS, "records": RECORDS}})
+
+def mirror_with(tmp_path, version="v1"):
+    ckan = CKANClient("http://datahub.test/api", max_retries=0)
+    ckan.async_client = httpx.AsyncClient(transport=httpx.MockTransport(datastore))
+    mirror = ResourceMirror(ckan, str(tmp_path))
+    asyncio.run(mirror.sync([{"resources": [{"id": "res-1", "datastore_active": True, "last_modified": version}]}]))
+    return mirror
+
+def test_execute_returns_iso_dates(tmp_path):
+    mirror = mirror_with(tmp_path)
+
+    records = mirror.execute('SELECT "nome", "inaugurado" FROM "res-1" ORDER BY "_id"', "v1")
+
+    assert records == [
+        {"nome": "Academia A", "inaugurado": "2020-01-02T00:00:00"},
+        {"nome": "Academia B", "inaugurado": "2021-05-06T12:30:00"},
+    ]
+
+def test_outdated_mirror_is_not_used(tmp_path):
+    mirror = mirror_with(tmp_path, version="v1")
+
+    assert mirror.execute('SELECT COUNT(*) AS total FROM "res-1"', "v2") is None
+    assert mirror.execute('SELECT COUNT(*) AS total FROM "res-1"') == [{"total": 2}]
+
+def test_unknown_resource_falls_back(tmp_path):
+    mirror = mirror_with(tmp_path)
+
+    assert mirror.execute('SELECT * FROM "res-2"') is None
@@ -0,0 +1,35 @@
+from app.utils.prompt_encoding import EncodingStats, encode_rows, estimate_tokens
+
+def test_header_is_written_once_and_internals_dropped():
+    rows = [{"_id": 1, "bairro": "Boa Viagem", "total": 3}, {"_id": 2, "bairro": "Casa Forte", "total": 5}]
+
+    assert encode_rows(rows) == "bairro | total\nBoa Viagem | 3\nCasa Forte | 5"
+
+def test_constant_and_empty_columns_are_hoisted_or_dropped():
+    rows = [
+        {"ano": 2023, "bairro": "Boa Viagem", "obs": None},
+        {"ano": 2023, "bairro": "Casa Forte", "obs": ""},
+    ]
+
+    assert encode_rows(rows) == "Valores comuns a todas as linhas: ano=2023\nbairro\nBoa Viagem\nCasa Forte"
+
+def test_cells_are_collapsed_and_truncated():
+    rows = [{"nome": "Rua  da\nAurora | 1", "valor": 10.0}]
+
+    assert encode_rows(rows, max_chars=10) == "nome | valor\nRua da Au… | 10"
+
+def test_empty_result():
+    assert encode_rows([]) == "(sem linhas)"
+
+def test_stats_accumulate_per_stage():
+    stats = EncodingStats()
+    stats.record("answer", "x" * 400, "x" * 100)
+    stats.record_tokens("answer", 50, 20)
+
+    assert stats.snapshot() == {
+        "answer": {"calls": 2, "tokens_before": 151, "tokens_after": 46, "tokens_saved": 105}
+    }
+
+def test_estimate_tokens_handles_empty_text():
+    assert estimate_tokens("") == 1
+    assert estimate_tokens("x" * 40) == 11
@@ -0,0 +1,118 @@
+import asyncio
+import re
+import httpx
+import pytest
+from app.services.ckan import CKANClient
+from app.services.query import QueryService, ResultTruncatedError
+from app.utils.result_summary import aframe_from_batches, summarize_frame
+
+ROWS = [{"_id": i, "bairro": f"B{i % 3}", "valor": i} for i in range(1, 13)]
+PAGE = re.compile(r"LIMIT (\d+) OFFSET (\d+)$")
+
+def datastore(fail_at_offset=None):
+    requests = []
+
+    def handler(request):
+        sql = request.url.params["sql"]
+        requests.append(sql)
+        limit, offset = map(int, PAGE.search(sql).groups())
+        if offset == fail_at_offset:
+            return httpx.Response(500, json={"success": False})
+        return httpx.Response(200, json={"result": {"records": ROWS[offset:offset + limit]}})
+
+    return handler, requests
+
+def query_service(handler, default_limit=100):
+    ckan = CKANClient("http://datahub.test/api", max_retries=0, breaker_failures=100)
+    ckan.async_client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    return QueryService(ckan, page_size=5, default_limit=default_limit)
+
+def collect(batches):
+    async def gather():
+        return [batch async for batch in batches]
+    return asyncio.run(gather())
+
+def test_pages_until_short_page():
+    handler, requests = datastore()
+    service = query_service(handler)
+
+    batches = collect(service.aiter_sql_batches('SELECT * FROM "res-1" LIMIT 100'))
+
+    assert [len(batch) for batch in batches] == [5, 5, 2]
+    assert requests[0] == 'SELECT * FROM "res-1" ORDER BY "_id" LIMIT 5 OFFSET 0'
+    assert requests[-1].endswith("LIMIT 5 OFFSET 10")
+
+def test_query_limit_and_max_rows_bound_the_fetch():
+    handler, _ = datastore()
+    service = query_service(handler)
+
+    assert sum(map(len, collect(service.aiter_sql_batches('SELECT * FROM "res-1" LIMIT 7')))) == 7
+    assert sum(map(len, collect(service.aiter_sql_batches('SELECT * FROM "res-1" LIMIT 100', max_rows=6)))) == 6
+
+def test_full_result_ignores_the_default_limit():
+    handler, _ = datastore()
+    service = query_service(handler, default_limit=3)
+
+    batches = collect(service.aiter_sql_batches('SELECT * FROM "res-1" LIMIT 3', full_result=True))
+
+    assert sum(map(len, batches)) == len(ROWS)
+
+def test_user_limit_is_never_expanded():
+    handler, requests = datastore()
+    service = query_service(handler, default_limit=3)
+    sql = 'SELECT "bairro", "valor" FROM "res-1" ORDER BY "valor" DESC LIMIT 10'
+
+    batches = collect(service.aiter_sql_batches(sql, full_result=True))
+
+    assert not service.has_more_rows(sql, ROWS[:10])
+    assert sum(map(len, batches)) == 10
+    assert requests[0] == f"SELECT * FROM ({sql} OFFSET 0) AS paged ORDER BY paged LIMIT 5 OFFSET 0"
+
+def test_grouped_queries_are_paged_in_a_stable_order():
+    handler, requests = datastore()
+    service = query_service(handler, default_limit=3)
+    sql = 'SELECT "bairro", SUM("valor") AS total FROM "res-1" GROUP BY "bairro" LIMIT 3'
+
+    collect(service.aiter_sql_batches(sql, full_result=True))
+
+    base = 'SELECT "bairro", SUM("valor") AS total FROM "res-1" GROUP BY "bairro"'
+    assert requests[0] == f"SELECT * FROM ({base}) AS paged ORDER BY paged LIMIT 5 OFFSET 0"
+
+def test_failed_page_raises_instead_of_truncating():
+    handler, _ = datastore(fail_at_offset=5)
+    service = query_service(handler)
+    received = []
+
+    async def consume():
+        async for batch in service.aiter_sql_batches('SELECT * FROM "res-1"'):
+            received.append(batch)
+
+    with pytest.raises(ResultTruncatedError):
+        asyncio.run(consume())
+    assert [len(batch) for batch in received] == [5]
+
+def test_failed_page_raises_from_the_summary_path():
+    handler, _ = datastore(fail_at_offset=10)
+    service = query_service(handler)
+
+    with pytest.raises(ResultTruncatedError):
+        asyncio.run(aframe_from_batches(service.aiter_sql_batches('SELECT * FROM "res-1"')))
+
+def test_has_more_rows_only_when_the_default_limit_is_filled():
+    service = query_service(datastore()[0], default_limit=2)
+
+    assert service.has_more_rows('SELECT * FROM "res-1" LIMIT 2', ROWS[:2])
+    assert not service.has_more_rows('SELECT * FROM "res-1" LIMIT 2', ROWS[:1])
+    assert not service.has_more_rows('SELECT * FROM "res-1" LIMIT 2 OFFSET 4', ROWS[:2])
+    assert not service.has_more_rows('SELECT * FROM "res-1" LIMIT 20', ROWS)
+    assert not service.has_more_rows('SELECT COUNT(*) FROM "res-1"', ROWS[:1])
+
+def test_summary_over_all_batches():
+    handler, _ = datastore()
+    service = query_service(handler)
+
+    frame = asyncio.run(aframe_from_batches(service.aiter_sql_batches('SELECT * FROM "res-1"')))
+    summary = summarize_frame(frame)
+
+    assert summary.startswith("Total de linhas: 12")
+    assert "soma 78" in summary
@@ -0,0 +1,38 @@
+import asyncio
+from app.utils.result_summary import aframe_from_batches, summarize_frame, summarize_rows
+
+ROWS = [
+    {"_id": 1, "bairro": "Boa Viagem", "valor": "10", "data": "2023-01-05"},
+    {"_id": 2, "bairro": "Boa Viagem", "valor": "20", "data": "2023-03-01"},
+    {"_id": 3, "bairro": "Casa Forte", "valor": "5.5", "data": "2024-02-10"},
+]
+
+def test_summary_covers_numbers_dates_and_groups():
+    summary = summarize_rows(ROWS).splitlines()
+
+    assert summary[0] == "Total de linhas: 3"
+    assert "valor (número, 3 valores): mín 5,50, máx 20, média 11,83, mediana 10, soma 35,50" in summary
+    assert "data (data): de 2023-01-05 a 2024-02-10" in summary
+    assert "bairro (texto, 2 valores distintos): mais frequentes: Boa Viagem (2); Casa Forte (1)" in summary
+    assert "Soma de valor por bairro (maiores): Boa Viagem 30; Casa Forte 5,50" in summary
+    assert not any(line.startswith("_id") for line in summary)
+
+def test_unique_text_columns_show_examples():
+    rows = [{"nome": "Ana"}, {"nome": "Bruno"}, {"nome": "Carla"}]
+
+    assert summarize_rows(rows, top_k=2) == "Total de linhas: 3\nnome (texto, 3 valores, todos distintos): exemplos: Ana; Bruno"
+
+def test_empty_result():
+    assert summarize_rows([]) == "(sem linhas)"
+
+def test_batches_build_one_frame():
+    batches = [ROWS[:2], [], ROWS[2:]]
+
+    async def agen():
+        for batch in batches:
+            yield batch
+
+    frame = asyncio.run(aframe_from_batches(agen()))
+
+    assert len(frame) == 3
+    assert summarize_frame(frame) == summarize_rows(ROWS)
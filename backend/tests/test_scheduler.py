@@ -0,0 +1,84 @@
+import asyncio
+import json
+import time
+import httpx
+from app.services.registry import ModelRegistry
+from app.services.scheduler import (
+    LANE_HEADER, AsyncScheduledTransport, LLMScheduler, ModelLimiter, TokenBucket, parse_retry_after
+)
+
+def completion_request(model="llama3-8b-8192", lane=None):
+    headers = {LANE_HEADER: lane} if lane else {}
+    body = {"model": model, "messages": [{"role": "user", "content": "x" * 400}], "max_tokens": 100}
+    return httpx.Request("POST", "http://llm.test/chat/completions", headers=headers, content=json.dumps(body))
+
+def test_token_bucket_waits_for_refill():
+    bucket = TokenBucket(60)
+    now = time.monotonic()
+    bucket.take(60, now)
+
+    assert bucket.wait_time(1, now) == 1.0
+    assert bucket.wait_time(1, now + 1) == 0.0
+
+def test_token_bucket_caps_oversized_requests_at_a_full_bucket():
+    bucket = TokenBucket(60)
+    now = time.monotonic()
+    bucket.take(60, now)
+
+    assert bucket.wait_time(1000, now) == 60.0
+
+def test_disabled_bucket_never_waits():
+    bucket = TokenBucket(0)
+    bucket.take(10, time.monotonic())
+
+    assert bucket.wait_time(10, time.monotonic()) == 0.0
+
+def test_parse_retry_after_prefers_the_header():
+    assert parse_retry_after(httpx.Headers({"retry-after": "7"}), 1.0) == 7.0
+
+def test_parse_retry_after_reads_groq_resets():
+    headers = httpx.Headers({"x-ratelimit-reset-requests": "2m59.5s", "x-ratelimit-reset-tokens": "120ms"})
+
+    assert parse_retry_after(headers, 1.0) == 179.5
+
+def test_parse_retry_after_falls_back_to_default():
+    assert parse_retry_after(httpx.Headers({}), 4.0) == 4.0
+
+def test_waiters_are_admitted_in_lane_order():
+    limiter = ModelLimiter("m", rpm=600)
+    limiter.requests.take(600, time.monotonic())
+    admitted = []
+
+    async def wait(lane):
+        await limiter.acquire(1, lane)
+        admitted.append(lane)
+
+    async def run():
+        tasks = []
+        for lane in ("background", "query", "chat"):
+            tasks.append(asyncio.create_task(wait(lane)))
+            await asyncio.sleep(0)
+        await asyncio.gather(*tasks)
+
+    asyncio.run(run())
+    assert admitted == ["chat", "query", "background"]
+
+def test_rate_limited_request_is_retried_without_the_lane_header():
+    seen = []
+
+    def handler(request):
+        seen.append(request)
+        if len(seen) == 1:
+            return httpx.Response(429, headers={"retry-after": "0"})
+        return httpx.Response(200, json={"choices": []})
+
+    transport = AsyncScheduledTransport(httpx.MockTransport(handler), LLMScheduler(max_retries=1))
+    response = asyncio.run(transport.handle_async_request(completion_request(lane="chat")))
+
+    assert response.status_code == 200
+    assert len(seen) == 2
+    assert LANE_HEADER not in seen[-1].headers
+
+def test_scheduled_models_leave_retries_to_the_scheduler():
+    assert ModelRegistry("key", scheduler=LLMScheduler()).model("llama3-8b-8192", 0).max_retries == 0
+    assert ModelRegistry("key").model("llama3-8b-8192", 0).max_retries == 2
@@ -0,0 +1,94 @@
+import asyncio
+from app.services.speculation import StagePrefetcher
+from app.utils.singleflight import SingleFlight
+
+def test_concurrent_calls_share_one_computation():
+    calls = []
+
+    async def compute(value):
+        calls.append(value)
+        await asyncio.sleep(0.01)
+        return value * 2
+
+    async def main():
+        flights = SingleFlight("test")
+        results = await asyncio.gather(*(flights.do("k", compute, 21) for _ in range(5)))
+        return results, flights
+
+    results, flights = asyncio.run(main())
+    assert results == [42] * 5
+    assert calls == [21]
+    assert flights.coalesced == 4
+    assert len(flights) == 0
+
+def test_leader_cancellation_does_not_cancel_followers():
+    async def main():
+        flights = SingleFlight("test")
+        release = asyncio.Event()
+
+        async def compute():
+            await release.wait()
+            return "done"
+
+        leader = asyncio.create_task(flights.do("k", compute))
+        await asyncio.sleep(0)
+        follower = asyncio.create_task(flights.do("k", compute))
+        await asyncio.sleep(0)
+        leader.cancel()
+        await asyncio.sleep(0)
+        release.set()
+        return await follower, leader.cancelled()
+
+    assert asyncio.run(main()) == ("done", True)
+
+def test_cancelled_prefetch_is_recomputed():
+    async def main():
+        prefetch = StagePrefetcher("req", enabled=True)
+        started = asyncio.Event()
+
+        async def slow():
+            started.set()
+            await asyncio.sleep(10)
+            return "speculative"
+
+        async def fresh():
+            return "fresh"
+
+        prefetch.start("metadata:res-1", slow)
+        await started.wait()
+        waiter = asyncio.create_task(prefetch.get("metadata:res-1", fresh))
+        await asyncio.sleep(0)
+        # The request that owns the prefetcher goes away while a coalesced flight is waiting
+        prefetch.cancel()
+        return await waiter
+
+    assert asyncio.run(main()) == "fresh"
+
+def test_leader_disconnect_with_shared_prefetcher():
+    async def main():
+        flights = SingleFlight("question")
+        prefetch = StagePrefetcher("leader", enabled=True)
+
+        async def metadata():
+            await asyncio.sleep(0.05)
+            return {"fields": ["nome"]}
+
+        async def pipeline(prefetch):
+            prefetch.start("metadata", metadata)
+            await asyncio.sleep(0.01)
+            return await prefetch.get("metadata", metadata)
+
+        async def leader_request():
+            try:
+                return await flights.do("q", pipeline, prefetch)
+            finally:
+                prefetch.cancel()
+
+        leader = asyncio.create_task(leader_request())
+        await asyncio.sleep(0)
+        follower = asyncio.create_task(flights.do("q", pipeline, prefetch))
+        await asyncio.sleep(0.02)
+        leader.cancel()
+        return await follower
+
+    assert asyncio.run(main()) == {"fields": ["nome"]}
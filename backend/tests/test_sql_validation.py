@@ -0,0 +1,69 @@
+from app.services.sql_validation import SQLValidator
+
+RESOURCE = "b1a7c3e2-0001"
+FIELDS = [
+    {"id": "_id", "type": "int"},
+    {"id": "Nome", "type": "text"},
+    {"id": "bairro", "type": "text"},
+    {"id": "quantidade", "type": "numeric"},
+    {"id": "data_inicio", "type": "timestamp"},
+]
+
+def validate(sql, **kwargs):
+    return SQLValidator(**kwargs).validate(sql, RESOURCE, FIELDS)
+
+def test_missing_limit_gets_default_not_ceiling():
+    fixed, error = validate(f'SELECT "bairro" FROM "{RESOURCE}"', max_limit=1000, default_limit=100)
+
+    assert error is None
+    assert fixed.endswith("LIMIT 100")
+
+def test_explicit_limit_is_capped():
+    fixed, error = validate(f'SELECT "bairro" FROM "{RESOURCE}" LIMIT 5000 OFFSET 10', max_limit=1000)
+
+    assert error is None
+    assert fixed.endswith("LIMIT 1000 OFFSET 10")
+
+def test_small_explicit_limit_is_kept():
+    fixed, _ = validate(f'SELECT "bairro" FROM "{RESOURCE}" LIMIT 5')
+
+    assert fixed.endswith("LIMIT 5")
+
+def test_fixes_case_fences_and_string_literals():
+    sql = f'```sql\nSELECT nome FROM "{RESOURCE}" WHERE "bairro" = "Boa Viagem"; DROP TABLE x\n```'
+
+    fixed, error = validate(sql)
+
+    assert error is None
+    assert fixed == f'SELECT "Nome" FROM "{RESOURCE}" WHERE "bairro" = \'Boa Viagem\' LIMIT 100'
+
+def test_near_miss_column_is_corrected():
+    fixed, error = validate(f'SELECT "quantidades" FROM "{RESOURCE}"')
+
+    assert error is None
+    assert '"quantidade"' in fixed
+
+def test_unknown_column_is_reported():
+    _, error = validate(f'SELECT "populacao_total" FROM "{RESOURCE}"')
+
+    assert error is not None and "populacao_total" in error
+
+def test_extract_from_field_is_not_a_table():
+    _, error = validate(f'SELECT EXTRACT(YEAR FROM "data_inicio") AS ano, COUNT(*) FROM "{RESOURCE}" GROUP BY ano')
+
+    assert error is None
+
+def test_other_tables_are_rejected():
+    _, error = validate(f'SELECT * FROM "{RESOURCE}" JOIN "outro-recurso" ON true')
+
+    assert error is not None
+
+def test_syntax_errors_are_caught_locally():
+    _, error = validate(f'SELECT "bairro" FROM "{RESOURCE}" WHERE GROUP BY "bairro"')
+
+    assert error is not None
+
+def test_file_access_is_not_possible():
+    _, error = validate(f"SELECT * FROM read_csv('/etc/passwd'), \"{RESOURCE}\"")
+
+    assert error is not None
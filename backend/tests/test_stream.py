@@ -0,0 +1,26 @@
+import pytest
+from app.utils.stream import ThinkStripper, sse_event, strip_think
+
+def stream(chunks):
+    stripper = ThinkStripper()
+    return "".join(stripper.feed(chunk) for chunk in chunks) + stripper.flush()
+
+def test_strip_think():
+    assert strip_think("<think>plan\nsteps</think>\n\nResposta") == "Resposta"
+
+@pytest.mark.parametrize("chunks", [
+    ["<think>plan</think>\n\nResposta final"],
+    ["<thi", "nk>plan</th", "ink>", "\n", "Resposta", " final"],
+    ["<", "t", "h", "i", "n", "k", ">", "x", "<", "/", "think>", " Resposta final"],
+])
+def test_tags_split_across_chunks_are_removed(chunks):
+    assert stream(chunks) == "Resposta final"
+
+def test_text_resembling_a_tag_is_kept():
+    assert stream(["a < b e <th", "ese>"]) == "a < b e <these>"
+
+def test_unterminated_block_is_dropped():
+    assert stream(["Olá <think>sem fim"]) == "Olá "
+
+def test_sse_event_keeps_unicode():
+    assert sse_event("token", "ção") == 'event: token\ndata: "ção"\n\n'
@@ -0,0 +1,53 @@
+import asyncio
+from app.services.warmup import WarmUp
+
+class Catalog:
+    def __init__(self, results):
+        self.results = list(results)
+        self.calls = 0
+
+    async def refresh(self):
+        self.calls += 1
+        return self.results.pop(0) if self.results else True
+
+    def resource_version(self, resource_id):
+        return None
+
+class Schemas:
+    def hot_resources(self, limit):
+        return []
+
+def warm_up_with(catalog, timeout=1.0):
+    return WarmUp(catalog, database_service=None, schema_cache=Schemas(), timeout=timeout, retry_interval=0.01)
+
+def test_ready_once_every_step_succeeds():
+    warm_up = warm_up_with(Catalog([True]))
+
+    asyncio.run(warm_up.run())
+
+    assert warm_up.ready
+    assert warm_up.steps == {"models": "ok", "catalog": "ok", "schemas": "ok"}
+
+def test_failed_step_is_retried_before_ready():
+    catalog = Catalog([False, False, True])
+    warm_up = warm_up_with(catalog)
+
+    asyncio.run(warm_up.run())
+
+    assert warm_up.ready
+    assert catalog.calls == 3
+    assert warm_up.steps["catalog"] == "ok"
+
+def test_fast_failure_waits_for_the_timeout():
+    warm_up = warm_up_with(Catalog([False] * 1000), timeout=0.2)
+
+    async def main():
+        task = asyncio.create_task(warm_up.run())
+        await asyncio.sleep(0.05)
+        ready_early = warm_up.ready
+        await task
+        return ready_early
+
+    assert not asyncio.run(main())
+    assert warm_up.ready
+    assert warm_up.steps["catalog"] == "failed"